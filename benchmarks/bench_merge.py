@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Compare the in-memory and streaming tag merges on synthetic sources.
+
+Usage:
+  python -m benchmarks.bench_merge --images 200000 --chunk-rows 50000
+
+- Writes four synthetic tags_raw-style JSONL sources (benchmarks/synth.py) into a temp dir.
+- Quick A/B of the two engines; `python -m benchmarks.suite` covers every stage.
+- Runs each engine twice: once untraced for wall time, once under tracemalloc for
+  peak Python heap; checks that both produce the same tags for every image.
+"""
+
+from __future__ import annotations
+from pathlib import Path
+import argparse, tempfile, time, tracemalloc
+from benchmarks.synth import write_tag_sources
+from scripts.utils.tag_merge import merge_in_memory, merge_streaming
+
+def consume(rows) -> int:
+    """Drain a merge without keeping it; return an order-independent digest."""
+    digest = 0
+    for img, tags in rows:
+        digest = (digest + hash((img, tuple(tuple(t) for t in tags)))) & 0xFFFFFFFFFFFFFFFF
+    return digest
+
+def measure(fn):
+    """Return (digest, wall seconds, peak traced bytes) for a merge factory."""
+    t0 = time.perf_counter()
+    digest = consume(fn())
+    wall = time.perf_counter() - t0
+    tracemalloc.start()
+    consume(fn())
+    _cur, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return digest, wall, peak
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--images", type=int, default=100_000)
+    ap.add_argument("--vocab", type=int, default=5_000)
+    ap.add_argument("--chunk-rows", type=int, default=50_000)
+    ap.add_argument("--min-conf", type=float, default=0.35)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_merge_") as td:
+        sources = write_tag_sources(Path(td), args.images, args.vocab)
+        size_mb = sum(s.stat().st_size for s in sources) / 1e6
+        print(f"[bench] {len(sources)} sources, {args.images} images, {size_mb:.1f} MB")
+
+        mem, t_mem, peak_mem = measure(lambda: merge_in_memory(sources, args.min_conf))
+        stream, t_str, peak_str = measure(lambda: merge_streaming(
+            sources, args.min_conf, chunk_rows=args.chunk_rows, tmp_dir=Path(td)))
+
+    same = mem == stream
+    print(f"[bench] in-memory : {t_mem:7.2f}s  peak {peak_mem / 1e6:8.1f} MB")
+    print(f"[bench] streaming : {t_str:7.2f}s  peak {peak_str / 1e6:8.1f} MB")
+    print(f"[bench] identical output: {same}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""
+Reproducible stage benchmarks with stored results and regression checks.
+
+Usage:
+  python -m benchmarks.suite run --preset small --out benchmarks/results/base.json
+  python -m benchmarks.suite run --preset small --cases merge_memory,caption --out new.json
+  python -m benchmarks.suite compare benchmarks/results/base.json new.json --threshold 0.10
+
+- Synthetic inputs (benchmarks/synth.py) are generated once per preset into
+  benchmarks/.cache/<preset>/ and reused, so runs compare like with like.
+- Each case runs in a fresh Python process: peak RSS (own + ffmpeg children) and CPU time
+  belong to that case alone. Setup (loading inputs) is excluded from the timed repeats.
+- Cases call the same functions as the stage scripts with the current config.yaml, so a
+  change to tag_merge, caption_rules or the video/frame_extract settings shows up here.
+- `compare` exits 1 if any case's median wall time or peak RSS grew by more than
+  --threshold (relative); results also carry machine info for sanity checks.
+"""
+
+from __future__ import annotations
+from pathlib import Path
+from typing import Callable, List
+import argparse, importlib, json, os, platform, shutil, statistics, subprocess, sys, time
+import ujson
+
+ROOT = Path(__file__).resolve().parents[1]
+CACHE = ROOT / "benchmarks" / ".cache"
+
+PRESETS = {
+    "small": {"clips": 2, "clip_seconds": 8, "clip_size": "640x360", "clip_fps": 30,
+              "images": 50_000, "vocab": 5_000, "repeat": 3},
+    "large": {"clips": 8, "clip_seconds": 30, "clip_size": "1280x720", "clip_fps": 30,
+              "images": 2_000_000, "vocab": 10_000, "repeat": 3},
+}
+FFMPEG_CASES = ("split", "upscale", "extract", "dedup", "dedup_video")
+TAG_CASES = ("merge_memory", "merge_streaming", "merge_columnar", "caption", "caption_batch")
+CASES = FFMPEG_CASES + TAG_CASES
+
+# ---------------------------------------------------------------------------
+# Inputs
+# ---------------------------------------------------------------------------
+
+def prepare_inputs(preset: str, params: dict, ffmpeg_bin: str, cases: List[str]) -> Path:
+    """Generate (or reuse) the synthetic inputs the selected cases need."""
+    from benchmarks.synth import make_clips, write_tag_sources
+    from scripts.utils.tag_merge import merge_in_memory, write_merged
+
+    root = CACHE / preset
+    stamp = root / "params.json"
+    if stamp.exists() and json.loads(stamp.read_text()) != params:
+        shutil.rmtree(root)  # preset changed; regenerate everything
+    root.mkdir(parents=True, exist_ok=True)
+    stamp.write_text(json.dumps(params, sort_keys=True))
+
+    if any(c in FFMPEG_CASES for c in cases):
+        clips = make_clips(ffmpeg_bin, root / "clips", count=params["clips"], seconds=params["clip_seconds"],
+                           size=params["clip_size"], fps=params["clip_fps"])
+        frames = root / "frames"
+        if "dedup" in cases and not frames.exists():
+            from scripts.utils.ffmpeg import extract_frames
+            for clip in clips:
+                extract_frames(ffmpeg_bin, clip, frames / clip.stem, fps=None, jpeg_q=95)
+    if any(c in TAG_CASES for c in cases):
+        tags = root / "tags_raw"
+        if not tags.exists():
+            print(f"[bench] generating {params['images']} images of synthetic tags ...")
+            write_tag_sources(tags, params["images"], params["vocab"])
+        merged = root / "merged.jsonl"
+        if {"caption", "caption_batch"} & set(cases) and not merged.exists():
+            write_merged(merged, merge_in_memory(sorted(tags.glob("*.jsonl")), 0.35))
+    return root
+
+# ---------------------------------------------------------------------------
+# Cases: setup(inputs, scratch, cfg) -> run() -> items processed
+# ---------------------------------------------------------------------------
+
+def _fresh(d: Path) -> Path:
+    shutil.rmtree(d, ignore_errors=True)
+    d.mkdir(parents=True)
+    return d
+
+def _ffmpeg_batch(make_jobs: Callable[[Path], list], scratch: Path, tag: str) -> Callable[[], int]:
+    from scripts.utils.ffmpeg import run_jobs
+
+    def run() -> int:
+        results = run_jobs(make_jobs(_fresh(scratch)), tag=tag)
+        if not all(r.ok for r in results):
+            raise RuntimeError(f"{tag}: " + "; ".join(r.error for r in results if not r.ok))
+        return sum(int(r.progress.get("frames", 0)) for r in results)
+    return run
+
+def case_split(inputs: Path, scratch: Path, cfg: dict):
+    from scripts.utils.ffmpeg import FFmpegJob
+    mod = importlib.import_module("scripts.08_split_review")
+    clips = sorted((inputs / "clips").glob("*.mp4"))
+    return _ffmpeg_batch(lambda out: [
+        FFmpegJob(c.name, mod.split_args(c, out / c.stem), mkdirs=(out / c.stem,)) for c in clips
+    ], scratch, "split")
+
+def case_upscale(inputs: Path, scratch: Path, cfg: dict):
+    from scripts.utils.ffmpeg import FFmpegJob
+    mod = importlib.import_module("scripts.10_upscale_normalize")
+    clips = sorted((inputs / "clips").glob("*.mp4"))
+    return _ffmpeg_batch(lambda out: [
+        FFmpegJob(c.name, mod.transcode_args(c, out / c.name)) for c in clips
+    ], scratch, "upscale")
+
+def case_extract(inputs: Path, scratch: Path, cfg: dict):
+    mod = importlib.import_module("scripts.20_frame_extract")
+    clips = sorted((inputs / "clips").glob("*.mp4"))
+    ff = cfg["paths"]["ffmpeg_bin"]
+    return _ffmpeg_batch(lambda out: [
+        mod.extract_job(ff, c, out / c.stem, cfg["frame_extract"]) for c in clips
+    ], scratch, "frames")
+
+def case_dedup(inputs: Path, scratch: Path, cfg: dict):
+    mod = importlib.import_module("scripts.25_dedup_frames")
+    folders = sorted(d for d in (inputs / "frames").iterdir() if d.is_dir())
+    return lambda: sum(mod.dedup_folder(d, cfg.get("dedup", {}))["total"] for d in folders)
+
+def case_dedup_video(inputs: Path, scratch: Path, cfg: dict):
+    from scripts.utils.dedup import cluster, hash_video
+    clips = sorted((inputs / "clips").glob("*.mp4"))
+    ff = cfg["paths"]["ffmpeg_bin"]
+    dcfg = cfg.get("dedup", {})
+
+    def run() -> int:
+        total = 0
+        for c in clips:
+            indices, hashes = hash_video(ff, c, dcfg.get("hash", "phash"))
+            cluster(hashes, int(dcfg.get("max_distance", 4)))
+            total += len(indices)
+        return total
+    return run
+
+def case_merge_memory(inputs: Path, scratch: Path, cfg: dict):
+    from scripts.utils.tag_merge import merge_in_memory, write_merged
+    sources = sorted((inputs / "tags_raw").glob("*.jsonl"))
+    min_conf = float(cfg["merge"]["min_confidence"])
+    return lambda: write_merged(_fresh(scratch) / "merged.jsonl", merge_in_memory(sources, min_conf))
+
+def case_merge_streaming(inputs: Path, scratch: Path, cfg: dict):
+    from scripts.utils.tag_merge import merge_streaming, write_merged
+    sources = sorted((inputs / "tags_raw").glob("*.jsonl"))
+    min_conf = float(cfg["merge"]["min_confidence"])
+    chunk = int(cfg["merge"].get("sort_chunk_rows", 200_000))
+
+    def run() -> int:
+        out = _fresh(scratch)
+        return write_merged(out / "merged.jsonl", merge_streaming(sources, min_conf, chunk_rows=chunk, tmp_dir=out))
+    return run
+
+def case_merge_columnar(inputs: Path, scratch: Path, cfg: dict):
+    from scripts.utils.tagstore import iter_jsonl, load_table, merge_tables, save_table, write_tags
+    stores = _fresh(scratch) / "stores"
+    stores.mkdir()
+    for src in sorted((inputs / "tags_raw").glob("*.jsonl")):
+        write_tags(stores / src.name, iter_jsonl(src), columnar=True)
+    min_conf = float(cfg["merge"]["min_confidence"])
+
+    def run() -> int:
+        merged = merge_tables([load_table(s) for s in sorted(stores.glob("*.tags"))], min_conf)
+        save_table(merged, scratch / "merged.tags")
+        return len(merged)
+    return run
+
+def case_caption(inputs: Path, scratch: Path, cfg: dict):
+    from scripts.utils.caption_rules import caption_options, to_caption
+    with open(inputs / "merged.jsonl", "r", encoding="utf-8") as f:
+        rows = [ujson.loads(line)["tags"] for line in f]
+    opts = caption_options(cfg)
+
+    def run() -> int:
+        for tags in rows:
+            to_caption(tags, **opts)
+        return len(rows)
+    return run
+
+def case_caption_batch(inputs: Path, scratch: Path, cfg: dict):
+    from scripts.utils.caption_rules import batch_captions, caption_options
+    with open(inputs / "merged.jsonl", "r", encoding="utf-8") as f:
+        rows = [(i, ujson.loads(line)["tags"]) for i, line in enumerate(f)]
+    opts = caption_options(cfg)
+    ccfg = cfg["clean"]
+
+    def run() -> int:
+        n = 0
+        for _ in batch_captions(rows, opts, chunk_rows=int(ccfg.get("chunk_rows", 50_000)),
+                                workers=int(ccfg.get("workers", 0))):
+            n += 1
+        return n
+    return run
+
+# ---------------------------------------------------------------------------
+# Worker (one case per process) and driver
+# ---------------------------------------------------------------------------
+
+def worker(case: str, inputs: Path, scratch: Path, repeat: int) -> dict:
+    from scripts.utils.metrics import peak_rss
+    from scripts.utils.paths import load_config
+
+    cfg = load_config()
+    run = globals()[f"case_{case}"](inputs, scratch, cfg)
+    walls, items = [], 0
+    cpu0 = os.times()
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        items = run()
+        walls.append(time.perf_counter() - t0)
+    cpu = os.times()
+    shutil.rmtree(scratch, ignore_errors=True)
+    rss = peak_rss()
+    return {
+        "wall_s": [round(w, 4) for w in walls],
+        "cpu_s": round((cpu.user - cpu0.user + cpu.system - cpu0.system) / repeat, 4),
+        "child_cpu_s": round((cpu.children_user - cpu0.children_user
+                              + cpu.children_system - cpu0.children_system) / repeat, 4),
+        "peak_rss": rss["self"] or 0,
+        "child_peak_rss": rss["children"] or 0,
+        "items": items,
+    }
+
+def machine_info(ffmpeg_bin: str) -> dict:
+    try:
+        ff = subprocess.run([ffmpeg_bin, "-version"], capture_output=True, text=True).stdout.splitlines()[0]
+    except (OSError, IndexError):
+        ff = "unavailable"
+    return {"python": platform.python_version(), "platform": platform.platform(),
+            "cpus": os.cpu_count(), "ffmpeg": ff}
+
+def run_suite(args) -> int:
+    from scripts.utils.paths import load_config
+
+    cfg = load_config()
+    ff = cfg["paths"]["ffmpeg_bin"]
+    params = dict(PRESETS[args.preset])
+    repeat = args.repeat or params.pop("repeat")
+    params.pop("repeat", None)
+    cases = [c for c in (args.cases.split(",") if args.cases else CASES) if c]
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        print(f"[bench] unknown case(s): {', '.join(sorted(unknown))}; choose from {', '.join(CASES)}", file=sys.stderr)
+        return 2
+    inputs = prepare_inputs(args.preset, params, ff, cases)
+
+    results = {}
+    for case in cases:
+        proc = subprocess.run(
+            [sys.executable, "-m", "benchmarks.suite", "_worker", case, str(inputs),
+             str(inputs / f"scratch_{case}"), str(repeat)],
+            cwd=ROOT, stdout=subprocess.PIPE, text=True,
+        )
+        if proc.returncode != 0:
+            print(f"[bench] {case} FAILED (rc={proc.returncode})", file=sys.stderr)
+            return 1
+        r = json.loads(proc.stdout.strip().splitlines()[-1])
+        med = statistics.median(r["wall_s"])
+        r["median_s"] = round(med, 4)
+        r["items_per_s"] = round(r["items"] / med, 2) if med > 0 else None
+        results[case] = r
+        print(f"[bench] {case:<16} median {med:8.3f}s  min {min(r['wall_s']):8.3f}s  "
+              f"{r['items_per_s'] or 0:>12.1f} items/s  peak rss {r['peak_rss'] / 1e6:7.1f} MB "
+              f"(ffmpeg {r['child_peak_rss'] / 1e6:.1f} MB)")
+
+    report = {"preset": args.preset, "params": params, "repeat": repeat,
+              "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "machine": machine_info(ff),
+              "config": {k: cfg.get(k) for k in ("video", "frame_extract", "dedup", "merge", "clean")},
+              "cases": results}
+    out = Path(args.out or ROOT / "benchmarks" / "results" / f"{args.preset}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"[bench] results: {out}")
+    return 0
+
+def compare(base_path: Path, new_path: Path, threshold: float) -> int:
+    """Print per-case ratios; return 1 if any metric regressed beyond `threshold`."""
+    base = json.loads(Path(base_path).read_text(encoding="utf-8"))
+    new = json.loads(Path(new_path).read_text(encoding="utf-8"))
+    if base.get("params") != new.get("params"):
+        print("[bench] warning: results were produced with different inputs", file=sys.stderr)
+    if base.get("machine") != new.get("machine"):
+        print("[bench] warning: results come from different machines/toolchains", file=sys.stderr)
+    regressions = 0
+    print(f"{'case':<16} {'base s':>9} {'new s':>9} {'time':>8} {'base MB':>9} {'new MB':>9} {'rss':>8}")
+    for case, b in base["cases"].items():
+        n = new["cases"].get(case)
+        if n is None:
+            print(f"{case:<16} (missing in new results)")
+            continue
+        t_ratio = n["median_s"] / b["median_s"] if b["median_s"] else 1.0
+        m_ratio = n["peak_rss"] / b["peak_rss"] if b["peak_rss"] else 1.0
+        flags = []
+        if t_ratio > 1 + threshold:
+            flags.append("SLOWER")
+        if m_ratio > 1 + threshold:
+            flags.append("MORE MEMORY")
+        regressions += bool(flags)
+        print(f"{case:<16} {b['median_s']:>9.3f} {n['median_s']:>9.3f} {t_ratio - 1:>+8.1%}"
+              f" {b['peak_rss'] / 1e6:>9.1f} {n['peak_rss'] / 1e6:>9.1f} {m_ratio - 1:>+8.1%}  {' '.join(flags)}")
+    if regressions:
+        print(f"[bench] {regressions} case(s) regressed by more than {threshold:.0%}", file=sys.stderr)
+        return 1
+    print(f"[bench] no regressions beyond {threshold:.0%}")
+    return 0
+
+def main() -> int:
+    if len(sys.argv) > 1 and sys.argv[1] == "_worker":
+        case, inputs, scratch, repeat = sys.argv[2:6]
+        print(json.dumps(worker(case, Path(inputs), Path(scratch), int(repeat))))
+        return 0
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("run", help="Run benchmark cases and store the results")
+    r.add_argument("--preset", choices=sorted(PRESETS), default="small")
+    r.add_argument("--cases", default="", help=f"Comma-separated subset of: {','.join(CASES)}")
+    r.add_argument("--repeat", type=int, default=0, help="Timed repeats per case (0 = preset default)")
+    r.add_argument("--out", default="", help="Results file (default benchmarks/results/<preset>-<time>.json)")
+    c = sub.add_parser("compare", help="Compare two results files")
+    c.add_argument("base")
+    c.add_argument("new")
+    c.add_argument("--threshold", type=float, default=0.10, help="Allowed relative slowdown / memory growth")
+    args = ap.parse_args()
+    if args.cmd == "run":
+        return run_suite(args)
+    return compare(Path(args.base), Path(args.new), args.threshold)
+
+if __name__ == "__main__":
+    raise SystemExit(main())
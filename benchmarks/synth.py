@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Deterministic synthetic inputs for the benchmarks.
+
+- Video clips rendered locally by ffmpeg's lavfi sources (`testsrc2`, `mandelbrot`), so no
+  sample footage has to be shipped or downloaded.
+- tags_raw-style JSONL sources with Zipf-distributed tag popularity, WD14-looking tag names
+  (underscores, parenthesised qualifiers, rating_* tags) and skewed confidences.
+- Same parameters + seed -> byte-identical files.
+"""
+
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, List, Sequence
+import subprocess
+import numpy as np
+import ujson
+
+# Source name -> fraction of images it covers (WD14 tags everything, annotation tools a subset).
+SOURCES: Dict[str, float] = {"wd14": 1.0, "cvat": 0.3, "viame": 0.2, "datagym": 0.2}
+LAVFI_PATTERNS = ("testsrc2", "mandelbrot")
+RATINGS = ("rating_general", "rating_sensitive", "rating_questionable", "rating_explicit")
+
+def make_clips(
+    ffmpeg_bin: str,
+    out_dir: Path,
+    *, count: int,
+    seconds: float,
+    size: str = "640x360",
+    fps: int = 30,
+) -> List[Path]:
+    """Render `count` H.264 clips alternating testsrc2/mandelbrot; existing files are reused."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    clips = []
+    for i in range(count):
+        pattern = LAVFI_PATTERNS[i % len(LAVFI_PATTERNS)]
+        dst = out_dir / f"{pattern}_{i:03d}.mp4"
+        if not dst.exists():
+            tmp = dst.with_name(f"{dst.stem}.tmp.mp4")
+            subprocess.run([
+                ffmpeg_bin, "-y", "-hide_banner", "-loglevel", "error",
+                "-f", "lavfi", "-i", f"{pattern}=size={size}:rate={fps}",
+                "-t", str(seconds), "-c:v", "libx264", "-preset", "ultrafast",
+                "-pix_fmt", "yuv420p", str(tmp),
+            ], check=True)
+            tmp.replace(dst)
+        clips.append(dst)
+    return clips
+
+def vocabulary(size: int) -> List[str]:
+    """WD14-style tag names: mostly snake_case, some with `_(qualifier)` suffixes."""
+    qualifiers = ("object", "artwork", "medium", "season")
+    out = []
+    for i in range(size):
+        if i % 37 == 0:
+            out.append(f"tag_{i}_({qualifiers[i % len(qualifiers)]})")
+        elif i % 5 == 0:
+            out.append(f"Tag_{i}")  # mixed case exercises lowercasing
+        else:
+            out.append(f"tag_{i}")
+    return out
+
+def write_tag_sources(
+    root: Path,
+    images: int,
+    vocab: int,
+    *, seed: int = 0,
+    zipf_s: float = 1.1,
+    mean_tags: int = 12,
+    sources: Dict[str, float] = SOURCES,
+) -> List[Path]:
+    """One row per (source, image) for each source's share of images; return the files."""
+    rng = np.random.default_rng(seed)
+    names = vocabulary(vocab)
+    weights = 1.0 / np.arange(1, vocab + 1) ** zipf_s
+    cdf = np.cumsum(weights / weights.sum())
+    root.mkdir(parents=True, exist_ok=True)
+    out = []
+    for name, coverage in sources.items():
+        picked_images = np.sort(rng.choice(images, int(images * coverage), replace=False))
+        counts = np.clip(rng.poisson(mean_tags, len(picked_images)), 1, 4 * mean_tags)
+        ids = np.searchsorted(cdf, rng.random(int(counts.sum())), side="right").clip(0, vocab - 1)
+        # Popular tags tend to be confident; the tail is spread towards the threshold.
+        conf = np.round(np.clip(rng.beta(4, 1.5, len(ids)) - ids / (vocab * 4), 0.05, 1.0), 3)
+        ratings = rng.integers(0, len(RATINGS), len(picked_images))
+        path = root / f"{name}.jsonl"
+        with path.open("w", encoding="utf-8") as f:
+            pos = 0
+            for img, n, r in zip(picked_images.tolist(), counts.tolist(), ratings.tolist()):
+                tags = [[names[t], c] for t, c in zip(ids[pos:pos + n].tolist(), conf[pos:pos + n].tolist())]
+                pos += n
+                if name == "wd14":
+                    tags.append([RATINGS[r], 0.9])
+                row = {"image": f"frames/vid_{img // 300:05d}__clip_0000/frame_{img % 300:06d}.jpg", "tags": tags}
+                f.write(ujson.dumps(row))
+                f.write("\n")
+        out.append(path)
+    return out
+
+def total_bytes(paths: Sequence[Path]) -> int:
+    return sum(Path(p).stat().st_size for p in paths)
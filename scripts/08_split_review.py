@@ -2,71 +2,290 @@
 Split review videos into <=5s clips at a fixed 60 fps for smooth, uniform training samples.
 - Re-encodes with keyframes every 5s so each segment boundary is clean.
 - Produces data/clips_5s/<video>/clip_0001.mp4, clip_0002.mp4, ...
+- Videos are split concurrently (--jobs); one bad source never stops the batch.
+- Unchanged sources are skipped via the stage manifest (--force to redo everything).
+- Sources are probed once (scripts/utils/media_info.py, cached by path + size + mtime):
+  split_fast_copy cuts on real keyframes, and with video.copy_conforming a source already
+  at the target codec/fps/pix_fmt with keyframes on every clip boundary is split by
+  stream copy instead of re-encoded. The expected clip count is printed up front.
+- Re-encodes use video.preset / video.crf. With encode.target (or --target) the encode
+  planner (scripts/utils/encode_plan.py) picks preset, jobs and threads from a cached
+  calibration of this machine and prints predicted vs. actual time.
+- Single-pass mode (video.single_pass or --single-pass) decodes each source once and
+  writes the final scaled/padded clips to data/upscaled_256/<video>/ directly, so
+  10_upscale_normalize.py is not needed; video.single_pass_frames also tees JPEG
+  frames into the per-clip folders 20_frame_extract.py would write, frames/<video>__clip_NNNN/
+  (packed into frames/<video>__clip_NNNN.tar when frame_extract.pack is set). 10 and 20
+  only see the config switch: with --single-pass alone, do not run them.
+- --shard i/N only splits the videos of shard i (scripts/utils/shard.py), for N nodes
+  sharing the data folder.
+- config.yaml is read when a function first needs it (`settings()`, `stage_paths()`), so
+  importing this module (run_pipeline.py, benchmarks) neither parses it nor creates data/.
 """
-import subprocess, sys
+import argparse, math, os, shutil, subprocess, sys, time
 from pathlib import Path
-import yaml
+from typing import List, Optional
+from scripts.utils.encode_plan import TARGETS, EncodeWork, report_plan, stage_plan
+from scripts.utils.ffmpeg import FFmpegJob, run_jobs, report_failures, split_scale_args
+from scripts.utils.framepack import folder_file, pack_folder, remove_frames, video_frame_folders
+from scripts.utils.manifest import Manifest, remove_output
+from scripts.utils.media_info import MediaInfo, aligned_splits, conforms, keyframe_splits, media_cache, predict_clips
+from scripts.utils.metrics import StageMetrics
+from scripts.utils.paths import PipelinePaths, VideoSettings, clip_frames_dir, load_config, paths, video_settings
+from scripts.utils.shard import add_shard_arg, stage_name
 
-ROOT = Path(__file__).resolve().parents[1]
-CFG  = yaml.safe_load((ROOT / "config.yaml").read_text(encoding="utf-8"))
+def settings() -> VideoSettings:
+    """The `video:` block (config.yaml is read on first use, then cached by load_config)."""
+    return video_settings(load_config())
 
-IN_DIR  = ROOT / CFG["paths"].get("input_videos_dir", "data/input_videos")
-OUT_DIR = ROOT / CFG["paths"].get("split_clips_dir",  "data/clips_5s")
+def stage_paths() -> PipelinePaths:
+    """Working paths; directories are created only when an entry is first used."""
+    return paths(load_config())
 
-MAX_SEC    = int(CFG.get("video", {}).get("clip_max_seconds", 5))
-TARGET_FPS = int(CFG.get("video", {}).get("fps", 60))     # <- 60 fps
-FAST_COPY  = bool(CFG.get("video", {}).get("split_fast_copy", False))
+VIDEO_EXTS = {".mp4", ".mov", ".mkv", ".webm", ".avi", ".m4v", ".mpg", ".mpeg", ".wmv", ".flv"}
 
-def split_video(src: Path, dst_dir: Path) -> None:
-    dst_dir.mkdir(parents=True, exist_ok=True)
+def list_videos(in_dir: Optional[Path] = None) -> list:
+    """Source videos in the review folder (placeholder/text files are ignored)."""
+    in_dir = in_dir or stage_paths().input_videos
+    return sorted(p for p in in_dir.iterdir() if p.is_file() and p.suffix.lower() in VIDEO_EXTS)
+
+def segment_points(times: Optional[List[float]]) -> list:
+    """Segment muxer cut options: explicit times when known, else every clip_max_seconds."""
+    if not times:
+        return ["-segment_time", str(settings().clip_max_seconds)]
+    return ["-segment_times", ",".join(f"{t:.6f}" for t in times)]
+
+def copy_splits(info: Optional[MediaInfo], size: Optional[int] = None) -> Optional[List[float]]:
+    """Split times for a stream-copy split of a conforming source, or None to re-encode."""
+    v = settings()
+    if not v.copy_conforming or not conforms(info, fps=v.fps, pix_fmt=v.pix_fmt, size=size):
+        return None
+    return aligned_splits(info, v.clip_max_seconds)
+
+def copy_split_args(src: Path, dst_dir: Path, times: List[float]) -> list:
+    """Video-only stream-copy split at `times` (keyframes), output pattern last."""
+    return [
+        settings().ffmpeg_bin, "-y", "-hide_banner", "-loglevel", "error",
+        "-i", str(src),
+        "-map", "0:v:0", "-an", "-c", "copy",
+        "-f", "segment", *segment_points(times),
+        "-reset_timestamps", "1",
+        "-segment_format_options", "movflags=+faststart",
+        str(dst_dir / "clip_%04d.mp4"),
+    ]
+
+def probe_source(src: Path):
+    """Media info for `src` when a split decision needs it (None otherwise)."""
+    v = settings()
+    if v.split_fast_copy or v.copy_conforming:
+        cfg = load_config()
+        return media_cache(cfg, paths(cfg).work_root).probe(src)
+    return None
+
+def predicted_clips(info: Optional[MediaInfo]) -> int:
+    """Clips the split of a source with `info` will produce (0 if unknown)."""
+    v = settings()
+    if info is not None and v.split_fast_copy and info.keyframes:
+        return predict_clips(info, v.clip_max_seconds, keyframe_splits(info, v.clip_max_seconds))
+    return predict_clips(info, v.clip_max_seconds)
+
+def split_args(src: Path, dst_dir: Path, info: Optional[MediaInfo] = None, preset: Optional[str] = None) -> list:
+    """Build the split command for one source (output pattern is the last argument)."""
+    v = settings()
     out_pattern = str(dst_dir / "clip_%04d.mp4")
 
-    if FAST_COPY:
+    times = copy_splits(info)
+    if times is not None:
+        return copy_split_args(src, dst_dir, times)
+    if v.split_fast_copy:
         # Fast copy (no re-encode). Keeps source fps; not recommended when enforcing 60 fps globally.
+        # Cuts land on the last real keyframe within clip_max_seconds when the source was probed.
         cmd = [
-            "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+            v.ffmpeg_bin, "-y", "-hide_banner", "-loglevel", "error",
             "-i", str(src),
             "-c", "copy", "-map", "0",
-            "-f", "segment", "-segment_time", str(MAX_SEC),
+            "-f", "segment", *segment_points(keyframe_splits(info, v.clip_max_seconds) if info else None),
             "-reset_timestamps", "1",
             out_pattern,
         ]
     else:
         # Re-encode at 60 fps and force keyframes every 5 seconds.
-        gop = max(1, TARGET_FPS * MAX_SEC)        # 60 * 5 = 300
-        force_kf = f"expr:gte(t,n_forced*{MAX_SEC})"
+        gop = max(1, v.fps * v.clip_max_seconds)        # 60 * 5 = 300
+        force_kf = f"expr:gte(t,n_forced*{v.clip_max_seconds})"
         cmd = [
-            "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+            v.ffmpeg_bin, "-y", "-hide_banner", "-loglevel", "error",
             "-i", str(src),
             "-an",
-            "-r", str(TARGET_FPS),                 # normalize to 60 fps here
-            "-c:v", "libx264", "-preset", "veryfast", "-crf", "18",
-            "-pix_fmt", "yuv420p", "-profile:v", "high",
+            "-r", str(v.fps),                 # normalize to 60 fps here
+            "-c:v", "libx264", "-preset", preset or v.preset, "-crf", str(v.crf),
+            "-pix_fmt", v.pix_fmt, "-profile:v", "high",
             "-g", str(gop), "-keyint_min", str(gop), "-sc_threshold", "0",
             "-force_key_frames", force_kf,
-            "-f", "segment", "-segment_time", str(MAX_SEC),
+            "-f", "segment", "-segment_time", str(v.clip_max_seconds),
             "-reset_timestamps", "1",
             "-movflags", "+faststart",
             out_pattern,
         ]
+    return cmd
 
-    subprocess.run(cmd, check=True)
+def single_pass_args(src: Path, clips_dir: Path, frames_dir=None, info: Optional[MediaInfo] = None,
+                     preset: Optional[str] = None) -> list:
+    """Split + scale/pad in one encode, configured from the `video:` block."""
+    cfg, v = load_config(), settings()
+    times = copy_splits(info, v.upscale_size) if frames_dir is None else None
+    if times is not None:
+        return copy_split_args(src, clips_dir, times)
+    return split_scale_args(
+        v.ffmpeg_bin, src, clips_dir,
+        size=v.upscale_size,
+        fps=v.fps,
+        clip_seconds=v.clip_max_seconds,
+        pix_fmt=v.pix_fmt,
+        crf=v.crf,
+        preset=preset or v.preset,
+        frames_dir=frames_dir,
+        jpeg_q=int(cfg.get("frame_extract", {}).get("jpeg_q", 96)),
+    )
+
+def staged_frames_dir(src: Path) -> Path:
+    """Where single-pass ffmpeg writes the frames of `src` before they are sorted into clips."""
+    return stage_paths().work_root / ".single_pass_frames" / src.stem
+
+def distribute_frames(staged: Path, video: str) -> List[Path]:
+    """
+    Move single-pass frames (frame_N.jpg, N = frame index in the whole source at video.fps)
+    into the clip folders 20_frame_extract.py would write: clip K = N // (fps * clip_max_seconds)
+    gets frames/<video>__clip_KKKK/frame_MMMMMM.jpg, M = the frame's index in that clip.
+    Keyframes are forced on every clip_max_seconds boundary, so clips hold exactly that many frames.
+    """
+    cfg, v = load_config(), settings()
+    p = paths(cfg)
+    per_clip = max(1, v.fps * v.clip_max_seconds)
+    folders: List[Path] = []
+    for f in sorted(staged.glob("frame_*.jpg")):
+        n = int(f.stem.rpartition("_")[2])
+        folder = clip_frames_dir(p.frames_root, video, f"clip_{n // per_clip:04d}")
+        if not folders or folders[-1] != folder:
+            folder.mkdir(parents=True, exist_ok=True)
+            folders.append(folder)
+        os.replace(f, folder / f"frame_{n % per_clip:06d}.jpg")
+    shutil.rmtree(staged, ignore_errors=True)
+    if cfg.get("frame_extract", {}).get("pack", False):
+        for folder in folders:
+            pack_folder(folder)
+    return folders
+
+def encode_work(src: Path) -> EncodeWork:
+    """Planner input for one source: output frames at video.fps and the source frame size."""
+    cfg, v = load_config(), settings()
+    info = media_cache(cfg, paths(cfg).work_root).probe(src)
+    if info is None:
+        return EncodeWork(src.name, v.fps * v.clip_max_seconds, (v.upscale_size, v.upscale_size))
+    return EncodeWork(src.name, max(1, math.ceil(info.duration * v.fps)), (info.width, info.height))
+
+def split_video(src: Path, dst_dir: Path) -> None:
+    dst_dir.mkdir(parents=True, exist_ok=True)
+    subprocess.run(split_args(src, dst_dir), check=True)
 
 def main() -> int:
-    if not IN_DIR.exists():
-        print(f"[split] Input folder not found: {IN_DIR}", file=sys.stderr)
+    cfg = load_config()
+    p, v = paths(cfg), video_settings(cfg)
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--jobs", type=int, default=0, help="Concurrent ffmpeg processes (0 = auto)")
+    ap.add_argument("--threads", type=int, default=0, help="Threads per ffmpeg process (0 = cores / jobs)")
+    ap.add_argument("--force", action="store_true", help="Ignore the manifest and re-split every video")
+    ap.add_argument("--single-pass", action="store_true", default=v.single_pass,
+                    help="Write final upscaled clips directly (one decode/encode per source)")
+    ap.add_argument("--target", choices=TARGETS, default=None,
+                    help="Plan preset/jobs/threads for max throughput or a deadline (default: encode.target)")
+    ap.add_argument("--deadline", type=float, default=None, help="Minutes for --target deadline")
+    add_shard_arg(ap)
+    args = ap.parse_args()
+
+    if not p.input_videos.exists():
+        print(f"[split] Input folder not found: {p.input_videos}", file=sys.stderr)
         return 2
-    videos = [p for p in IN_DIR.iterdir() if p.is_file()]
+    videos = list_videos(p.input_videos)
     if not videos:
-        print(f"[split] No files in {IN_DIR}")
+        print(f"[split] No files in {p.input_videos}")
         return 0
-    for src in videos:
-        base = src.stem
-        dst  = OUT_DIR / base
-        print(f"[split] {src.name} → {dst}")
-        split_video(src, dst)
+    if args.shard:
+        total, videos = len(videos), args.shard.select(videos, lambda src: src.stem)
+        print(f"[split] shard {args.shard.tag}: {len(videos)} of {total} videos")
+    section = {"video": cfg.get("video", {}), "single_pass": args.single_pass}
+    if args.single_pass:
+        section["frame_extract"] = cfg.get("frame_extract", {})
+        section["frames"] = "per_clip"  # earlier runs wrote one frames/<video>/ folder
+        if not v.single_pass:
+            print("[split] --single-pass without video.single_pass: 10_upscale_normalize.py and "
+                  "20_frame_extract.py only see the config, so skip them for this run")
+    manifest = Manifest.for_stage(p.work_root, stage_name("split", args.shard), section, force=args.force)
+    for stale in manifest.prune(videos):
+        print(f"[split] pruned {stale}")
+    jobs, todo, infos, frame_dirs = [], [], [], []
+    clips = 0
+    for src in sorted(videos):
+        frames = None
+        if args.single_pass:
+            dst = p.upscaled / src.stem
+            frames = staged_frames_dir(src) if v.single_pass_frames else None
+        else:
+            dst = p.split_clips / src.stem
+        outputs = [dst]
+        # With frames, the clip folders are only known afterwards: check the recorded ones.
+        if manifest.is_fresh(src, [] if frames else outputs):
+            continue
+        info = probe_source(src)
+        clips += predicted_clips(info)
+        cmd = single_pass_args(src, dst, frames, info) if args.single_pass else split_args(src, dst, info)
+        for old in manifest.outputs(src):  # also frames of an earlier layout or sampling
+            remove_output(old)
+        remove_output(dst)  # drop clips/frames left over from a previous, longer run
+        finalize = None
+        if frames:
+            for d in video_frame_folders(p.frames_root, src.stem):
+                remove_frames(d)
+            remove_output(frames)
+            finalize = lambda f=frames, v=src.stem: distribute_frames(f, v)
+        jobs.append(FFmpegJob(f"{src.name} → {dst}", cmd, mkdirs=(dst,) + ((frames,) if frames else ()),
+                              finalize=finalize))
+        todo.append((src, outputs))
+        infos.append(info)
+        frame_dirs.append(frames)
+    predicted = f" (~{clips} clips)" if clips else ""
+    print(f"[split] {len(jobs)} to split{predicted}, {len(videos) - len(jobs)} up to date")
+    encodes = [src for (src, _), job in zip(todo, jobs) if "libx264" in job.args]
+    plan, calib = stage_plan(cfg, p.work_root, (encode_work(src) for src in encodes),
+                             out_size=v.upscale_size if args.single_pass else None, stage="split",
+                             target=args.target, deadline_minutes=args.deadline)
+    media_cache(cfg, p.work_root).save()
+    if plan is not None:
+        print(f"[split] {plan.summary()}")
+        for job, (src, outputs), info, frames in zip(jobs, todo, infos, frame_dirs):
+            if args.single_pass:
+                job.args = single_pass_args(src, outputs[0], frames, info, plan.preset)
+            else:
+                job.args = split_args(src, outputs[0], info, plan.preset)
+    with StageMetrics("split", p.work_root) as m:
+        t0 = time.perf_counter()
+        results = run_jobs(jobs, max_workers=args.jobs or (plan.jobs if plan else 0),
+                           threads=args.threads or (plan.threads if plan else 0), tag="split")
+        if plan is not None and encodes:
+            m.extra["encode_plan"] = report_plan(plan, calib, time.perf_counter() - t0, "split")
+        m.jobs(results)
+        for (src, outputs), frames in zip(todo, frame_dirs):
+            if frames:
+                outputs += [folder_file(d) for d in video_frame_folders(p.frames_root, src.stem)]
+        m.add_read(*(src for src, _ in todo))
+        m.add_written(*(o for _, outputs in todo for o in outputs))
+    for (src, outputs), r in zip(todo, results):
+        if r.ok:
+            manifest.record(src, outputs)
+        else:
+            manifest.forget(src)
+    manifest.save()
     print("[split] Done.")
-    return 0
+    return report_failures(results, tag="split")
 
 if __name__ == "__main__":
     raise SystemExit(main())
@@ -1,48 +1,156 @@
-from pathlib import Path
-import subprocess, yaml
-
-ROOT = Path(__file__).resolve().parents[1]
-CFG  = yaml.safe_load((ROOT / "config.yaml").read_text(encoding="utf-8"))
-
-IN_DIR  = ROOT / CFG["paths"].get("split_clips_dir", "data/clips_5s")
-OUT_DIR = ROOT / CFG["paths"].get("upscaled_256_dir", "data/upscaled_256")
+"""
+Upscale/pad split clips to the square training size at a fixed fps.
 
-FPS  = int(CFG.get("video", {}).get("fps", 60))     # <- 60 fps
-SIZE = int(CFG.get("video", {}).get("upscale_size", 256))
+- Clips are transcoded concurrently (--jobs) with a per-process thread budget.
+- Failures are collected and reported at the end instead of aborting the batch.
+- Unchanged clips are skipped via the stage manifest (--force to redo everything).
+- With video.copy_conforming, clips already at the target codec/size/fps/pix_fmt (probed via
+  scripts/utils/media_info.py) are hardlinked, or stream-copied when they carry audio.
+- Encodes use video.preset / video.crf. With encode.target (or --target) the encode planner
+  (scripts/utils/encode_plan.py) picks preset, jobs and threads from a cached calibration
+  of this machine and prints predicted vs. actual time.
+- --shard i/N only transcodes clips of the videos in shard i (scripts/utils/shard.py).
+- config.yaml is read when a function first needs it (`settings()`), not at import.
+"""
+from pathlib import Path
+from typing import Optional
+import argparse, math, subprocess, time
+from scripts.utils.encode_plan import TARGETS, EncodeWork, report_plan, stage_plan
+from scripts.utils.ffmpeg import FFmpegJob, run_jobs, report_failures, scale_pad_filter
+from scripts.utils.linking import place_file
+from scripts.utils.manifest import Manifest, remove_output
+from scripts.utils.media_info import MediaCache, conforms, media_cache
+from scripts.utils.metrics import StageMetrics
+from scripts.utils.paths import VideoSettings, load_config, paths, video_settings
+from scripts.utils.shard import add_shard_arg, stage_name
 
-# Keep aspect ratio, then pad to 256x256; output is locked to 60 fps.
-VF = (
-    f"fps={FPS},"
-    f"scale={SIZE}:{SIZE}:flags=lanczos:force_original_aspect_ratio=decrease,"
-    f"pad={SIZE}:{SIZE}:(ow-iw)/2:(oh-ih)/2:black"
-)
+def settings() -> VideoSettings:
+    """The `video:` block (config.yaml is read on first use, then cached by load_config)."""
+    return video_settings(load_config())
 
-def transcode(src: Path, dst: Path) -> None:
-    dst.parent.mkdir(parents=True, exist_ok=True)
-    cmd = [
-        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+def transcode_args(src: Path, dst: Path, preset: Optional[str] = None) -> list:
+    """Build the transcode command for one clip (output path is the last argument)."""
+    v = settings()
+    return [
+        v.ffmpeg_bin, "-y", "-hide_banner", "-loglevel", "error",
         "-i", str(src),
         "-an",
-        "-vf", VF,
-        "-r", str(FPS),                         # enforce 60 fps timebase on output
-        "-c:v", "libx264", "-preset", "veryfast", "-crf", "18",
-        "-pix_fmt", "yuv420p",
+        "-vf", scale_pad_filter(v.upscale_size, v.fps),  # keep aspect ratio, pad to the square size
+        "-r", str(v.fps),                         # enforce 60 fps timebase on output
+        "-c:v", "libx264", "-preset", preset or v.preset, "-crf", str(v.crf),
+        "-pix_fmt", v.pix_fmt,
         "-movflags", "+faststart",
         str(dst),
     ]
-    subprocess.run(cmd, check=True)
+
+def remux_args(src: Path, dst: Path) -> list:
+    """Video-only stream copy for clips that already conform (output path is the last argument)."""
+    return [
+        settings().ffmpeg_bin, "-y", "-hide_banner", "-loglevel", "error",
+        "-i", str(src),
+        "-map", "0:v:0", "-an", "-c", "copy",
+        "-movflags", "+faststart",
+        str(dst),
+    ]
+
+def upscale_job(clip: Path, dst: Path, media: Optional[MediaCache] = None,
+                preset: Optional[str] = None) -> Optional[FFmpegJob]:
+    """
+    Job producing `dst` from `clip`. A conforming clip is hardlinked on the spot (None is
+    returned) or, when it has audio, stream-copied; everything else is transcoded.
+    An existing `dst` is unlinked first: it may be a hardlink of the source clip from an
+    earlier run, and `ffmpeg -y` would truncate and overwrite the source through it.
+    """
+    v = settings()
+    info = media.probe(clip) if media is not None and v.copy_conforming else None
+    copy = conforms(info, fps=v.fps, pix_fmt=v.pix_fmt, size=v.upscale_size)
+    if copy and not info.audio and clip.suffix.lower() == dst.suffix.lower():
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        place_file(clip, dst, "hardlink")
+        return None
+    remove_output(dst)
+    if copy:
+        return FFmpegJob(f"{clip} → {dst} (copy)", remux_args(clip, dst), mkdirs=(dst.parent,))
+    return FFmpegJob(f"{clip} → {dst}", transcode_args(clip, dst, preset), mkdirs=(dst.parent,))
+
+def encode_work(clip: Path, media: MediaCache) -> EncodeWork:
+    """Planner input for one clip: output frames at video.fps and the source frame size."""
+    v = settings()
+    info = media.probe(clip)
+    if info is None:
+        return EncodeWork(clip.name, v.fps * v.clip_max_seconds, (v.upscale_size, v.upscale_size))
+    return EncodeWork(clip.name, max(1, math.ceil(info.duration * v.fps)), (info.width, info.height))
+
+def transcode(src: Path, dst: Path) -> None:
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    subprocess.run(transcode_args(src, dst), check=True)
 
 def main():
-    if not IN_DIR.exists():
-        print(f"[upscale] Input folder not found: {IN_DIR}")
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--jobs", type=int, default=0, help="Concurrent ffmpeg processes (0 = auto)")
+    ap.add_argument("--threads", type=int, default=0, help="Threads per ffmpeg process (0 = cores / jobs)")
+    ap.add_argument("--force", action="store_true", help="Ignore the manifest and re-transcode every clip")
+    ap.add_argument("--target", choices=TARGETS, default=None,
+                    help="Plan preset/jobs/threads for max throughput or a deadline (default: encode.target)")
+    ap.add_argument("--deadline", type=float, default=None, help="Minutes for --target deadline")
+    add_shard_arg(ap)
+    args = ap.parse_args()
+
+    cfg = load_config()
+    p, v = paths(cfg), video_settings(cfg)
+    if v.single_pass:
+        print("[upscale] video.single_pass is on; 08_split_review.py already wrote upscaled clips.")
+        return 0
+    if not p.split_clips.exists():
+        print(f"[upscale] Input folder not found: {p.split_clips}")
         return 2
-    for video_dir in sorted([p for p in IN_DIR.iterdir() if p.is_dir()]):
-        out_dir = OUT_DIR / video_dir.name
-        for clip in sorted(video_dir.glob("clip_*.mp4")):
-            out_path = out_dir / clip.name
-            print(f"[upscale] {clip} → {out_path}")
-            transcode(clip, out_path)
+    manifest = Manifest.for_stage(p.work_root, stage_name("upscale", args.shard), cfg.get("video", {}), force=args.force)
+    clips = sorted(p.split_clips.glob("*/clip_*.mp4"))
+    if args.shard:
+        total, clips = len(clips), args.shard.select(clips, lambda c: c.parent.name)
+        print(f"[upscale] shard {args.shard.tag}: {len(clips)} of {total} clips")
+    for stale in manifest.prune(clips):
+        print(f"[upscale] pruned {stale}")
+    media = media_cache(cfg, p.work_root)
+    jobs, todo = [], []
+    linked = 0
+    for clip in clips:
+        out_path = p.upscaled / clip.parent.name / clip.name
+        if manifest.is_fresh(clip, [out_path]):
+            continue
+        job = upscale_job(clip, out_path, media)
+        if job is None:
+            manifest.record(clip, [out_path])
+            linked += 1
+            continue
+        jobs.append(job)
+        todo.append((clip, out_path))
+    print(f"[upscale] {len(jobs)} to transcode, {linked} conforming linked, "
+          f"{len(clips) - len(jobs) - linked} up to date")
+    transcodes = [(clip, out) for (clip, out), job in zip(todo, jobs) if "libx264" in job.args]
+    plan, calib = stage_plan(cfg, p.work_root, (encode_work(clip, media) for clip, _ in transcodes),
+                             out_size=v.upscale_size, stage="upscale", target=args.target, deadline_minutes=args.deadline)
+    media.save()
+    if plan is not None:
+        print(f"[upscale] {plan.summary()}")
+        jobs = [upscale_job(clip, out, media, plan.preset) for clip, out in todo]
+    with StageMetrics("upscale", p.work_root) as m:
+        t0 = time.perf_counter()
+        results = run_jobs(jobs, max_workers=args.jobs or (plan.jobs if plan else 0),
+                           threads=args.threads or (plan.threads if plan else 0), tag="upscale")
+        if plan is not None and transcodes:
+            m.extra["encode_plan"] = report_plan(plan, calib, time.perf_counter() - t0, "upscale")
+        m.jobs(results)
+        m.add_read(*(clip for clip, _ in todo))
+        m.add_written(*(out for _, out in todo))
+    for (clip, out_path), r in zip(todo, results):
+        if r.ok:
+            manifest.record(clip, [out_path])
+        else:
+            manifest.forget(clip)
+    manifest.save()
     print("[upscale] Done.")
+    return report_failures(results, tag="upscale")
 
 if __name__ == "__main__":
-    main()
+    raise SystemExit(main())
@@ -1,26 +1,130 @@
 # -*- coding: utf-8 -*-
 """
-Extract frames from normalized videos for downstream tagging.
+Extract frames from upscaled clips (or legacy normalized videos) for downstream tagging.
 
 - Uses JPEG with adjustable quality (config.frame_extract.jpeg_q).
-- Keeps the per-video folder structure (frames/<video_stem>/frame_XXXXXX.jpg).
+- Upscaled clips data/upscaled_256/<video>/clip_NNNN.mp4 -> frames/<video>__clip_NNNN/frame_XXXXXX.jpg;
+  flat data/normalized_videos/<video>.mp4 -> frames/<video>/frame_XXXXXX.jpg (XXXXXX = source frame index).
+- Sampling (config.frame_extract.mode): all | nth (every_nth_frame) | keyframes | scene
+  (scene_threshold), with a per-clip min_frames/max_frames budget.
+- Videos are extracted concurrently (--jobs); failures are reported at the end.
+- Unchanged videos are skipped via the stage manifest (--force to redo everything).
+- Refreshes data/frames_catalog.jsonl (frame_catalog.py) for the ingest stages.
+- frame_extract.pack stores each folder as one uncompressed frames/<folder>.tar once ffmpeg
+  is done (scripts/utils/framepack.py); 25, 30, 60 and the catalog read packs directly.
+- frame_extract.from_video (all/nth sampling) skips this stage: 25_dedup_frames.py and
+  30_tag_wd14.py read the clips through a raw pipe and 25 writes JPEGs for kept frames only.
+- So do video.single_pass + video.single_pass_frames: 08_split_review.py already wrote every
+  frame into the same frames/<video>__clip_NNNN/ folders.
+- --shard i/N only extracts the videos of shard i (scripts/utils/shard.py) and leaves the
+  catalog refresh to the next (unsharded) stage.
 """
 
+import argparse
 from pathlib import Path
-from scripts.utils.paths import load_config, paths
-from scripts.utils.ffmpeg import extract_frames
+from scripts.utils.paths import clip_frames_dir, load_config, paths, video_settings
+from scripts.utils.frame_catalog import load_catalog
+from scripts.utils.framepack import pack_folder, pack_path, remove_frames
+from scripts.utils.ffmpeg import (
+    FRAME_NAMING, FFmpegJob, PIPE_MODES, extract_frames_args, fill_frames_args, run_jobs, report_failures, streams_frames,
+)
+from scripts.utils.manifest import Manifest
+from scripts.utils.metrics import StageMetrics
+from scripts.utils.shard import add_shard_arg, frames_video, stage_name
+
+def extract_job(ff: str, vid: Path, out_dir: Path, fx: dict) -> FFmpegJob:
+    """One extraction job for `vid`, sampled per the `frame_extract:` config block."""
+    mode = fx.get("mode", "nth")
+    jpeg_q = int(fx["jpeg_q"])
+    min_frames = int(fx.get("min_frames", 0))
+    max_frames = int(fx.get("max_frames", 0))
+    followup = None
+    if mode in ("scene", "keyframes") and min_frames > 0:
+        def followup():
+            have = sum(1 for _ in out_dir.glob("*.jpg"))
+            return fill_frames_args(ff, vid, out_dir, jpeg_q=jpeg_q, have=have,
+                                    min_frames=min_frames, max_frames=max_frames)
+    args = extract_frames_args(
+        ff, vid, out_dir,
+        fps=fx.get("fps") or None,
+        jpeg_q=jpeg_q,
+        mode=mode,
+        every_nth=int(fx.get("every_nth_frame", 1)),
+        scene_threshold=float(fx.get("scene_threshold", 0.3)),
+        max_frames=max_frames,
+    )
+    finalize = (lambda: pack_folder(out_dir)) if fx.get("pack") else None
+    return FFmpegJob(f"{vid.name} -> {out_dir}", args, mkdirs=(out_dir,), followup=followup, finalize=finalize)
+
+def frames_output(out_dir: Path, fx: dict) -> Path:
+    """What extraction leaves on disk for `out_dir`: the folder, or its pack."""
+    return pack_path(out_dir) if fx.get("pack") else out_dir
+
+def frame_sources(p: dict) -> list:
+    """(video file, frames folder) pairs for every upscaled clip and normalized video."""
+    pairs = [
+        (clip, clip_frames_dir(p["frames_root"], clip.parent.name, clip.stem))
+        for clip in sorted(Path(p["upscaled"]).glob("*/clip_*.mp4"))
+    ]
+    pairs += [(vid, p["frames_root"] / vid.stem) for vid in sorted(Path(p["normalized_videos"]).glob("*.mp4"))]
+    return pairs
 
 def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--jobs", type=int, default=0, help="Concurrent ffmpeg processes (0 = auto)")
+    ap.add_argument("--threads", type=int, default=0, help="Threads per ffmpeg process (0 = cores / jobs)")
+    ap.add_argument("--force", action="store_true", help="Ignore the manifest and re-extract every video")
+    add_shard_arg(ap)
+    args = ap.parse_args()
+
     cfg = load_config()
     p = paths(cfg)
     ff = cfg["paths"]["ffmpeg_bin"]
-    fps = int(cfg["video_norm"]["fps"])
-    jpeg_q = int(cfg["frame_extract"]["jpeg_q"])
+    fx = cfg["frame_extract"]
+    if streams_frames(fx):
+        print("[frames] frame_extract.from_video: frames are decoded by 25_dedup_frames.py / 30_tag_wd14.py; "
+              "JPEGs are written for kept frames only")
+        return 0
+    video = video_settings(cfg)
+    if video.single_pass and video.single_pass_frames:
+        print("[frames] video.single_pass_frames: 08_split_review.py already extracted the frames")
+        return 0
+    if fx.get("from_video"):
+        print(f"[frames] from_video needs mode in {PIPE_MODES}; extracting JPEGs for mode {fx.get('mode')!r}")
 
-    for vid in Path(p["normalized_videos"]).glob("*.mp4"):
-        out_dir = p["frames_root"] / vid.stem
-        print(f"[frames] {vid.name} -> {out_dir}")
-        extract_frames(ff, vid, out_dir, fps=fps, jpeg_q=jpeg_q)
+    section = {**fx, "naming": FRAME_NAMING}
+    manifest = Manifest.for_stage(p["work_root"], stage_name("frames", args.shard), section, force=args.force)
+    sources = frame_sources(p)
+    if args.shard:
+        total, sources = len(sources), args.shard.select(sources, lambda src: frames_video(src[1]))
+        print(f"[frames] shard {args.shard.tag}: {len(sources)} of {total} videos/clips")
+    for stale in manifest.prune([vid for vid, _ in sources]):
+        print(f"[frames] pruned {stale}")
+    jobs, todo = [], []
+    for vid, out_dir in sources:
+        if manifest.is_fresh(vid, [frames_output(out_dir, fx)]):
+            continue
+        remove_frames(out_dir)  # a shorter re-encode must not leave old frames behind
+        todo.append((vid, out_dir))
+        jobs.append(extract_job(ff, vid, out_dir, fx))
+    print(f"[frames] {len(jobs)} to extract, {len(sources) - len(jobs)} up to date")
+    with StageMetrics("frames", p["work_root"]) as m:
+        results = run_jobs(jobs, max_workers=args.jobs, threads=args.threads, tag="frames")
+        m.jobs(results)
+        m.add_read(*(vid for vid, _ in todo))
+        m.add_written(*(frames_output(out_dir, fx) for _, out_dir in todo))
+    for (vid, out_dir), r in zip(todo, results):
+        if r.ok:
+            manifest.record(vid, [frames_output(out_dir, fx)])
+        else:
+            manifest.forget(vid)
+    manifest.save()
+    if args.shard:
+        # Shards would race on one catalog file; the next unsharded stage refreshes it.
+        print("[frames] sharded run: frames_catalog.jsonl is refreshed by the next stage that reads it")
+    else:
+        print(f"[frames] catalog: {len(load_catalog(cfg, p))} frames -> {p['frames_catalog']}")
+    return report_failures(results, tag="frames")
 
 if __name__ == "__main__":
-    main()
+    raise SystemExit(main())
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Drop near-duplicate frames before tagging.
+
+- Hashes every frame of a video folder (pHash/dHash, vectorized) and clusters frames
+  within `dedup.max_distance` Hamming bits using a BK-tree index.
+- Writes data/frames_keep.jsonl; 30_tag_wd14.py and 60_emit_musubi_dataset.py only
+  process kept frames. Frames are never deleted, so the threshold can be re-tuned.
+- Folders unchanged since the last run are reused via the stage manifest (--force to redo).
+- With frame_extract.from_video (all/nth sampling) the clips are hashed straight from an
+  ffmpeg gray pipe instead, and only the kept frames are written as JPEGs (by frame index,
+  as 20_frame_extract.py would name them); dedup.enabled: false then keeps every sampled frame.
+- Packed folders (frame_extract.pack, scripts/utils/framepack.py) are hashed from their
+  memory-mapped pack; in from_video mode the kept frames are packed too.
+"""
+
+from __future__ import annotations
+from pathlib import Path
+from typing import Tuple
+import argparse, importlib, os, time
+import numpy as np
+import ujson
+from scripts.utils.paths import load_config, paths
+from scripts.utils.ffmpeg import FFmpegJob, report_failures, run_jobs, select_frames_args, streams_frames
+from scripts.utils.manifest import Manifest
+from scripts.utils.metrics import StageMetrics
+from scripts.utils.dedup import cluster, hash_images, hash_video, keep_row
+from scripts.utils.keeplist import load_keep_rows
+from scripts.utils.framepack import folder_file, folder_frames, frame_folders, pack_folder, remove_frames
+
+def dedup_folder(folder: Path, dcfg: dict) -> dict:
+    """Hash + cluster one frames/<video>/ folder (loose or packed) and return its keep-list row."""
+    names = folder_frames(folder)
+    hashes = hash_images([folder / n for n in names], dcfg.get("hash", "phash"), int(dcfg.get("workers", 4)))
+    rep = cluster(hashes, int(dcfg.get("max_distance", 4)))
+    return keep_row(folder.name, names, rep)
+
+def dedup_video(ff: str, clip: Path, out_dir: Path, dcfg: dict, fx: dict) -> Tuple[dict, FFmpegJob]:
+    """Hash + cluster one clip from a raw pipe; return its keep-list row and the kept-JPEG job."""
+    mode = fx.get("mode", "nth")
+    fps = fx.get("fps") or None
+    indices, hashes = hash_video(
+        ff, clip, dcfg.get("hash", "phash"),
+        fps=fps, mode=mode,
+        every_nth=int(fx.get("every_nth_frame", 1)),
+        max_frames=int(fx.get("max_frames", 0)),
+    )
+    if dcfg.get("enabled", True):
+        rep = cluster(hashes, int(dcfg.get("max_distance", 4)))
+    else:
+        rep = np.arange(len(hashes))
+    row = keep_row(out_dir.name, [f"frame_{i:06d}.jpg" for i in indices], rep)
+    kept = [indices[i] for i in range(len(indices)) if rep[i] == i]
+    args = select_frames_args(ff, clip, out_dir, kept, fps=fps, jpeg_q=int(fx["jpeg_q"]))
+    finalize = (lambda: pack_folder(out_dir)) if fx.get("pack") else None
+    return row, FFmpegJob(f"{clip.name} -> {out_dir} ({len(kept)} kept)", args, mkdirs=(out_dir,), finalize=finalize)
+
+def dedup_clips(cfg: dict, p: dict, force: bool) -> int:
+    """frame_extract.from_video: dedup every clip from its video and write the kept frames."""
+    from tqdm import tqdm
+
+    frames_mod = importlib.import_module("scripts.20_frame_extract")
+    ff = cfg["paths"]["ffmpeg_bin"]
+    dcfg, fx = cfg.get("dedup", {}), cfg["frame_extract"]
+    out = p["frames_keep"]
+    sources = frames_mod.frame_sources(p)
+    section = {k: v for k, v in dcfg.items() if k != "workers"}
+    section["frame_extract"] = fx
+    manifest = Manifest.for_stage(p["work_root"], "dedup", section, force=force)
+    for stale in manifest.prune([clip for clip, _ in sources]):
+        print(f"[dedup] pruned {stale}")
+    prev = {} if force else load_keep_rows(out)
+
+    rows, jobs, todo = [], [], []
+    with StageMetrics("dedup", p["work_root"]) as m:
+        for clip, out_dir in tqdm(sources, desc="dedup (video)"):
+            row = prev.get(out_dir.name)
+            if row is None or not manifest.is_fresh(clip, [frames_mod.frames_output(out_dir, fx)]):
+                t0 = time.perf_counter()
+                remove_frames(out_dir)
+                row, job = dedup_video(ff, clip, out_dir, dcfg, fx)
+                jobs.append(job)
+                todo.append((clip, out_dir))
+                m.add_items(row["total"])
+                m.add_read(clip)
+                m.item(out_dir.name, time.perf_counter() - t0, frames=row["total"], kept=len(row["keep"]))
+            rows.append(row)
+        results = run_jobs(jobs, tag="dedup")
+        m.jobs(results)
+        m.add_written(*(frames_mod.frames_output(out_dir, fx) for _, out_dir in todo))
+    failed = {clip for (clip, _), r in zip(todo, results) if not r.ok}
+    tmp = out.with_suffix(".jsonl.tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        for (clip, _), row in zip(sources, rows):
+            if clip not in failed:
+                ujson.dump(row, f)
+                f.write("\n")
+    os.replace(tmp, out)
+    for clip, out_dir in sources:
+        if clip in failed:
+            manifest.forget(clip)
+        else:
+            manifest.record(clip, [frames_mod.frames_output(out_dir, fx)])
+    manifest.save()
+    total = sum(r["total"] for r in rows)
+    kept = sum(len(r["keep"]) for r in rows)
+    ratio = total / kept if kept else 0.0
+    print(f"[dedup] kept {kept}/{total} frames ({ratio:.1f}x reduction), "
+          f"JPEGs written for kept frames only -> {out}")
+    return report_failures(results, tag="dedup")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--force", action="store_true", help="Ignore the manifest and re-hash every folder")
+    args = ap.parse_args()
+
+    cfg = load_config()
+    p = paths(cfg)
+    dcfg = cfg.get("dedup", {})
+    out = p["frames_keep"]
+    if streams_frames(cfg["frame_extract"]):
+        return dedup_clips(cfg, p, args.force)
+    if not dcfg.get("enabled", True):
+        if out.exists():
+            out.unlink()  # no keep-list = downstream stages use every frame
+        print("[dedup] disabled; all frames will be used")
+        return
+
+    folders = frame_folders(p["frames_root"])
+    entries = {folder.name: folder_file(folder) for folder in folders}  # pack or directory
+    section = {k: v for k, v in dcfg.items() if k != "workers"}
+    manifest = Manifest.for_stage(p["work_root"], "dedup", section, force=args.force)
+    manifest.prune(entries.values(), delete_outputs=False)
+    prev = {} if args.force else load_keep_rows(out)
+
+    from tqdm import tqdm
+
+    total = kept = 0
+    tmp = out.with_suffix(".jsonl.tmp")
+    with StageMetrics("dedup", p["work_root"]) as m, tmp.open("w", encoding="utf-8") as f:
+        for folder in tqdm(folders, desc="dedup"):
+            row = prev.get(folder.name)
+            if row is None or not manifest.is_fresh(entries[folder.name], [out]):
+                t0 = time.perf_counter()
+                row = dedup_folder(folder, dcfg)
+                m.add_items(row["total"])
+                m.add_read(entries[folder.name])
+                m.item(folder.name, time.perf_counter() - t0, frames=row["total"], kept=len(row["keep"]))
+            total += row["total"]
+            kept += len(row["keep"])
+            ujson.dump(row, f)
+            f.write("\n")
+        f.flush()
+        m.add_written(tmp)
+    os.replace(tmp, out)
+    for entry in entries.values():
+        manifest.record(entry, [out])
+    manifest.save()
+    ratio = total / kept if kept else 0.0
+    print(f"[dedup] kept {kept}/{total} frames ({ratio:.1f}x reduction) -> {out}")
+
+if __name__ == "__main__":
+    raise SystemExit(main())
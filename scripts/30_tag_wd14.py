@@ -2,41 +2,180 @@
 """
 Run WD14 (ONNX) over extracted frames to produce automatic tags.
 
-- This file includes a STUB inference function to keep the repo runnable end-to-end.
-- Replace `dummy_wd14_infer` with a real onnxruntime session using your preferred WD14 model(s).
+- Uses the batched onnxruntime tagger in scripts/utils/wd14.py when
+  <wd14.model_dir>/model.onnx and selected_tags.csv exist; otherwise falls back to
+  the `dummy_wd14_infer` STUB so the repo stays runnable end-to-end (--stub forces it).
 - Output: data/tags_raw/wd14.jsonl  with rows: {"image": str, "tags": [["tag", score], ...]}
+  (data/tags_raw/wd14.tags columnar store when `tag_store.enabled`).
+- Only frames on the dedup keep-list (data/frames_keep.jsonl) are tagged, if it exists.
+- Frames tagged by a previous run (same file, same wd14 config) are reused, not re-inferred.
+- With frame_extract.from_video the ONNX engine reads kept frames from their clips through
+  an rgb24 pipe (pad/resize done in ffmpeg) instead of decoding the JPEGs; frames it cannot
+  locate in a clip fall back to the JPEG path.
+- --shard i/N only tags frames of the videos in shard i (scripts/utils/shard.py) and writes
+  data/tags_raw/wd14.<i>of<N>.jsonl, which 40_merge_tags.py picks up with the other shards.
+- Packed frame folders (frame_extract.pack) are listed from their pack index and decoded from
+  the memory-mapped pack; a pack is one manifest entry for all of its frames.
 """
 
 from __future__ import annotations
 from pathlib import Path
-import ujson
-from tqdm import tqdm
-from scripts.utils.paths import load_config, paths
+from itertools import islice
+import argparse, re, time
+from scripts.utils.paths import frames_source, load_config, paths
+from scripts.utils.ffmpeg import FrameReader, sample_filters, select_filter, streams_frames
+from scripts.utils.manifest import Manifest
+from scripts.utils.metrics import StageMetrics
+from scripts.utils.keeplist import filter_kept, load_keep_set
+from scripts.utils.framepack import frame_entry, list_frames
+from scripts.utils.shard import add_shard_arg, frames_video, shard_output, stage_name
+from scripts.utils.tagstore import read_tags, tags_output, use_store, write_tags
 
 def dummy_wd14_infer(image_path: Path):
-    """
-    Placeholder that returns a few generic tags with confidences.
-    Swap in real ONNX inference:
-      - import onnxruntime as ort
-      - session = ort.InferenceSession('models/wd14/<model>.onnx', providers=['CUDAExecutionProvider'])
-      - preprocess image -> input tensor
-      - outputs -> decode -> list[(tag, score)]
-    """
+    """Placeholder that returns a few generic tags with confidences (used without a model)."""
     return [("outdoor", 0.92), ("landscape", 0.88), ("tree", 0.81)]
 
+def load_previous(out: Path) -> dict:
+    """image -> tags from an earlier run of this stage in either format (empty if none)."""
+    for path in (tags_output(out, True), tags_output(out, False)):
+        if path.exists():
+            return dict(read_tags(path))
+    return {}
+
+def make_tagger(wcfg: dict):
+    """Build the ONNX tagger from the `wd14:` config block, or None if no model is installed."""
+    model_dir = Path(wcfg["model_dir"])
+    model = model_dir / wcfg.get("model_file", "model.onnx")
+    tags_csv = model_dir / wcfg.get("tags_file", "selected_tags.csv")
+    if not (model.exists() and tags_csv.exists()):
+        return None
+    from scripts.utils.wd14 import WD14Tagger
+    return WD14Tagger(
+        model, tags_csv,
+        threshold_general=float(wcfg["threshold_general"]),
+        threshold_character=float(wcfg["threshold_character"]),
+        topk=int(wcfg["topk"]),
+        providers=wcfg.get("providers", ["CUDAExecutionProvider", "CPUExecutionProvider"]),
+    )
+
+def run_tagger(tagger, images: list, wcfg: dict) -> dict:
+    """Tag `images` with the stub or the ONNX engine; return str(image) -> tags."""
+    from tqdm import tqdm
+
+    out = {}
+    if tagger is None:
+        for img in tqdm(images, desc="WD14 tagging (stub)"):
+            out[str(img)] = dummy_wd14_infer(img)
+        return out
+    t0 = time.perf_counter()
+    stream = tagger.tag_paths(
+        images,
+        batch_size=int(wcfg["batch_size"]),
+        decode_workers=int(wcfg.get("decode_workers", 4)),
+        prefetch=int(wcfg.get("prefetch_batches", 4)),
+    )
+    for img, tags in tqdm(stream, total=len(images), desc="WD14 tagging"):
+        out[str(img)] = tags
+    wall = time.perf_counter() - t0
+    if images:
+        print(f"[wd14] {len(images)} images in {wall:.1f}s: "
+              f"{len(images) / wall:.1f} img/s end-to-end, {tagger.images_per_sec:.1f} img/s inference")
+    return out
+
+_FRAME_FILE = re.compile(r"frame_(\d+)\.jpg")
+
+def tag_video_frames(tagger, images: list, cfg: dict, p: dict) -> dict:
+    """Tag `images` (kept frame files) by decoding them from their source clips; return str(image) -> tags."""
+    from tqdm import tqdm
+
+    ff = cfg["paths"]["ffmpeg_bin"]
+    wcfg, fx = cfg["wd14"], cfg["frame_extract"]
+    by_folder: dict = {}
+    for img in images:
+        m = _FRAME_FILE.fullmatch(Path(img).name)
+        if m:
+            by_folder.setdefault(Path(img).parent.name, {})[int(m.group(1))] = img
+    out = {}
+    t0 = time.perf_counter()
+    with tqdm(total=len(images), desc="WD14 tagging (video)") as bar:
+        for folder, frames in by_folder.items():
+            src = frames_source(p, folder)
+            if not src.exists():
+                continue
+            order = sorted(frames)
+            vf = ",".join(sample_filters(fps=fx.get("fps") or None) + [select_filter(order), tagger.video_filter()])
+            keys = iter(frames[i] for i in order)
+            with FrameReader(ff, src, size=(tagger.size, tagger.size), vf=vf,
+                             batch=int(wcfg["batch_size"])) as reader:
+                batches = ((list(islice(keys, len(b))), b) for b in reader.batches())
+                for img, tags in tagger.tag_frames(batches):
+                    out[str(img)] = tags
+                    bar.update()
+    wall = time.perf_counter() - t0
+    if out:
+        print(f"[wd14] {len(out)} frames from video in {wall:.1f}s: "
+              f"{len(out) / wall:.1f} img/s end-to-end, {tagger.images_per_sec:.1f} img/s inference")
+    rest = [img for img in images if str(img) not in out]
+    if rest:
+        out.update(run_tagger(tagger, rest, wcfg))
+    return out
+
+def tag_images(tagger, images: list, cfg: dict, p: dict) -> dict:
+    """`run_tagger`, or `tag_video_frames` when frame_extract.from_video applies to the ONNX engine."""
+    if tagger is not None and streams_frames(cfg["frame_extract"]):
+        return tag_video_frames(tagger, images, cfg, p)
+    return run_tagger(tagger, images, cfg["wd14"])
+
 def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--force", action="store_true", help="Ignore the manifest and re-tag every frame")
+    ap.add_argument("--stub", action="store_true", help="Use the dummy tagger even if a model is installed")
+    add_shard_arg(ap)
+    args = ap.parse_args()
+
     cfg = load_config()
     p = paths(cfg)
-    out = p["tags_raw"] / "wd14.jsonl"
+    wcfg = cfg["wd14"]
+    columnar = use_store(cfg)
+    out = tags_output(shard_output(p["tags_raw"] / "wd14.jsonl", args.shard), columnar)
     out.parent.mkdir(parents=True, exist_ok=True)
 
-    images = sorted(Path(p["frames_root"]).glob("*/*.jpg"))
-    with out.open("w", encoding="utf-8") as f:
-        for img in tqdm(images, desc="WD14 tagging (stub)"):
-            tags = dummy_wd14_infer(img)
-            ujson.dump({"image": str(img), "tags": tags}, f)
-            f.write("\n")
-    print(f"[wd14] wrote: {out}")
+    tagger = None if args.stub else make_tagger(wcfg)
+    if tagger is None:
+        print("[wd14] no ONNX model found (or --stub); using the stub tagger")
+
+    images = filter_kept(list_frames(p["frames_root"]), load_keep_set(p["frames_keep"]))
+    if args.shard:
+        total, images = len(images), args.shard.select(images, lambda img: frames_video(img.parent))
+        print(f"[wd14] shard {args.shard.tag}: {len(images)} of {total} frames")
+    # Throughput knobs (batch size, workers, providers) don't change results.
+    perf_keys = {"batch_size", "decode_workers", "prefetch_batches", "providers"}
+    section = {k: v for k, v in wcfg.items() if k not in perf_keys}
+    section["engine"] = "stub" if tagger is None else "onnx"
+    if tagger is not None and streams_frames(cfg["frame_extract"]):
+        section["source"] = "video"  # pipe-decoded pixels differ slightly from the JPEGs
+    manifest = Manifest.for_stage(p["work_root"], stage_name("wd14", args.shard), section, force=args.force)
+    entries = [frame_entry(img) for img in images]  # frame file, or the pack holding it
+    manifest.prune(entries, delete_outputs=False)  # rows of vanished frames are dropped on rewrite
+    prev = {} if args.force else load_previous(out)
+
+    # After a tag_store.enabled switch the previous output is the other format; reuse it.
+    have = out if out.exists() else tags_output(out, not columnar)
+    fresh = {e: manifest.is_fresh(e, [have]) for e in dict.fromkeys(entries)}
+    todo = [img for img, e in zip(images, entries) if not (str(img) in prev and fresh[e])]
+    with StageMetrics("wd14", p["work_root"]) as m:
+        tagged = tag_images(tagger, todo, cfg, p)
+        m.add_items(len(todo))
+        m.add_read(*dict.fromkeys(frame_entry(img) for img in todo))
+        if tagger is not None:
+            m.extra["inference_img_per_s"] = round(tagger.images_per_sec, 2)
+        rows = ((str(img), tagged[str(img)] if str(img) in tagged else prev[str(img)]) for img in images)
+        write_tags(out, rows, columnar=columnar)
+        m.add_written(out)
+    for e in fresh:
+        manifest.record(e, [out])
+    manifest.save()
+    print(f"[wd14] wrote: {out} ({len(todo)} tagged, {len(images) - len(todo)} reused)")
 
 if __name__ == "__main__":
     main()
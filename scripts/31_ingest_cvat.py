@@ -6,42 +6,51 @@ Usage:
   python scripts/31_ingest_cvat.py --export exporters_examples/cvat_export_example.zip --format cvat
 
 Notes:
-  - Adjust `parse_cvat_zip` to match your chosen export format (CVAT XML, COCO, etc.).
+  - Exports are streamed (scripts/utils/exports.py): CVAT XML 1.1, COCO and the demo captions.json,
+    inside a zip or as bare files. `--format cvat` detects the reader per file; xml/coco/captions force one.
+  - Several `--export` files are parsed in parallel when `ingest.workers` > 1.
   - We expect to produce lines: {"image": "<rel or abs path>", "tags": [["tag", 0.99], ...]}
+  - Tags are canonicalized via the synonym index (scripts/utils/synonyms.py).
+  - Image names are mapped onto extracted frames via the frame catalog (scripts/utils/frame_catalog.py).
 """
 
 from __future__ import annotations
+from functools import partial
 from pathlib import Path
-import argparse, zipfile, json, ujson
+import argparse
 from scripts.utils.paths import load_config, paths
-
-def parse_cvat_zip(zp: Path):
-    """Return mapping image_path -> set(tags). This is a minimal demo parser for a captions.json inside the zip."""
-    tags_by_image = {}
-    with zipfile.ZipFile(zp, "r") as zf:
-        for name in zf.namelist():
-            if name.endswith("captions.json"):
-                data = json.loads(zf.read(name).decode("utf-8"))
-                for rec in data:
-                    tags_by_image.setdefault(rec["image"], set()).update(rec["tags"])
-    return tags_by_image
+from scripts.utils.exports import cvat_records, ingest_exports
+from scripts.utils.frame_catalog import load_catalog
+from scripts.utils.metrics import StageMetrics
+from scripts.utils.synonyms import load_index
+from scripts.utils.tagstore import tags_output, use_store, write_tags
 
 def main():
+    cfg = load_config()
+    icfg = cfg.get("ingest", {})
     ap = argparse.ArgumentParser()
-    ap.add_argument("--export", required=True, help="Path to CVAT export .zip")
-    ap.add_argument("--format", default="cvat")
+    ap.add_argument("--export", required=True, nargs="+", help="Path(s) to CVAT export .zip / .xml / .json")
+    ap.add_argument("--format", default="cvat", choices=("cvat", "auto", "xml", "coco", "captions"))
+    ap.add_argument("--workers", type=int, default=int(icfg.get("workers", 0)))
     args = ap.parse_args()
 
-    cfg = load_config()
     p = paths(cfg)
-    out = p["tags_raw"] / "cvat.jsonl"
+    out = tags_output(p["tags_raw"] / "cvat.jsonl", use_store(cfg))
     out.parent.mkdir(parents=True, exist_ok=True)
-
-    mapping = parse_cvat_zip(Path(args.export))
-    with out.open("w", encoding="utf-8") as f:
-        for img, tags in mapping.items():
-            ujson.dump({"image": img, "tags": [[t, 0.99] for t in sorted(tags)]}, f)
-            f.write("\n")
+    exports = [Path(e) for e in args.export]
+
+    with StageMetrics("ingest_cvat", p["work_root"]) as m:
+        catalog = load_catalog(cfg, p)
+        rows = ingest_exports(
+            partial(cvat_records, fmt=args.format), exports, load_index(cfg, p["work_root"]),
+            resolve=catalog.canonical_image,
+            workers=args.workers, chunk_rows=int(icfg.get("chunk_rows", 200_000)), tmp_dir=p["tags_raw"],
+        )
+        m.add_items(write_tags(out, ((img, [[t, 0.99] for t in tags]) for img, tags in rows), columnar=use_store(cfg)))
+        m.add_read(*exports)
+        m.add_written(out)
+        m.extra.update(catalog.stats)
+    print(catalog.summary("cvat"))
     print(f"[cvat] wrote: {out}")
 
 if __name__ == "__main__":
@@ -2,42 +2,47 @@
 """
 Ingest VIAME CSV/kw18-like exports into JSONL.
 
-- We map class/attributes into simple string tags.
+- We map class/attributes into simple string tags, canonicalized via the synonym index.
+- The CSV is streamed row by row; rows of the same image are unioned (scripts/utils/exports.py).
+- Image names are mapped onto extracted frames via the frame catalog (scripts/utils/frame_catalog.py).
+- Several `--export` files are parsed in parallel when `ingest.workers` > 1.
 """
 
 from __future__ import annotations
 from pathlib import Path
-import argparse, csv, ujson
+import argparse
 from scripts.utils.paths import load_config, paths
-from scripts.utils.tagging_common import norm_tag
+from scripts.utils.exports import ingest_exports, viame_records
+from scripts.utils.frame_catalog import load_catalog
+from scripts.utils.metrics import StageMetrics
+from scripts.utils.synonyms import load_index
+from scripts.utils.tagstore import tags_output, use_store, write_tags
 
 def main():
+    cfg = load_config()
+    icfg = cfg.get("ingest", {})
     ap = argparse.ArgumentParser()
-    ap.add_argument("--export", required=True, help="Path to VIAME CSV")
+    ap.add_argument("--export", required=True, nargs="+", help="Path(s) to VIAME CSV")
+    ap.add_argument("--workers", type=int, default=int(icfg.get("workers", 0)))
     args = ap.parse_args()
 
-    cfg = load_config()
     p = paths(cfg)
-    out = p["tags_raw"] / "viame.jsonl"
+    out = tags_output(p["tags_raw"] / "viame.jsonl", use_store(cfg))
     out.parent.mkdir(parents=True, exist_ok=True)
+    exports = [Path(e) for e in args.export]
 
-    with open(args.export, "r", encoding="utf-8") as f, out.open("w", encoding="utf-8") as fout:
-        rd = csv.DictReader(f)
-        for row in rd:
-            image = row.get("image") or row.get("filename") or ""
-            if not image:
-                continue
-            raw = [row.get("class"), row.get("attributes")]
-            tags = []
-            for s in raw:
-                if not s: 
-                    continue
-                for tok in s.replace(";", ",").split(","):
-                    t = norm_tag(tok)
-                    if t:
-                        tags.append([t, 0.95])
-            ujson.dump({"image": image, "tags": tags}, fout)
-            fout.write("\n")
+    with StageMetrics("ingest_viame", p["work_root"]) as m:
+        catalog = load_catalog(cfg, p)
+        rows = ingest_exports(
+            viame_records, exports, load_index(cfg, p["work_root"]),
+            resolve=catalog.canonical_image,
+            workers=args.workers, chunk_rows=int(icfg.get("chunk_rows", 200_000)), tmp_dir=p["tags_raw"],
+        )
+        m.add_items(write_tags(out, ((img, [[t, 0.95] for t in tags]) for img, tags in rows), columnar=use_store(cfg)))
+        m.add_read(*exports)
+        m.add_written(out)
+        m.extra.update(catalog.stats)
+    print(catalog.summary("viame"))
     print(f"[viame] wrote: {out}")
 
 if __name__ == "__main__":
@@ -1,37 +1,47 @@
 # -*- coding: utf-8 -*-
 """
-Ingest datagym-core JSON exports into JSONL.
+Ingest datagym-core JSON exports into JSONL (labels canonicalized via the synonym index).
+
+- The export array is decoded item by item, so its size does not bound memory (scripts/utils/exports.py).
+- Image names are mapped onto extracted frames via the frame catalog (scripts/utils/frame_catalog.py).
+- Several `--export` files are parsed in parallel when `ingest.workers` > 1.
 """
 
 from __future__ import annotations
 from pathlib import Path
-import argparse, json, ujson
+import argparse
 from scripts.utils.paths import load_config, paths
-from scripts.utils.tagging_common import norm_tag
+from scripts.utils.exports import datagym_records, ingest_exports
+from scripts.utils.frame_catalog import load_catalog
+from scripts.utils.metrics import StageMetrics
+from scripts.utils.synonyms import load_index
+from scripts.utils.tagstore import tags_output, use_store, write_tags
 
 def main():
+    cfg = load_config()
+    icfg = cfg.get("ingest", {})
     ap = argparse.ArgumentParser()
-    ap.add_argument("--export", required=True, help="Path to datagym-core JSON export")
+    ap.add_argument("--export", required=True, nargs="+", help="Path(s) to datagym-core JSON export")
+    ap.add_argument("--workers", type=int, default=int(icfg.get("workers", 0)))
     args = ap.parse_args()
 
-    cfg = load_config()
     p = paths(cfg)
-    out = p["tags_raw"] / "datagym.jsonl"
+    out = tags_output(p["tags_raw"] / "datagym.jsonl", use_store(cfg))
     out.parent.mkdir(parents=True, exist_ok=True)
+    exports = [Path(e) for e in args.export]
 
-    data = json.loads(Path(args.export).read_text(encoding="utf-8"))
-    with out.open("w", encoding="utf-8") as f:
-        for item in data:
-            image = item.get("image") or item.get("filename")
-            if not image:
-                continue
-            tags = []
-            for t in item.get("labels", []):
-                tag = norm_tag(str(t))
-                if tag:
-                    tags.append([tag, 0.97])
-            ujson.dump({"image": image, "tags": tags}, f)
-            f.write("\n")
+    with StageMetrics("ingest_datagym", p["work_root"]) as m:
+        catalog = load_catalog(cfg, p)
+        rows = ingest_exports(
+            datagym_records, exports, load_index(cfg, p["work_root"]),
+            resolve=catalog.canonical_image,
+            workers=args.workers, chunk_rows=int(icfg.get("chunk_rows", 200_000)), tmp_dir=p["tags_raw"],
+        )
+        m.add_items(write_tags(out, ((img, [[t, 0.97] for t in tags]) for img, tags in rows), columnar=use_store(cfg)))
+        m.add_read(*exports)
+        m.add_written(out)
+        m.extra.update(catalog.stats)
+    print(catalog.summary("datagym"))
     print(f"[datagym] wrote: {out}")
 
 if __name__ == "__main__":
@@ -4,43 +4,78 @@ Merge tag sources into a single JSONL with confidence-aware de-duplication.
 
 - For each image: keep the highest confidence per tag.
 - Tie-break with source frequency (tags seen from multiple tools rank higher).
+- Skipped entirely when no source file changed since the last merge (--force to redo).
+- `merge.streaming: true` (or --streaming) uses an external sort + k-way merge whose
+  peak memory is independent of dataset size; see scripts/utils/tag_merge.py.
+- `tag_store.enabled: true` merges with vectorized numpy ops (scripts/utils/tagstore.py) and
+  writes tags_merged/merged.tags (plus merged.jsonl when `tag_store.export_jsonl`).
+- Sources are tags_raw/*.jsonl files and/or *.tags columnar stores.
+- Tags are canonicalized through the synonym index (scripts/utils/synonyms.py): WD14
+  vocabulary variants (`merge.prefer_wd14_synonyms`) and the user alias file.
 """
 
 from __future__ import annotations
-from pathlib import Path
-import ujson, glob
-from collections import defaultdict, Counter
+import argparse
 from scripts.utils.paths import load_config, paths
+from scripts.utils.manifest import Manifest
+from scripts.utils.metrics import StageMetrics
+from scripts.utils.synonyms import load_index
+from scripts.utils.tag_merge import merge_in_memory, merge_streaming, write_merged
+from scripts.utils.tagstore import export_jsonl, merge_sources, save_table, tag_sources, use_store
 
 def main():
     cfg = load_config()
-    p = paths(cfg)
-    min_conf = float(cfg["merge"]["min_confidence"])
-
-    merged = defaultdict(lambda: {"tags": {}, "counts": Counter()})
-
-    for src in glob.glob(str(p["tags_raw"] / "*.jsonl")):
-        src_name = Path(src).stem
-        with open(src, "r", encoding="utf-8") as f:
-            for line in f:
-                row = ujson.loads(line)
-                img = row["image"]
-                for tag, score in row["tags"]:
-                    if score < min_conf:
-                        continue
-                    t = tag.strip().lower().replace(" ", "_")
-                    cur = merged[img]["tags"].get(t, 0.0)
-                    if score > cur:
-                        merged[img]["tags"][t] = score
-                    merged[img]["counts"][t] += 1
+    mcfg = cfg["merge"]
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--force", action="store_true", help="Re-merge even if no source changed")
+    ap.add_argument("--streaming", action="store_true", default=bool(mcfg.get("streaming", False)),
+                    help="Bounded-memory external-sort merge")
+    args = ap.parse_args()
 
+    p = paths(cfg)
+    min_conf = float(mcfg["min_confidence"])
     outp = p["tags_merged"]
-    with open(outp, "w", encoding="utf-8") as f:
-        for img, d in merged.items():
-            tags = sorted(d["tags"].items(), key=lambda x: (-x[1], -d["counts"][x[0]], x[0]))
-            ujson.dump({"image": img, "tags": tags}, f)
-            f.write("\n")
-    print(f"[merge] wrote: {outp}")
+    columnar = use_store(cfg)
+    store = outp.with_suffix(".tags")
+    export = not columnar or bool(cfg.get("tag_store", {}).get("export_jsonl", True))
+    outputs = ([store] if columnar else []) + ([outp] if export else [])
+
+    sources = tag_sources(p["tags_raw"])
+    norm = load_index(cfg, p["work_root"])
+    # Only settings that change the result invalidate the previous merge.
+    section = {k: v for k, v in mcfg.items() if k not in ("streaming", "sort_chunk_rows")}
+    section["outputs"] = [o.name for o in outputs]
+    section["synonyms"] = norm.signature  # vocabulary / alias file changes re-merge
+    manifest = Manifest.for_stage(p["work_root"], "merge", section, force=args.force)
+    removed = manifest.prune(sources, delete_outputs=False)
+    if not removed and sources and all(manifest.is_fresh(s, outputs) for s in sources):
+        print(f"[merge] up to date: {', '.join(map(str, outputs))}")
+        return
+
+    with StageMetrics("merge", p["work_root"]) as m:
+        if columnar:
+            table = merge_sources(sources, min_conf, norm=norm)
+            save_table(table, store)
+            n = export_jsonl(table.rows(), outp) if export else len(table)
+        elif args.streaming:
+            rows = merge_streaming(
+                sources, min_conf,
+                chunk_rows=int(mcfg.get("sort_chunk_rows", 200_000)),
+                tmp_dir=p["tags_merged_dir"],
+                norm=norm,
+            )
+        else:
+            rows = merge_in_memory(sources, min_conf, norm=norm)
+        if not columnar:
+            n = write_merged(outp, rows)
+        m.add_items(n)
+        m.add_read(*sources)
+        m.add_written(*outputs)
+
+    for src in sources:
+        manifest.record(src, outputs)
+    manifest.save()
+    print(f"[merge] wrote: {', '.join(map(str, outputs))} ({n} images)")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Temporal smoothing of merged frame tags + one caption per clip (runs after 40_merge_tags.py).
+
+- Groups merged frames by frames folder (video/clip) through the frame catalog and smooths
+  tag scores over a `aggregate.window_seconds` window (scripts/utils/clip_agg.py), so
+  near-identical frames stop flickering between captions.
+- Writes tags_merged/smoothed.jsonl (smoothed.tags with `tag_store.enabled`), same rows as
+  merged.jsonl; 50_clean_optimize.py captions it instead when `aggregate.caption_smoothed`.
+- Writes data/captions_clips.jsonl: one row per clip with its source video, frame count,
+  time span, aggregated tags and a caption built with the `clean:` rules and prefix.
+- Skipped when the merged tags and the relevant config are unchanged (--force to redo).
+"""
+
+from __future__ import annotations
+import argparse
+import ujson
+from scripts.utils.paths import frames_source, load_config, paths, split_frames_dirname
+from scripts.utils.caption_rules import CaptionBuilder, caption_options
+from scripts.utils.clip_agg import aggregate_table, smooth_options
+from scripts.utils.frame_catalog import load_catalog
+from scripts.utils.manifest import Manifest
+from scripts.utils.metrics import StageMetrics
+from scripts.utils.tagstore import export_jsonl, read_table, save_table, tags_output, use_store
+
+def frame_keys(table, catalog) -> list:
+    """(frames folder, timestamp) per row, or None for rows that are not extracted frames."""
+    keys = []
+    for image in table.images:
+        key = catalog.key(image)
+        if key is None:
+            keys.append(None)
+        else:
+            keys.append((key.split("/", 1)[0], catalog.info(key).timestamp))
+    return keys
+
+def clip_rows(clips, p: dict, builder: CaptionBuilder):
+    for c in clips:
+        video, clip = split_frames_dirname(c.folder)
+        yield {
+            "clip": c.folder, "video": video, "clip_id": clip,
+            "source": str(frames_source(p, c.folder)),
+            "frames": c.frames, "start_s": c.start_s, "end_s": c.end_s,
+            "tags": c.tags, "caption": builder.caption(c.tags),
+        }
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--force", action="store_true", help="Re-aggregate even if nothing changed")
+    args = ap.parse_args()
+
+    cfg = load_config()
+    p = paths(cfg)
+    columnar = use_store(cfg)
+    src = p["tags_merged"].with_suffix(".tags") if columnar else p["tags_merged"]
+    out = tags_output(p["tags_smoothed"], columnar)
+    opts = smooth_options(cfg)
+    section = {"aggregate": opts, "clean": caption_options(cfg), "fps": cfg.get("frame_extract", {}).get("fps")}
+    manifest = Manifest.for_stage(p["work_root"], "aggregate", section, force=args.force)
+    if not src.exists():
+        print(f"[aggregate] {src} not found; run 40_merge_tags.py first")
+        return 2
+    if manifest.is_fresh(src, [out, p["captions_clips"]]):
+        print(f"[aggregate] up to date: {out}, {p['captions_clips']}")
+        return 0
+
+    with StageMetrics("aggregate", p["work_root"]) as m:
+        table = read_table(src)
+        catalog = load_catalog(cfg, p)
+        smoothed, clips = aggregate_table(table, frame_keys(table, catalog), **opts)
+        if columnar:
+            save_table(smoothed, out)
+        else:
+            export_jsonl(smoothed.rows(), out)
+        builder = CaptionBuilder(**caption_options(cfg))
+        with open(p["captions_clips"], "w", encoding="utf-8") as f:
+            for row in clip_rows(clips, p, builder):
+                ujson.dump(row, f)
+                f.write("\n")
+        before, after = len(table.tag_ids), len(smoothed.tag_ids)
+        m.add_items(len(table))
+        m.add_read(src)
+        m.add_written(out, p["captions_clips"])
+        m.extra.update({"clips": len(clips), "tags_before": before, "tags_after": after})
+
+    manifest.record(src, [out, p["captions_clips"]])
+    manifest.save()
+    print(f"[aggregate] {len(table)} frames in {len(clips)} clips ({opts['method']}, "
+          f"{opts['window_seconds']:g}s window): {before} -> {after} frame tags")
+    print(f"[aggregate] wrote: {out}, {p['captions_clips']}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Fused tag half of the pipeline: merge -> caption -> Musubi dataset in one streaming pass.
+
+- Equivalent to 40_merge_tags.py + 50_clean_optimize.py + 60_emit_musubi_dataset.py --pack-mode image,
+  but rows flow through generators: each tags_raw source is parsed once, and no
+  intermediate JSONL is written or re-parsed.
+- --write-intermediates still writes merged.jsonl and captions_clean.jsonl (for debugging
+  or to keep the separate stages' inputs in sync).
+- Config and paths are loaded once for all three steps.
+- Sources may be JSONL or columnar stores; `tag_store.enabled` uses the vectorized merge.
+"""
+
+from __future__ import annotations
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+import argparse, time
+import ujson
+from scripts.utils.paths import load_config, paths
+from scripts.utils.caption_rules import CaptionBuilder, caption_options
+from scripts.utils.keeplist import load_keep_set
+from scripts.utils.frame_catalog import load_catalog
+from scripts.utils.linking import EMIT_MODES
+from scripts.utils.metrics import StageMetrics
+from scripts.utils.musubi import caption_map, emit_images, write_captions
+from scripts.utils.synonyms import load_index
+from scripts.utils.tag_merge import Merged, merge_in_memory, merge_streaming
+from scripts.utils.tagstore import merge_sources, tag_sources, use_store
+
+def tee_jsonl(rows: Iterator[Tuple[str, object]], path: Optional[Path], field: str) -> Iterator[Tuple[str, object]]:
+    """Pass (image, value) rows through, optionally mirroring them to a JSONL file."""
+    if path is None:
+        yield from rows
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        for img, value in rows:
+            ujson.dump({"image": img, field: value}, f)
+            f.write("\n")
+            yield img, value
+
+def captions(rows: Iterator[Merged], opts: dict) -> Iterator[Tuple[str, str]]:
+    builder = CaptionBuilder(**opts)  # memoizes the cleaned form of each distinct tag
+    for img, tags in rows:
+        yield img, builder.caption(tags)
+
+def main():
+    cfg = load_config()
+    mcfg = cfg["merge"]
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--write-intermediates", action="store_true",
+                    help="Also write merged.jsonl and captions_clean.jsonl")
+    ap.add_argument("--streaming", action="store_true", default=bool(mcfg.get("streaming", False)),
+                    help="Bounded-memory external-sort merge")
+    ap.add_argument("--mode", choices=EMIT_MODES, default=cfg["musubi"].get("emit_mode", "hardlink"))
+    ap.add_argument("--workers", type=int, default=int(cfg["musubi"].get("emit_workers", 8)))
+    args = ap.parse_args()
+
+    p = paths(cfg)
+    t0 = time.perf_counter()
+    with StageMetrics("fused", p["work_root"]) as m:
+        min_conf = float(mcfg["min_confidence"])
+        sources = tag_sources(p["tags_raw"])
+        norm = load_index(cfg, p["work_root"])
+        if use_store(cfg):
+            merged = merge_sources(sources, min_conf, norm=norm).rows()
+        elif args.streaming:
+            merged = merge_streaming(sources, min_conf, chunk_rows=int(mcfg.get("sort_chunk_rows", 200_000)),
+                                     tmp_dir=p["tags_merged_dir"], norm=norm)
+        else:
+            merged = merge_in_memory(sources, min_conf, norm=norm)
+
+        inter = args.write_intermediates
+        merged = tee_jsonl(merged, p["tags_merged"] if inter else None, "tags")
+        caps = tee_jsonl(captions(merged, caption_options(cfg)), p["captions_clean"] if inter else None, "caption")
+
+        keep = load_keep_set(p["frames_keep"])
+        cap_map, unresolved = caption_map(caps, load_catalog(cfg, p), keep)
+
+        out_root = p["musubi_root"]
+        out_root.mkdir(parents=True, exist_ok=True)
+        cap_map, stats = emit_images(out_root, p["frames_root"], cap_map, mode=args.mode, workers=args.workers)
+        if unresolved:
+            stats["unresolved"] = unresolved
+        write_captions(out_root, cap_map)
+        m.add_items(len(cap_map))
+        m.add_read(*sources)
+        m.extra.update(stats)
+
+    summary = ", ".join(f"{k}={v}" for k, v in sorted(stats.items()))
+    print(f"[fused] {len(sources)} sources -> {len(cap_map)} captioned images in "
+          f"{time.perf_counter() - t0:.1f}s ({summary})")
+    print(f"[fused] dataset ready at: {out_root}")
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,62 @@
 # -*- coding: utf-8 -*-
 """
 Create cleaned captions from merged tags and prepend activation keyword.
+
+- Skipped when merged.jsonl and the clean/prefix config are unchanged (--force to redo).
+- With `tag_store.enabled`, reads tags_merged/merged.tags (memory-mapped, no JSON parsing).
+- With `aggregate.caption_smoothed`, captions the temporally smoothed tags written by
+  42_aggregate_clips.py (tags_merged/smoothed.*) instead.
+- Captions are built in batches (caption_rules.CaptionBuilder): each distinct tag is cleaned
+  once; `clean.workers > 1` spreads JSONL chunks over a process pool. Output is identical
+  to calling `to_caption` per row.
 """
 
 from __future__ import annotations
+import argparse
 from scripts.utils.paths import load_config, paths
-from scripts.utils.caption_rules import to_caption
+from scripts.utils.caption_rules import CaptionBuilder, batch_captions, caption_options
+from scripts.utils.manifest import Manifest
+from scripts.utils.metrics import StageMetrics
+from scripts.utils.tagstore import iter_jsonl, load_table, use_store
 import ujson
 
 def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--force", action="store_true", help="Rebuild captions even if nothing changed")
+    args = ap.parse_args()
+
     cfg = load_config()
     p = paths(cfg)
-    with open(p["tags_merged"], "r", encoding="utf-8") as fin, \
-         open(p["captions_clean"], "w", encoding="utf-8") as fout:
-        for line in fin:
-            row = ujson.loads(line)
-            tags = row["tags"]
-            cap = to_caption(
-                tags,
-                lower=bool(cfg["clean"]["lowercase"]),
-                replace_underscores=bool(cfg["clean"]["replace_underscores"]),
-                strip_nsfb=bool(cfg["clean"]["strip_nsfb_tags"]),
-                max_tags=int(cfg["clean"]["max_tags"]),
-                prefix=cfg["musubi"].get("caption_prefix", "")
-            )
-            ujson.dump({"image": row["image"], "caption": cap}, fout)
-            fout.write("\n")
+    base = p["tags_smoothed"] if cfg.get("aggregate", {}).get("caption_smoothed") else p["tags_merged"]
+    src = base.with_suffix(".tags") if use_store(cfg) else base
+    ccfg = cfg["clean"]
+    # Batch size / workers don't change captions.
+    section = {"clean": {k: v for k, v in ccfg.items() if k not in ("workers", "chunk_rows")},
+               "prefix": cfg["musubi"].get("caption_prefix", ""), "source": base.name}
+    manifest = Manifest.for_stage(p["work_root"], "clean", section, force=args.force)
+    if not src.exists():
+        hint = "42_aggregate_clips.py" if base == p["tags_smoothed"] else "40_merge_tags.py"
+        print(f"[clean] {src} not found; run {hint} first")
+        return
+    if manifest.is_fresh(src, [p["captions_clean"]]):
+        print(f"[clean] up to date: {p['captions_clean']}")
+        return
+    with StageMetrics("clean", p["work_root"]) as m:
+        opts = caption_options(cfg)
+        chunk_rows = int(ccfg.get("chunk_rows", 50_000))
+        if use_store(cfg):
+            caps = CaptionBuilder(**opts).table_captions(load_table(src), chunk_rows=chunk_rows)
+        else:
+            caps = batch_captions(iter_jsonl(src), opts, chunk_rows=chunk_rows, workers=int(ccfg.get("workers", 0)))
+        with open(p["captions_clean"], "w", encoding="utf-8") as fout:
+            for image, cap in caps:
+                ujson.dump({"image": image, "caption": cap}, fout)
+                fout.write("\n")
+                m.add_items()
+        m.add_read(src)
+        m.add_written(p["captions_clean"])
+    manifest.record(src, [p["captions_clean"]])
+    manifest.save()
     print(f"[clean] wrote: {p['captions_clean']}")
 
 if __name__ == "__main__":
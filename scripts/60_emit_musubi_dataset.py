@@ -1,48 +1,102 @@
 # -*- coding: utf-8 -*-
 """
-Emit a Musubi‑Tuner dataset for WAN 2.1 training:
-- Copies frames to dataset/images/<video_id>/
+Emit a Musubi‑Tuner dataset for WAN 2.1 training (musubi.pack_mode / --pack-mode):
+
+image mode
+- Places captioned frames under dataset/images/<video_id>/ (musubi.emit_mode:
+  copy | hardlink | reflink | symlink, falling back to copy where unsupported); frames of
+  packed folders (frame_extract.pack) are written straight out of the memory-mapped pack
 - Writes captions.txt with "<relpath>\\t<caption>" lines
+- Maps caption rows to frames with the frame catalog (data/frames_catalog.jsonl).
+- Honors the dedup keep-list (data/frames_keep.jsonl): dropped frames are neither copied nor captioned.
+- Removes dataset images that no longer have a caption.
+
+video mode
+- Places the upscaled clips themselves under dataset/videos/<video>__<clip>.mp4 (same emit
+  modes) with a <video>__<clip>.txt caption from data/captions_clips.jsonl (42_aggregate_clips.py).
+- Checks each clip's fps, size and frame count against `video:` and `musubi.target_frames`
+  using the probe cache (data/.cache/media_info.json); mismatching clips are reported and skipped.
+- Writes dataset/dataset.toml for Musubi-Tuner and removes clips that no longer have a caption.
 """
 
 from __future__ import annotations
+import argparse, ujson
 from pathlib import Path
-import shutil, ujson
 from scripts.utils.paths import load_config, paths
+from scripts.utils.keeplist import load_keep_set
+from scripts.utils.frame_catalog import load_catalog
+from scripts.utils.linking import EMIT_MODES
+from scripts.utils.media_info import media_cache
+from scripts.utils.metrics import StageMetrics
+from scripts.utils.musubi import (PACK_MODES, caption_map, emit_images, emit_videos, write_captions,
+                                  write_dataset_toml)
+
+def emit_image_dataset(cfg: dict, p: dict, out_root: Path, args, m: StageMetrics):
+    keep = load_keep_set(p["frames_keep"])
+    # Captions drive emission: only captioned (and kept) frames end up in the dataset.
+    with open(p["captions_clean"], "r", encoding="utf-8") as f:
+        rows = ((row["image"], row["caption"]) for row in map(ujson.loads, f))
+        cap_map, unresolved = caption_map(rows, load_catalog(cfg, p), keep)
+
+    cap_map, stats = emit_images(out_root, p["frames_root"], cap_map, mode=args.mode, workers=args.workers)
+    if unresolved:
+        stats["unresolved"] = unresolved
+    write_captions(out_root, cap_map)
+    m.add_items(len(cap_map))
+    m.add_read(p["captions_clean"])
+    return len(cap_map), stats
+
+def emit_video_dataset(cfg: dict, p: dict, out_root: Path, args, m: StageMetrics):
+    mcfg, vcfg = cfg["musubi"], cfg["video"]
+    fps, size = float(vcfg["fps"]), int(vcfg["upscale_size"])
+    target_frames = [int(n) for n in mcfg.get("target_frames", [1, 25, 45])]
+    with open(p["captions_clips"], "r", encoding="utf-8") as f:
+        clips = {row["clip"]: (Path(row["source"]), row["caption"]) for row in map(ujson.loads, f)}
+
+    cache = media_cache(cfg, p["work_root"])
+    kept, stats, rejected = emit_videos(out_root, clips, cache.probe, fps=fps, size=size,
+                                        min_frames=max(target_frames), mode=args.mode, workers=args.workers)
+    cache.save()
+    for name, reason in rejected:
+        print(f"[musubi] skip {name}: {reason}")
+    toml = write_dataset_toml(out_root, size=size, fps=fps, target_frames=target_frames,
+                              frame_extraction=mcfg.get("frame_extraction", "head"),
+                              batch_size=int(mcfg.get("batch_size", 1)),
+                              num_repeats=int(mcfg.get("num_repeats", 1)))
+    print(f"[musubi] dataset config: {toml}")
+    m.add_items(len(kept))
+    m.add_read(p["captions_clips"])
+    return len(kept), stats
 
 def main():
     cfg = load_config()
+    mcfg = cfg["musubi"]
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pack-mode", choices=PACK_MODES, default=mcfg.get("pack_mode", "image"),
+                    help="image = captioned frames + captions.txt, video = clips + per-clip captions + dataset.toml")
+    ap.add_argument("--mode", choices=EMIT_MODES, default=mcfg.get("emit_mode", "hardlink"),
+                    help="How frames/clips are placed into the dataset")
+    ap.add_argument("--workers", type=int, default=int(mcfg.get("emit_workers", 8)))
+    args = ap.parse_args()
+
     p = paths(cfg)
     out_root = p["musubi_root"]
-
-    img_root = out_root / "images"
     out_root.mkdir(parents=True, exist_ok=True)
-    img_root.mkdir(parents=True, exist_ok=True)
-
-    # Copy frames preserving subfolders
-    for frame in (p["frames_root"]).glob("*/*.jpg"):
-        rel_dir = frame.parent.name
-        dst_dir = img_root / rel_dir
-        dst_dir.mkdir(parents=True, exist_ok=True)
-        dst = dst_dir / frame.name
-        if not dst.exists():
-            shutil.copy2(frame, dst)
-
-    # Build captions.txt
-    cap_map = {}
-    with open(p["captions_clean"], "r", encoding="utf-8") as f:
-        for line in f:
-            row = ujson.loads(line)
-            src = Path(row["image"])
-            rel_dir = src.parent.name
-            rel = Path("images") / rel_dir / src.name
-            cap_map[str(rel).replace("\\", "/")] = row["caption"]
+    video = args.pack_mode == "video"
+    if video and not p["captions_clips"].exists():
+        print(f"[musubi] {p['captions_clips']} not found; run 42_aggregate_clips.py first "
+              f"(or pass --pack-mode image)")
+        return 2
 
-    with open(out_root / "captions.txt", "w", encoding="utf-8") as f:
-        for rel, cap in sorted(cap_map.items()):
-            f.write(f"{rel}\t{cap}\n")
+    with StageMetrics("emit", p["work_root"]) as m:
+        emit = emit_video_dataset if video else emit_image_dataset
+        count, stats = emit(cfg, p, out_root, args, m)
+        m.extra.update(stats)
 
+    summary = ", ".join(f"{k}={v}" for k, v in sorted(stats.items()))
+    print(f"[musubi] {count} {'clips' if video else 'images'} ({summary})")
     print(f"[musubi] dataset ready at: {out_root}")
+    return 0
 
 if __name__ == "__main__":
-    main()
+    raise SystemExit(main())
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+Run several pipeline stages in one interpreter.
+
+Usage:
+  python -m scripts 20 25 30 40 42 50 60 [--arg 30=--stub] [--arg 60="--pack-mode image"]
+  python -m scripts                    # list the stages
+
+- Stages run in the given order, each through its own `main()` (scripts/utils/stages.py),
+  so chained small stages pay Python startup, imports and the config.yaml parse once.
+- Per-stage arguments go through --arg STAGE=ARGS (repeatable), as in run_shards.py.
+- Stops at the first stage that exits non-zero and returns its exit code. All stages
+  share one run report (data/reports/<run_id>.jsonl).
+"""
+
+from __future__ import annotations
+import argparse, time
+from scripts.utils.stages import list_stages, parse_stage_args, run_stage, stage_module
+
+def main() -> int:
+    ap = argparse.ArgumentParser(prog="python -m scripts")
+    ap.add_argument("stages", nargs="*", help="Stage numbers (e.g. 20 25 30) or run_pipeline / run_shards")
+    ap.add_argument("--arg", action="append", default=[], metavar="STAGE=ARGS",
+                    help="Extra arguments for one stage, e.g. --arg 30=--stub (repeatable)")
+    args = ap.parse_args()
+
+    if not args.stages:
+        for s in list_stages():
+            print(f"  {s}  {stage_module(s)}")
+        return 0
+    for s in args.stages:
+        stage_module(s)  # fail on a typo before anything runs
+    stage_args = parse_stage_args(args.arg)
+
+    t0 = time.perf_counter()
+    for s in args.stages:
+        step_t0 = time.perf_counter()
+        rc = run_stage(s, stage_args.get(s, []))
+        print(f"[scripts] {s} {'done' if rc == 0 else f'exited with {rc}'} in {time.perf_counter() - step_t0:.1f}s")
+        if rc != 0:
+            return rc
+    print(f"[scripts] {len(args.stages)} stage(s) done in {time.perf_counter() - t0:.1f}s")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
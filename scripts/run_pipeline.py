@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+"""
+Run the video half of the pipeline as a DAG of per-video task chains.
+
+Usage:
+  python -m scripts.run_pipeline [--concurrency split=2,upscale=4,extract=4,dedup=2,tag=1]
+
+- Each source video is a chain: split -> upscale -> extract -> dedup -> tag
+  (upscale is folded into split when video.single_pass is on).
+- Every stage has its own concurrency limit (pipeline.concurrency), so video B can be
+  transcoding while video A's frames are being tagged.
+- Completed tasks are recorded per stage in data/.manifests/pipeline.<stage>.json after
+  each task, so a crashed run resumes from the last completed task. When a stage re-runs,
+  every later stage of that video re-runs too.
+- Per-video dedup/tag results go to data/pipeline/{dedup,wd14}/<video>.jsonl and are
+  combined into data/frames_keep.jsonl and data/tags_raw/wd14.jsonl (or wd14.tags) at the end, and
+  data/frames_catalog.jsonl is refreshed; continue with 31-33 (optional), then 40/42/50/60 or
+  45_merge_clean_emit.py.
+- With frame_extract.from_video, extract is a no-op: dedup hashes each clip from a raw
+  pipe and writes only the kept frames as JPEGs, and the ONNX tagger reads them from the clip.
+- With frame_extract.pack, extract/dedup leave one frames/<video>__<clip>.tar per clip and
+  dedup/tag read frames from the memory-mapped packs.
+- Sources are probed up front (media_info cache) and started longest-first by predicted
+  clip count; conforming inputs are stream-copied/hardlinked (video.copy_conforming).
+- Prints per-stage timing at the end; per-task timings and ffmpeg fps/speed go to the
+  run report in data/reports/ (see scripts/utils/metrics.py).
+"""
+
+from __future__ import annotations
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+import argparse, importlib, os, shutil, sys, threading, time
+import ujson
+from scripts.utils.paths import clip_frames_dir, load_config, paths
+from scripts.utils.ffmpeg import FRAME_NAMING, FFmpegJob, cpu_count, run_job, streams_frames
+from scripts.utils.frame_catalog import load_catalog
+from scripts.utils.framepack import folder_file, folder_frames, remove_frames, video_frame_folders
+from scripts.utils.manifest import Manifest, remove_output
+from scripts.utils.media_info import media_cache
+from scripts.utils.metrics import StageMetrics
+from scripts.utils.tagstore import iter_jsonl, tags_output, use_store, write_tags
+
+STAGES = ("split", "upscale", "extract", "dedup", "tag")
+DEFAULT_CONCURRENCY = {"split": 2, "upscale": 4, "extract": 4, "dedup": 2, "tag": 1}
+
+split_mod = importlib.import_module("scripts.08_split_review")
+upscale_mod = importlib.import_module("scripts.10_upscale_normalize")
+frames_mod = importlib.import_module("scripts.20_frame_extract")
+dedup_mod = importlib.import_module("scripts.25_dedup_frames")
+tag_mod = importlib.import_module("scripts.30_tag_wd14")
+
+def parse_concurrency(spec: str, base: Dict[str, int]) -> Dict[str, int]:
+    """'split=2,tag=1' -> limits merged over `base`."""
+    out = dict(base)
+    for part in filter(None, (s.strip() for s in spec.split(","))):
+        k, _, v = part.partition("=")
+        if k not in STAGES:
+            raise SystemExit(f"[pipeline] unknown stage in --concurrency: {k}")
+        out[k] = max(1, int(v))
+    return out
+
+def write_jsonl(path: Path, rows) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".jsonl.tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        for row in rows:
+            ujson.dump(row, f)
+            f.write("\n")
+    os.replace(tmp, path)
+
+def concat_parts(parts: List[Path], out: Path) -> int:
+    """Concatenate per-video JSONL parts into one file (atomically); return part count."""
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_suffix(".jsonl.tmp")
+    n = 0
+    with tmp.open("wb") as f:
+        for part in parts:
+            if part.exists():
+                f.write(part.read_bytes())
+                n += 1
+    os.replace(tmp, out)
+    return n
+
+class Pipeline:
+    def __init__(self, cfg: dict, p: dict, limits: Dict[str, int], *, force: bool, threads: int,
+                 metrics: StageMetrics):
+        self.cfg, self.p = cfg, p
+        self.metrics = metrics
+        self.single_pass = bool(cfg.get("video", {}).get("single_pass", False))
+        self.from_video = streams_frames(cfg["frame_extract"])
+        self.stages = [s for s in STAGES if not (self.single_pass and s == "upscale")]
+        self.sem = {s: threading.Semaphore(limits[s]) for s in STAGES}
+        ffmpeg_slots = sum(limits[s] for s in ("split", "upscale", "extract"))
+        self.threads = threads or max(1, cpu_count() // ffmpeg_slots)
+        self.lock = threading.Lock()
+        self.parts = p["work_root"] / "pipeline"
+        sections = {
+            "split": cfg.get("video", {}),
+            "upscale": cfg.get("video", {}),
+            "extract": {**cfg.get("frame_extract", {}), "naming": FRAME_NAMING},
+            "dedup": {k: v for k, v in cfg.get("dedup", {}).items() if k != "workers"},
+            "tag": {k: v for k, v in cfg["wd14"].items()
+                    if k not in ("batch_size", "decode_workers", "prefetch_batches", "providers")},
+        }
+        self.manifests = {
+            s: Manifest.for_stage(p["work_root"], f"pipeline.{s}", sections[s], force=force)
+            for s in STAGES
+        }
+        self.media = media_cache(cfg, p["work_root"])
+        self.timing = {s: {"run": 0, "skip": 0, "fail": 0, "busy": 0.0} for s in STAGES}
+        self.errors: List[str] = []
+        self._tagger = None
+        self._tagger_ready = False
+
+    # -- per-stage outputs -------------------------------------------------
+
+    def clips_dir(self, src: Path) -> Path:
+        return self.p["upscaled"] / src.stem if self.single_pass else self.p["split_clips"] / src.stem
+
+    def upscaled_dir(self, src: Path) -> Path:
+        return self.p["upscaled"] / src.stem
+
+    def frame_dirs(self, src: Path) -> List[Path]:
+        return video_frame_folders(self.p["frames_root"], src.stem)
+
+    def outputs(self, stage: str, src: Path) -> List[Path]:
+        if stage == "split":
+            return [self.clips_dir(src)]
+        if stage == "upscale":
+            return [self.upscaled_dir(src)]
+        if stage == "extract":
+            return []  # recorded at completion (one folder per clip)
+        if stage == "dedup":
+            return [self.parts / "dedup" / f"{src.stem}.jsonl"]
+        return [self.parts / "wd14" / f"{src.stem}.jsonl"]
+
+    # -- stage bodies --------------------------------------------------------
+
+    def _ffmpeg(self, job: FFmpegJob) -> bool:
+        r = run_job(job, self.threads)
+        self.metrics.item(r.name, r.seconds, ok=r.ok, **r.progress)
+        if not r.ok:
+            self.errors.append(f"{r.name}: {r.error or f'rc={r.returncode}'}")
+        return r.ok
+
+    def do_split(self, src: Path) -> bool:
+        dst = self.clips_dir(src)
+        remove_output(dst)
+        info = split_mod.probe_source(src)
+        args = split_mod.single_pass_args(src, dst, info=info) if self.single_pass else split_mod.split_args(src, dst, info)
+        return self._ffmpeg(FFmpegJob(f"split {src.name}", args, mkdirs=(dst,)))
+
+    def do_upscale(self, src: Path) -> bool:
+        out_dir = self.upscaled_dir(src)
+        remove_output(out_dir)
+        for clip in sorted(self.clips_dir(src).glob("clip_*.mp4")):
+            job = upscale_mod.upscale_job(clip, out_dir / clip.name, self.media)
+            if job is not None and not self._ffmpeg(job):
+                return False
+        return True
+
+    def do_extract(self, src: Path) -> bool:
+        for d in self.frame_dirs(src):
+            remove_frames(d)
+        if self.from_video:
+            return True  # dedup reads the clips and writes the kept frames
+        ff = self.cfg["paths"]["ffmpeg_bin"]
+        fx = self.cfg["frame_extract"]
+        return all(
+            self._ffmpeg(frames_mod.extract_job(ff, clip, clip_frames_dir(self.p["frames_root"], src.stem, clip.stem), fx))
+            for clip in sorted(self.upscaled_dir(src).glob("clip_*.mp4"))
+        )
+
+    def do_dedup(self, src: Path) -> bool:
+        dcfg = self.cfg.get("dedup", {})
+        rows = []
+        if self.from_video:
+            ff = self.cfg["paths"]["ffmpeg_bin"]
+            for clip in sorted(self.upscaled_dir(src).glob("clip_*.mp4")):
+                out_dir = clip_frames_dir(self.p["frames_root"], src.stem, clip.stem)
+                row, job = dedup_mod.dedup_video(ff, clip, out_dir, dcfg, self.cfg["frame_extract"])
+                if not self._ffmpeg(job):
+                    return False
+                rows.append(row)
+            write_jsonl(self.outputs("dedup", src)[0], rows)
+            return True
+        for d in self.frame_dirs(src):
+            if dcfg.get("enabled", True):
+                rows.append(dedup_mod.dedup_folder(d, dcfg))
+            else:
+                names = folder_frames(d)
+                rows.append({"video": d.name, "total": len(names), "keep": names, "map": {}})
+        write_jsonl(self.outputs("dedup", src)[0], rows)
+        return True
+
+    def tagger(self):
+        with self.lock:
+            if not self._tagger_ready:
+                self._tagger = tag_mod.make_tagger(self.cfg["wd14"])
+                self._tagger_ready = True
+                if self._tagger is None:
+                    print("[pipeline] no ONNX model found; using the stub tagger")
+        return self._tagger
+
+    def do_tag(self, src: Path) -> bool:
+        images = []
+        with open(self.outputs("dedup", src)[0], "r", encoding="utf-8") as f:
+            for line in f:
+                row = ujson.loads(line)
+                images += [self.p["frames_root"] / row["video"] / n for n in row["keep"]]
+        tagged = tag_mod.tag_images(self.tagger(), images, self.cfg, self.p)
+        write_jsonl(self.outputs("tag", src)[0], ({"image": k, "tags": v} for k, v in tagged.items()))
+        return True
+
+    # -- scheduling ----------------------------------------------------------
+
+    def run_video(self, src: Path) -> bool:
+        upstream_ran = False
+        for stage in self.stages:
+            m = self.manifests[stage]
+            with self.lock:
+                fresh = not upstream_ran and m.is_fresh(src, self.outputs(stage, src))
+            if fresh:
+                with self.lock:
+                    self.timing[stage]["skip"] += 1
+                continue
+            upstream_ran = True
+            with self.sem[stage]:
+                t0 = time.perf_counter()
+                try:
+                    ok = getattr(self, f"do_{stage}")(src)
+                except Exception as e:  # one bad video must not stop the others
+                    self.errors.append(f"{stage} {src.name}: {e!r}")
+                    ok = False
+                dt = time.perf_counter() - t0
+            outs: List[Path] = []
+            if ok:
+                outs = [folder_file(d) for d in self.frame_dirs(src)] if stage == "extract" else self.outputs(stage, src)
+            written = self.metrics.add_written(*outs)  # this task's own outputs, sized in its thread
+            with self.lock:
+                t = self.timing[stage]
+                t["busy"] += dt
+                t["run" if ok else "fail"] += 1
+                if ok:
+                    m.record(src, outs)
+                else:
+                    m.forget(src)
+                m.save()  # persist after every task so a crash resumes here
+            self.metrics.add_items()
+            self.metrics.item(f"{stage} {src.name}", dt, task=stage, ok=ok, bytes_written=written)
+            print(f"[pipeline] {stage:<8} {src.name} {'ok' if ok else 'FAILED'} {dt:.1f}s")
+            if not ok:
+                return False
+        return True
+
+    def report(self, wall: float) -> None:
+        print(f"[pipeline] {'stage':<8} {'ran':>5} {'skip':>5} {'fail':>5} {'busy s':>9} {'avg s':>7}")
+        for s in self.stages:
+            t = self.timing[s]
+            avg = t["busy"] / t["run"] if t["run"] else 0.0
+            print(f"[pipeline] {s:<8} {t['run']:>5} {t['skip']:>5} {t['fail']:>5} {t['busy']:>9.1f} {avg:>7.2f}")
+        print(f"[pipeline] wall {wall:.1f}s")
+
+def main() -> int:
+    cfg = load_config()
+    pcfg = cfg.get("pipeline", {})
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--concurrency", default="", help="Per-stage limits, e.g. split=2,upscale=4,tag=1")
+    ap.add_argument("--threads", type=int, default=int(pcfg.get("threads_per_job", 0)),
+                    help="Threads per ffmpeg process (0 = cores / ffmpeg slots)")
+    ap.add_argument("--force", action="store_true", help="Ignore completed-task records")
+    args = ap.parse_args()
+
+    p = paths(cfg)
+    limits = parse_concurrency(args.concurrency, {**DEFAULT_CONCURRENCY, **pcfg.get("concurrency", {})})
+    in_dir = p["input_videos"]
+    if not in_dir.exists():
+        print(f"[pipeline] Input folder not found: {in_dir}", file=sys.stderr)
+        return 2
+    videos = split_mod.list_videos(in_dir)
+    metrics = StageMetrics("pipeline", p["work_root"])
+    pipe = Pipeline(cfg, p, limits, force=args.force, threads=args.threads, metrics=metrics)
+    with ThreadPoolExecutor(max_workers=cpu_count()) as pool:
+        clips = dict(zip(videos, pool.map(lambda v: split_mod.predicted_clips(pipe.media.probe(v)), videos)))
+    pipe.media.save()
+    order = sorted(videos, key=lambda v: -clips[v])  # longest chains start first
+    print(f"[pipeline] {len(videos)} videos (~{sum(clips.values())} clips), limits {limits}, "
+          f"{pipe.threads} thread(s) per ffmpeg job")
+
+    t0 = time.perf_counter()
+    with metrics, ThreadPoolExecutor(max_workers=max(1, min(len(videos), sum(limits.values())))) as pool:
+        metrics.add_read(*videos)
+        ok = list(pool.map(pipe.run_video, order))
+        metrics.extra["tasks"] = pipe.timing
+    for m in pipe.manifests.values():
+        m.prune(videos, delete_outputs=False)
+        m.save()
+    pipe.media.save()
+
+    # Combine per-video results for the downstream stages.
+    dedup_parts = [pipe.outputs("dedup", v)[0] for v in videos]
+    if cfg.get("dedup", {}).get("enabled", True):
+        concat_parts(dedup_parts, p["frames_keep"])
+    elif p["frames_keep"].exists():
+        p["frames_keep"].unlink()
+    tag_parts = [pipe.outputs("tag", v)[0] for v in videos]
+    wd14_out = tags_output(p["tags_raw"] / "wd14.jsonl", use_store(cfg))
+    if use_store(cfg):
+        write_tags(wd14_out, (row for part in tag_parts if part.exists() for row in iter_jsonl(part)), columnar=True)
+        n = sum(part.exists() for part in tag_parts)
+    else:
+        n = concat_parts(tag_parts, wd14_out)
+        shutil.rmtree(tags_output(wd14_out, True), ignore_errors=True)
+    print(f"[pipeline] combined tags of {n} videos into {wd14_out}")
+    print(f"[pipeline] catalog: {len(load_catalog(cfg, p))} frames -> {p['frames_catalog']}")
+
+    pipe.report(time.perf_counter() - t0)
+    if not all(ok):
+        print(f"[pipeline] {ok.count(False)}/{len(videos)} video(s) failed:", file=sys.stderr)
+        for e in pipe.errors:
+            print(f"[pipeline]   {e}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
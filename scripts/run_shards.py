@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Simulate N nodes on this machine: run the shardable stages as N `--shard i/N` processes.
+
+Usage:
+  python -m scripts.run_shards --nodes 4 [--stages 08,10,20,25,30,40,42] [--arg 30=--stub]
+
+- Consecutive shardable stages (08, 10, 20, 30) form one chain per node; the N chains run as
+  parallel processes on the shared data folder, exactly as N machines would.
+- Other stages (25 dedup, 40 merge, ...) run once, after every node finished the chain
+  before them, like a coordinator step.
+- Output lines are prefixed with the node; ffmpeg stages get --threads cores/N unless set
+  with --arg. All processes share one run report (PIPELINE_RUN_ID).
+- Exits non-zero if any node or stage failed; later stages are not started then.
+"""
+
+from __future__ import annotations
+import argparse, os, subprocess, sys, threading, time
+from typing import Dict, List, Optional, Tuple
+from scripts.utils.ffmpeg import cpu_count
+from scripts.utils.metrics import RUN_ID_ENV
+from scripts.utils.stages import parse_stage_args, stage_module
+
+SHARDED = ("08", "10", "20", "30")
+FFMPEG_STAGES = ("08", "10", "20")
+
+def plan_steps(stages: List[str]) -> List[Tuple[bool, List[str]]]:
+    """Group stages into (sharded, [stage, ...]) steps: runs of shardable stages, single others."""
+    steps: List[Tuple[bool, List[str]]] = []
+    for s in stages:
+        if s in SHARDED and steps and steps[-1][0]:
+            steps[-1][1].append(s)
+        else:
+            steps.append((s in SHARDED, [s]))
+    return steps
+
+class Launcher:
+    def __init__(self, nodes: int, stage_args: Dict[str, List[str]], threads: int):
+        self.nodes = nodes
+        self.stage_args = stage_args
+        self.threads = threads
+        self.lock = threading.Lock()
+
+    def command(self, stage: str, shard: Optional[int]) -> List[str]:
+        cmd = [sys.executable, "-m", stage_module(stage)] + self.stage_args.get(stage, [])
+        if shard is not None:
+            cmd += ["--shard", f"{shard}/{self.nodes}"]
+            if stage in FFMPEG_STAGES and "--threads" not in cmd:
+                cmd += ["--threads", str(self.threads)]
+        return cmd
+
+    def run(self, cmd: List[str], label: str) -> int:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                text=True, encoding="utf-8", errors="replace", bufsize=1)
+        for line in proc.stdout:
+            with self.lock:
+                print(f"[{label}] {line.rstrip()}", flush=True)
+        return proc.wait()
+
+    def node_chain(self, node: int, chain: List[str]) -> bool:
+        for stage in chain:
+            rc = self.run(self.command(stage, node), f"node {node}/{self.nodes} {stage}")
+            if rc != 0:
+                with self.lock:
+                    print(f"[shards] node {node}: stage {stage} exited with {rc}", file=sys.stderr)
+                return False
+        return True
+
+    def sharded(self, chain: List[str]) -> bool:
+        ok = [False] * self.nodes
+        def target(i: int) -> None:
+            ok[i] = self.node_chain(i, chain)
+        threads = [threading.Thread(target=target, args=(i,)) for i in range(self.nodes)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return all(ok)
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--nodes", type=int, default=2, help="Number of simulated nodes (shards)")
+    ap.add_argument("--stages", default="08,10,20,25,30,40,42",
+                    help="Comma-separated stage prefixes, in order")
+    ap.add_argument("--arg", action="append", default=[], metavar="STAGE=ARGS",
+                    help="Extra arguments for one stage, e.g. --arg 30=--stub (repeatable)")
+    ap.add_argument("--threads", type=int, default=0, help="Threads per ffmpeg process (0 = cores / nodes)")
+    args = ap.parse_args()
+    if args.nodes < 1:
+        ap.error("--nodes must be >= 1")
+
+    os.environ.setdefault(RUN_ID_ENV, time.strftime("shards-%Y%m%d-%H%M%S"))
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    for s in stages:
+        stage_module(s)
+    launcher = Launcher(args.nodes, parse_stage_args(args.arg),
+                        args.threads or max(1, cpu_count() // args.nodes))
+    t0 = time.perf_counter()
+    for sharded, chain in plan_steps(stages):
+        step_t0 = time.perf_counter()
+        if sharded:
+            print(f"[shards] {args.nodes} node(s): {' -> '.join(chain)}")
+            ok = launcher.sharded(chain)
+        else:
+            print(f"[shards] coordinator: {chain[0]}")
+            ok = launcher.run(launcher.command(chain[0], None), chain[0]) == 0
+        print(f"[shards] {'+'.join(chain)} {'done' if ok else 'FAILED'} in {time.perf_counter() - step_t0:.1f}s")
+        if not ok:
+            return 1
+    print(f"[shards] all stages done in {time.perf_counter() - t0:.1f}s "
+          f"(report: data/reports/{os.environ[RUN_ID_ENV]}.jsonl)")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -6,10 +6,17 @@ Caption rule-set used to convert merged (tag, score) lists into a final caption
 - Order by score/frequency (already done in merge stage; here we limit and reformat)
 - Optionally strip NSFW-like tags
 - Prepend activation keyword from config
+- `CaptionBuilder` / `batch_captions` produce byte-identical captions to `to_caption` for many
+  rows: each distinct tag string is cleaned once (memoized), rows are deduped over integer
+  display ids, and work is chunked (optionally across processes).
 """
 
 from __future__ import annotations
-from typing import Iterable, Tuple, List, Set
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, Tuple, List, Optional, Set
+
+import numpy as np
 
 NSFB = {"rating_explicit", "nsfw", "censored"}  # extend per policy
 
@@ -41,3 +48,140 @@ def to_caption(
         if len(ordered) >= max_tags:
             break
     return f"{prefix}, " + ", ".join(ordered) if prefix else ", ".join(ordered)
+
+def caption_options(cfg: Dict[str, Any]) -> Dict[str, Any]:
+    """`to_caption` keyword arguments from the `clean:` and `musubi:` config blocks."""
+    return dict(
+        lower=bool(cfg["clean"]["lowercase"]),
+        replace_underscores=bool(cfg["clean"]["replace_underscores"]),
+        strip_nsfb=bool(cfg["clean"]["strip_nsfb_tags"]),
+        max_tags=int(cfg["clean"]["max_tags"]),
+        prefix=cfg["musubi"].get("caption_prefix", ""),
+    )
+
+class CaptionBuilder:
+    """Memoized, batch-oriented equivalent of `to_caption` for one set of options."""
+
+    def __init__(
+        self,
+        *,
+        lower: bool = True,
+        replace_underscores: bool = True,
+        strip_nsfb: bool = True,
+        max_tags: int = 64,
+        prefix: str = ""
+    ):
+        self.lower = lower
+        self.replace_underscores = replace_underscores
+        self.strip_nsfb = strip_nsfb
+        self.max_tags = max_tags
+        self.prefix = prefix
+        self.forms: List[str] = []              # display id -> display form
+        self._form_ids: Dict[str, int] = {}
+        self._display: Dict[str, int] = {}      # raw tag -> display id (-1 = dropped)
+
+    def display_id(self, tag: str) -> int:
+        """Clean `tag` exactly like `to_caption` (once per distinct string); -1 if dropped."""
+        d = self._display.get(tag)
+        if d is not None:
+            return d
+        t = tag.strip()
+        if not t or (self.strip_nsfb and t in NSFB):
+            d = -1
+        else:
+            if self.lower:
+                t = t.lower()
+            if self.replace_underscores:
+                t = t.replace("_", " ")
+            d = self._form_ids.get(t)
+            if d is None:
+                d = self._form_ids[t] = len(self.forms)
+                self.forms.append(t)
+        self._display[tag] = d
+        return d
+
+    def join(self, ordered: List[str]) -> str:
+        return f"{self.prefix}, " + ", ".join(ordered) if self.prefix else ", ".join(ordered)
+
+    def caption(self, tags: Iterable[Tuple[str, float]]) -> str:
+        display = self._display
+        # dict keeps first-seen order, so this is to_caption's dedup over display ids.
+        ids = dict.fromkeys([display[t] if t in display else self.display_id(t) for t, _s in tags])
+        ids.pop(-1, None)
+        forms = self.forms
+        return self.join([forms[d] for d in islice(ids, max(self.max_tags, 1))])
+
+    def captions(self, rows: Iterable[Iterable[Tuple[str, float]]]) -> List[str]:
+        return [self.caption(tags) for tags in rows]
+
+    def table_captions(self, table, *, chunk_rows: int = 100_000) -> Iterator[Tuple[str, str]]:
+        """
+        (image, caption) for every row of a tagstore.TagTable, computed over integer ids:
+        vocab -> display ids once, then per chunk a vectorized drop/dedup/max_tags pass.
+        """
+        dmap = np.fromiter((self.display_id(v) for v in table.vocab), dtype=np.int64, count=len(table.vocab))
+        offsets = np.asarray(table.offsets)
+        limit = max(self.max_tags, 1)  # to_caption appends before checking the limit
+        forms = self.forms
+        for c0 in range(0, len(table), chunk_rows):
+            c1 = min(c0 + chunk_rows, len(table))
+            s, e = int(offsets[c0]), int(offsets[c1])
+            row = np.repeat(np.arange(c1 - c0), np.diff(offsets[c0:c1 + 1]))
+            d = dmap[np.asarray(table.tag_ids[s:e])]
+            keep = d >= 0
+            row, d = row[keep], d[keep]
+            # First occurrence of each (row, display id), kept in original order.
+            order = np.lexsort((np.arange(len(d)), d, row))
+            rs, ds = row[order], d[order]
+            first = np.ones(len(d), dtype=bool)
+            first[1:] = (rs[1:] != rs[:-1]) | (ds[1:] != ds[:-1])
+            sel = np.sort(order[first])
+            row, d = row[sel], d[sel]
+            rank = np.arange(len(row)) - np.searchsorted(row, row)
+            keep = rank < limit
+            row, d = row[keep], d[keep]
+            bounds = np.r_[0, np.cumsum(np.bincount(row, minlength=c1 - c0))].tolist()
+            d = d.tolist()
+            for i in range(c1 - c0):
+                yield table.images[c0 + i], self.join([forms[j] for j in d[bounds[i]:bounds[i + 1]]])
+
+_worker_builder: Optional[CaptionBuilder] = None
+
+def _init_worker(opts: Dict[str, Any]) -> None:
+    global _worker_builder
+    _worker_builder = CaptionBuilder(**opts)
+
+def _caption_chunk(chunk: List[Any]) -> List[str]:
+    return _worker_builder.captions(chunk)
+
+def _chunks(rows: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    it = iter(rows)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+def batch_captions(
+    rows: Iterable[Tuple[str, Iterable[Tuple[str, float]]]],
+    opts: Dict[str, Any],
+    *, chunk_rows: int = 50_000,
+    workers: int = 0,
+) -> Iterator[Tuple[str, str]]:
+    """(image, caption) for (image, tags) rows, in order; `workers > 1` uses a process pool."""
+    if workers <= 1:
+        builder = CaptionBuilder(**opts)
+        for chunk in _chunks(rows, chunk_rows):
+            yield from zip((img for img, _ in chunk), builder.captions(tags for _, tags in chunk))
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(opts,)) as pool:
+        chunks = _chunks(rows, chunk_rows)
+        # Keep a bounded window of chunks in flight so huge inputs are not read up front.
+        pending = []
+        for chunk in chunks:
+            pending.append(([img for img, _ in chunk], pool.submit(_caption_chunk, [tags for _, tags in chunk])))
+            if len(pending) > 2 * workers:
+                imgs, fut = pending.pop(0)
+                yield from zip(imgs, fut.result())
+        for imgs, fut in pending:
+            yield from zip(imgs, fut.result())
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Temporal tag smoothing and clip-level tag aggregation (42_aggregate_clips.py).
+
+- Rows of a merged TagTable are grouped by frames folder (one clip) and ordered by frame
+  timestamp; each group becomes a dense (frames x tags) score matrix.
+- Windowed scores come from cumulative sums over that matrix, with the window given in
+  seconds (frames kept by dedup are irregularly spaced):
+    mean   moving average of the score; a tag is kept where it reaches `min_score`
+    vote   kept where present in >= `vote_fraction` of the window's frames, scored by its
+           mean over the frames that have it
+  Gaps of a tag between neighbouring frames are filled and one-frame flickers dropped.
+- Clip tags: tags present in >= `clip_min_fraction` of a clip's frames, ranked by their mean
+  score over all frames of the clip (absent = 0).
+- Rows that are not extracted frames pass through unchanged; output rows keep input order.
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from scripts.utils.tagstore import TagTable
+
+METHODS = ("mean", "vote")
+
+@dataclass
+class ClipTags:
+    folder: str
+    frames: int
+    start_s: float
+    end_s: float
+    tags: List[Tuple[str, float]] = field(default_factory=list)
+
+def smooth_options(cfg: dict) -> dict:
+    """`aggregate_table` keyword arguments from the `aggregate:` config block."""
+    acfg = cfg.get("aggregate", {})
+    return dict(
+        method=acfg.get("method", "mean"),
+        window_seconds=float(acfg.get("window_seconds", 0.5)),
+        min_score=float(acfg.get("min_score", cfg.get("merge", {}).get("min_confidence", 0.35))),
+        vote_fraction=float(acfg.get("vote_fraction", 0.5)),
+        clip_min_fraction=float(acfg.get("clip_min_fraction", 0.3)),
+    )
+
+def window_sums(m: np.ndarray, t: np.ndarray, half: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-row sums of `m` over rows with |t - t_row| <= half, and the rows counted."""
+    lo = np.searchsorted(t, t - half - 1e-9, side="left")
+    hi = np.searchsorted(t, t + half + 1e-9, side="right")
+    c = np.zeros((len(m) + 1, m.shape[1]), dtype=np.float64)
+    np.cumsum(m, axis=0, out=c[1:])
+    return c[hi] - c[lo], (hi - lo).astype(np.float64)
+
+def smooth_matrix(
+    scores: np.ndarray,
+    t: np.ndarray,
+    *, method: str = "mean",
+    window_seconds: float = 0.5,
+    min_score: float = 0.35,
+    vote_fraction: float = 0.5,
+) -> np.ndarray:
+    """Smoothed (frames x tags) scores for frames at sorted times `t`; 0 = tag dropped."""
+    if method not in METHODS:
+        raise ValueError(f"unknown smoothing method {method!r}; expected one of {METHODS}")
+    half = window_seconds / 2
+    total, n = window_sums(scores, t, half)
+    if method == "mean":
+        out = total / n[:, None]
+        keep = out >= min_score - 1e-9
+    else:
+        present, _ = window_sums((scores > 0).astype(np.float32), t, half)
+        out = np.divide(total, present, out=np.zeros_like(total), where=present > 0)
+        keep = present / n[:, None] >= vote_fraction - 1e-9
+    return np.where(keep, np.round(out, 4), 0.0).astype(np.float32)
+
+def _entries(offsets: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Entry indices of `rows` (CSR) and the position in `rows` each entry belongs to."""
+    starts = offsets[rows]
+    lengths = offsets[rows + 1] - starts
+    local = np.repeat(np.arange(len(rows)), lengths)
+    first = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return starts[local] + (np.arange(len(local)) - first), local
+
+def aggregate_table(
+    table: TagTable,
+    frame_keys: Sequence[Optional[Tuple[str, float]]],
+    *, method: str = "mean",
+    window_seconds: float = 0.5,
+    min_score: float = 0.35,
+    vote_fraction: float = 0.5,
+    clip_min_fraction: float = 0.3,
+) -> Tuple[TagTable, List[ClipTags]]:
+    """
+    Smooth every clip of `table` (frame_keys[i] = (frames folder, timestamp s) of row i, or
+    None for rows that are not extracted frames) and aggregate one tag list per clip.
+    """
+    n = len(table)
+    offsets = np.asarray(table.offsets, dtype=np.int64)
+    tag_ids = np.asarray(table.tag_ids, dtype=np.int64)
+    scores = np.asarray(table.scores, dtype=np.float32)
+    name_rank = np.empty(len(table.vocab), dtype=np.int64)
+    name_rank[np.argsort(np.array(table.vocab, dtype=object), kind="stable")] = np.arange(len(table.vocab))
+
+    group_of: Dict[str, int] = {}
+    gid = np.full(n, -1, dtype=np.int64)
+    ts = np.zeros(n, dtype=np.float64)
+    for i, k in enumerate(frame_keys):
+        if k is not None:
+            gid[i] = group_of.setdefault(k[0], len(group_of))
+            ts[i] = k[1]
+    folders = list(group_of)
+
+    # Rows outside any clip keep their entries and order.
+    free = np.flatnonzero(gid < 0)
+    ent, local = _entries(offsets, free)
+    parts = [(free[local], tag_ids[ent], scores[ent], ent)]
+
+    order = np.lexsort((ts, gid))
+    order = order[gid[order] >= 0]
+    bounds = np.flatnonzero(np.r_[True, gid[order][1:] != gid[order][:-1], True]) if len(order) else []
+    clips: List[ClipTags] = []
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        rows = order[a:b]
+        ent, local = _entries(offsets, rows)
+        cols, inv = np.unique(tag_ids[ent], return_inverse=True)
+        m = np.zeros((len(rows), len(cols)), dtype=np.float32)
+        m[local, inv] = scores[ent]
+        t = ts[rows]
+        s = smooth_matrix(m, t, method=method, window_seconds=window_seconds,
+                          min_score=min_score, vote_fraction=vote_fraction)
+        r, c = np.nonzero(s)
+        val = s[r, c]
+        rank = np.lexsort((name_rank[cols[c]], -val, r))
+        parts.append((rows[r[rank]], cols[c[rank]], val[rank], np.arange(len(rank))))
+
+        frac = (m > 0).mean(axis=0)
+        mean = m.mean(axis=0)
+        pick = np.flatnonzero((frac >= clip_min_fraction - 1e-9) & (mean > 0))
+        pick = pick[np.lexsort((name_rank[cols[pick]], -mean[pick]))]
+        clips.append(ClipTags(
+            folders[int(gid[rows[0]])], len(rows), round(float(t[0]), 6), round(float(t[-1]), 6),
+            [(table.vocab[int(cols[j])], round(float(mean[j]), 4)) for j in pick],
+        ))
+
+    row = np.concatenate([p[0] for p in parts])
+    tag = np.concatenate([p[1] for p in parts])
+    val = np.concatenate([p[2] for p in parts])
+    rank = np.concatenate([p[3] for p in parts])
+    final = np.lexsort((rank, row))
+    out_offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(row, minlength=n), out=out_offsets[1:])
+    smoothed = TagTable(table.images, table.vocab, out_offsets,
+                        tag[final].astype(np.int32), val[final].astype(np.float32))
+    return smoothed, clips
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Near-duplicate frame detection for the dedup stage (25_dedup_frames.py).
+
+- Perceptual hashes (pHash via a batched 2-D DCT, or dHash) are computed with NumPy
+  over fixed-size batches of frames and packed into uint64.
+- `hash_video` hashes a clip straight from an ffmpeg gray pipe, scaled in ffmpeg to the
+  hash input size (frame_extract.from_video), so no JPEG is written or decoded.
+- Frames are clustered greedily in temporal order: a frame is dropped when a BK-tree
+  of kept hashes has a member within `max_distance` bits, so each lookup touches a
+  small part of the tree instead of comparing against every kept frame.
+- The keep-list (data/frames_keep.jsonl) records, per video folder, the kept frame
+  names and which kept frame each dropped frame was folded into (`keep_row`; readers are
+  in scripts/utils/keeplist.py, which does not import NumPy).
+"""
+
+from __future__ import annotations
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_BITS = 1 << np.arange(64, dtype=np.uint64)
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * x + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    m[0] /= np.sqrt(2.0)
+    return m.astype(np.float32)
+
+def load_gray(path: Path, size: Tuple[int, int]) -> np.ndarray:
+    """Decode an image (loose or packed frame) as grayscale float32 resized to (width, height)."""
+    from PIL import Image
+    from scripts.utils.framepack import frame_file
+
+    with Image.open(frame_file(path)) as im:
+        im.draft("L", (size[0] * 4, size[1] * 4))  # cheap JPEG downscale on decode
+        return np.asarray(im.convert("L").resize(size, Image.BILINEAR), dtype=np.float32)
+
+def pack_bits(bits: np.ndarray) -> np.ndarray:
+    """(N, 64) bool -> (N,) uint64."""
+    return (bits.astype(np.uint64) * _BITS).sum(axis=1, dtype=np.uint64)
+
+def phash_batch(gray: np.ndarray, hash_size: int = 8) -> np.ndarray:
+    """pHash for a stack of (N, 4*hash_size, 4*hash_size) grayscale images."""
+    n = gray.shape[1]
+    d = _dct_matrix(n)
+    coeffs = np.einsum("ij,njk,lk->nil", d, gray, d, optimize=True)[:, :hash_size, :hash_size]
+    flat = coeffs.reshape(len(gray), -1)
+    med = np.median(flat[:, 1:], axis=1, keepdims=True)  # ignore the DC term
+    return pack_bits(flat > med)
+
+def dhash_batch(gray: np.ndarray) -> np.ndarray:
+    """dHash for a stack of (N, 8, 9) grayscale images (horizontal gradient sign)."""
+    return pack_bits((gray[:, :, 1:] > gray[:, :, :-1]).reshape(len(gray), -1))
+
+HASHERS = {
+    # name -> (decode size (w, h), batch hash function)
+    "phash": ((32, 32), phash_batch),
+    "dhash": ((9, 8), dhash_batch),
+}
+
+def hash_images(paths: Sequence[Path], method: str = "phash", workers: int = 4, batch: int = 256) -> np.ndarray:
+    """
+    Decode `paths` (threaded) and hash them `batch` images per vectorized call; decoded
+    images go into one reused buffer, so memory does not grow with the folder size.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    size, fn = HASHERS[method]
+    out = np.zeros(len(paths), dtype=np.uint64)
+    gray = np.empty((min(batch, len(paths)), size[1], size[0]), dtype=np.float32)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for start in range(0, len(paths), batch):
+            chunk = paths[start:start + batch]
+            for i, img in enumerate(pool.map(lambda p: load_gray(p, size), chunk)):
+                gray[i] = img
+            out[start:start + len(chunk)] = fn(gray[:len(chunk)])
+    return out
+
+def hash_video(
+    ffmpeg_bin: str,
+    src: Path,
+    method: str = "phash",
+    *, fps: Optional[float] = None,
+    mode: str = "all",
+    every_nth: int = 1,
+    max_frames: int = 0,
+    batch: int = 256,
+) -> Tuple[List[int], np.ndarray]:
+    """Hash the sampled frames of a video via a raw pipe; return (source frame indices, hashes)."""
+    from scripts.utils.ffmpeg import FrameReader, sample_filters, sample_step
+
+    size, fn = HASHERS[method]
+    vf = sample_filters(fps=fps, mode=mode, every_nth=every_nth) + [f"scale={size[0]}:{size[1]}:flags=bilinear"]
+    gray = np.empty((batch, size[1], size[0]), dtype=np.float32)
+    parts = []
+    with FrameReader(ffmpeg_bin, src, size=size, vf=",".join(vf), pix_fmt="gray",
+                     batch=batch, max_frames=max_frames) as reader:
+        for frames in reader.batches():
+            n = len(frames)
+            np.copyto(gray[:n], frames[..., 0])
+            parts.append(fn(gray[:n]))
+    hashes = np.concatenate(parts) if parts else np.zeros(0, dtype=np.uint64)
+    step = sample_step(mode, every_nth)
+    return [i * step for i in range(len(hashes))], hashes
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+class BKTree:
+    """Burkhard-Keller tree over 64-bit hashes with Hamming distance."""
+
+    __slots__ = ("root",)
+
+    def __init__(self) -> None:
+        # node = [hash, payload, {distance: child}]
+        self.root: Optional[list] = None
+
+    def add(self, h: int, payload: int) -> None:
+        if self.root is None:
+            self.root = [h, payload, {}]
+            return
+        node = self.root
+        while True:
+            d = hamming(h, node[0])
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [h, payload, {}]
+                return
+            node = child
+
+    def find(self, h: int, max_distance: int) -> Optional[int]:
+        """Payload of the closest stored hash within `max_distance`, else None."""
+        if self.root is None:
+            return None
+        best, best_d = None, max_distance + 1
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            d = hamming(h, node[0])
+            if d < best_d:
+                best, best_d = node[1], d
+                if d == 0:
+                    break
+            lo, hi = d - max_distance, d + max_distance
+            stack.extend(c for k, c in node[2].items() if lo <= k <= hi)
+        return best
+
+def cluster(hashes: np.ndarray, max_distance: int) -> np.ndarray:
+    """
+    Greedy temporal clustering. Returns `rep` where rep[i] == i for kept frames and
+    rep[i] = index of the kept frame that frame i duplicates otherwise.
+    """
+    rep = np.arange(len(hashes))
+    tree = BKTree()
+    for i, h in enumerate(hashes.tolist()):
+        j = tree.find(h, max_distance)
+        if j is None:
+            tree.add(h, i)
+        else:
+            rep[i] = j
+    return rep
+
+# ---------------------------------------------------------------------------
+# Keep-list
+# ---------------------------------------------------------------------------
+
+def keep_row(video: str, names: List[str], rep: np.ndarray) -> dict:
+    kept = [names[i] for i in range(len(names)) if rep[i] == i]
+    folded = {names[i]: names[int(rep[i])] for i in range(len(names)) if rep[i] != i}
+    return {"video": video, "total": len(names), "keep": kept, "map": folded}
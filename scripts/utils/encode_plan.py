@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""
+Encode planner for the re-encoding stages (08_split_review.py, 10_upscale_normalize.py).
+
+- `Calibration` measures libx264 throughput on this machine with short lavfi encodes
+  (testsrc2 at the source size class -> the stage's scale/pad -> the output size), per
+  preset and thread count, and caches it in data/.cache/encode_calibration.json keyed by
+  machine (cores, CPU, ffmpeg version) and crf/pix_fmt. Only missing points are measured.
+- `plan_encode` predicts the batch makespan for every preset x (jobs, threads) split of
+  the cores (longest-first assignment of per-clip times) and picks:
+    throughput  the fastest allowed preset with the (jobs, threads) split finishing first
+                (maximizes clips/hour)
+    deadline    the slowest (best compressing) allowed preset whose prediction fits
+                `deadline_minutes`; the fastest plan if none does
+- Stages report predicted vs. actual time; the ratio is kept per stage as a correction
+  (smoothed), so parallel-slowdown the single-process calibration misses is learned.
+"""
+
+from __future__ import annotations
+import heapq
+import json
+import math
+import os
+import platform
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from scripts.utils.ffmpeg import cpu_count, scale_pad_filter
+
+CACHE_VERSION = 1
+PRESETS = ("ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow")
+TARGETS = ("throughput", "deadline")
+SIZE_CLASSES = (240, 360, 480, 720, 1080, 1440, 2160)   # source heights calibrated as 16:9
+
+@dataclass
+class EncodeWork:
+    """One encode: output frame count and source frame size."""
+    name: str
+    frames: int
+    src_size: Tuple[int, int]
+
+@dataclass
+class EncodePlan:
+    target: str
+    preset: str
+    jobs: int
+    threads: int
+    predicted_s: float
+    encodes: int
+    note: str = ""
+
+    def summary(self) -> str:
+        line = (f"{self.target} plan: preset={self.preset}, {self.jobs} job(s) x {self.threads} thread(s), "
+                f"predicted {self.predicted_s:.1f}s for {self.encodes} encode(s)")
+        return f"{line} ({self.note})" if self.note else line
+
+def size_class(size: Tuple[int, int]) -> int:
+    """Calibration class of a source: the smallest SIZE_CLASSES height covering it."""
+    h = max(size[1], math.ceil(size[0] * 9 / 16))
+    return next((c for c in SIZE_CLASSES if c >= h), SIZE_CLASSES[-1])
+
+def thread_options(cores: int) -> List[int]:
+    return [t for t in (1, 2, 4, 8, 16) if t <= max(1, cores)]
+
+def machine_key(ffmpeg_bin: str) -> str:
+    try:
+        version = subprocess.run([ffmpeg_bin, "-version"], capture_output=True, text=True).stdout.split("\n", 1)[0]
+    except OSError:
+        version = "?"
+    return f"{platform.machine()}|{platform.processor() or platform.system()}|{cpu_count()}|{version}"
+
+def calibration_args(
+    ffmpeg_bin: str,
+    *, src_class: int,
+    out_size: Optional[int],
+    fps: int,
+    frames: int,
+    preset: str,
+    crf: int,
+    pix_fmt: str,
+    threads: int,
+) -> List[str]:
+    """Encode `frames` synthetic frames like the stage would, discarding the output."""
+    w = 2 * math.ceil(src_class * 16 / 9 / 2)
+    vf = scale_pad_filter(out_size, fps) if out_size else f"fps={fps}"
+    return [
+        ffmpeg_bin, "-nostdin", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size={w}x{src_class}:rate={fps}",
+        "-frames:v", str(frames), "-vf", vf,
+        "-c:v", "libx264", "-preset", preset, "-crf", str(crf), "-pix_fmt", pix_fmt,
+        "-threads", str(threads), "-f", "null", "-",
+    ]
+
+class Calibration:
+    """Measured encode rates (frames/s) and per-process startup time, cached on disk."""
+
+    def __init__(
+        self,
+        path: Path,
+        *, ffmpeg_bin: str = "ffmpeg",
+        fps: int = 60,
+        crf: int = 18,
+        pix_fmt: str = "yuv420p",
+        frames: int = 60,
+    ):
+        self.path = Path(path)
+        self.ffmpeg_bin = ffmpeg_bin
+        self.fps, self.crf, self.pix_fmt = int(fps), int(crf), pix_fmt
+        self.frames = max(2, int(frames))
+        self.machine = machine_key(ffmpeg_bin)
+        self.lock = threading.Lock()
+        self.rates: Dict[str, float] = {}
+        self.corrections: Dict[str, float] = {}
+        self.startup_s: Optional[float] = None
+        self.measured = 0
+        self.dirty = False
+        if self.path.exists():
+            try:
+                data = json.loads(self.path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                data = {}
+            if data.get("version") == CACHE_VERSION and data.get("machine") == self.machine:
+                self.rates = data.get("rates", {})
+                self.corrections = data.get("corrections", {})
+                self.startup_s = data.get("startup_s")
+
+    def _time(self, **kw) -> float:
+        args = calibration_args(self.ffmpeg_bin, fps=self.fps, crf=self.crf, pix_fmt=self.pix_fmt, **kw)
+        t0 = time.perf_counter()
+        subprocess.run(args, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return time.perf_counter() - t0
+
+    def startup(self) -> float:
+        """Seconds an ffmpeg encode costs regardless of length (process start, encoder init)."""
+        with self.lock:
+            if self.startup_s is None:
+                self.startup_s = self._time(src_class=SIZE_CLASSES[0], out_size=None, frames=1,
+                                            preset="ultrafast", threads=1)
+                self.dirty = True
+            return self.startup_s
+
+    def rate(self, preset: str, threads: int, src_class: int, out_size: Optional[int]) -> float:
+        """Encoded frames/s for one process; measured once per machine + settings."""
+        key = f"{preset}|{threads}|{src_class}|{out_size or 'src'}|crf{self.crf}|{self.pix_fmt}|{self.fps}"
+        if key not in self.rates:
+            overhead = self.startup()
+            wall = self._time(src_class=src_class, out_size=out_size, frames=self.frames,
+                              preset=preset, threads=threads)
+            with self.lock:
+                self.rates[key] = round(self.frames / max(wall - overhead, 1e-3), 3)
+                self.measured += 1
+                self.dirty = True
+        return self.rates[key]
+
+    def correction(self, stage: str) -> float:
+        return self.corrections.get(stage, 1.0)
+
+    def observe(self, stage: str, predicted_s: float, actual_s: float) -> None:
+        """Fold an actual/predicted ratio into the stage's correction (halfway each run)."""
+        if predicted_s <= 0 or actual_s <= 0:
+            return
+        ratio = actual_s / (predicted_s / self.correction(stage))
+        with self.lock:
+            self.corrections[stage] = round(0.5 * self.correction(stage) + 0.5 * ratio, 4)
+            self.dirty = True
+
+    def save(self) -> None:
+        with self.lock:
+            if not self.dirty:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Per-process temp name, as in MediaCache.save: concurrent shards never share a temp
+            # file; the last rename wins and the other shard's correction is simply re-learned.
+            tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            tmp.write_text(json.dumps({
+                "version": CACHE_VERSION, "machine": self.machine, "startup_s": self.startup_s,
+                "rates": self.rates, "corrections": self.corrections,
+            }, indent=1), encoding="utf-8")
+            os.replace(tmp, self.path)
+            self.dirty = False
+
+def calibration(cfg: dict, work_root: Path) -> Calibration:
+    """Calibration for the `video:` settings, cached in data/.cache/encode_calibration.json."""
+    v = cfg.get("video", {})
+    return Calibration(
+        Path(work_root) / ".cache" / "encode_calibration.json",
+        ffmpeg_bin=cfg.get("paths", {}).get("ffmpeg_bin", "ffmpeg"),
+        fps=int(v.get("fps", 60)),
+        crf=int(v.get("crf", 18)),
+        pix_fmt=v.get("pix_fmt", "yuv420p"),
+        frames=int(cfg.get("encode", {}).get("calibration_frames", 60)),
+    )
+
+# ---------------------------------------------------------------------------
+# Planning
+# ---------------------------------------------------------------------------
+
+def makespan(seconds: Sequence[float], jobs: int) -> float:
+    """Finish time of `seconds` on `jobs` workers, longest first onto the least-loaded worker."""
+    loads = [0.0] * max(1, jobs)
+    for s in sorted(seconds, reverse=True):
+        heapq.heapreplace(loads, loads[0] + s)
+    return max(loads)
+
+def predict(
+    work: Sequence[EncodeWork],
+    calib: Calibration,
+    *, preset: str,
+    jobs: int,
+    threads: int,
+    out_size: Optional[int],
+    stage: str,
+) -> float:
+    startup = calib.startup()
+    seconds = [startup + w.frames / calib.rate(preset, threads, size_class(w.src_size), out_size) for w in work]
+    return makespan(seconds, jobs) * calib.correction(stage)
+
+def plan_encode(
+    work: Sequence[EncodeWork],
+    calib: Calibration,
+    *, target: str,
+    presets: Sequence[str],
+    out_size: Optional[int],
+    stage: str,
+    deadline_s: float = 0.0,
+    cores: Optional[int] = None,
+) -> EncodePlan:
+    """Pick preset, jobs and threads for `work` (see the module docstring for the targets)."""
+    if target not in TARGETS:
+        raise ValueError(f"unknown encode target {target!r}; expected one of {TARGETS}")
+    unknown = [p for p in presets if p not in PRESETS]
+    if unknown or not presets:
+        raise ValueError(f"encode.presets must be x264 presets from {PRESETS}, got {list(presets)}")
+    cores = cores or cpu_count()
+    fastest_first = sorted(set(presets), key=PRESETS.index)
+    if not work:
+        return EncodePlan(target, fastest_first[0], 1, cores, 0.0, 0)
+
+    def best_split(preset: str) -> EncodePlan:
+        best = None
+        for t in thread_options(cores):
+            j = max(1, min(len(work), cores // t))
+            s = predict(work, calib, preset=preset, jobs=j, threads=t, out_size=out_size, stage=stage)
+            if best is None or s < best.predicted_s:
+                best = EncodePlan(target, preset, j, t, round(s, 2), len(work))
+        return best
+
+    if target == "throughput":
+        return best_split(fastest_first[0])
+    for preset in reversed(fastest_first):
+        plan = best_split(preset)
+        if plan.predicted_s <= deadline_s:
+            plan.note = f"fits {deadline_s / 60:g} min deadline"
+            return plan
+    plan = best_split(fastest_first[0])
+    plan.note = f"deadline of {deadline_s / 60:g} min not reachable with allowed presets"
+    return plan
+
+def stage_plan(
+    cfg: dict,
+    work_root: Path,
+    work: Iterable[EncodeWork],
+    *, out_size: Optional[int],
+    stage: str,
+    target: Optional[str] = None,
+    deadline_minutes: Optional[float] = None,
+) -> Tuple[Optional[EncodePlan], Optional[Calibration]]:
+    """
+    Plan from the `encode:` block (CLI overrides win); (None, None) when planning is off.
+    `work` is only consumed when planning, so it can be a lazy generator of probes.
+    """
+    ecfg = cfg.get("encode", {})
+    target = target or ecfg.get("target")
+    if not target:
+        return None, None
+    work = list(work)
+    calib = calibration(cfg, work_root)
+    minutes = float(deadline_minutes if deadline_minutes is not None else ecfg.get("deadline_minutes", 30))
+    plan = plan_encode(
+        work, calib,
+        target=target,
+        presets=ecfg.get("presets") or [cfg.get("video", {}).get("preset", "veryfast")],
+        out_size=out_size,
+        stage=stage,
+        deadline_s=minutes * 60,
+    )
+    if calib.measured:
+        print(f"[{stage}] calibrated {calib.measured} encoder setting(s) -> {calib.path}")
+    calib.save()
+    return plan, calib
+
+def report_plan(plan: EncodePlan, calib: Calibration, actual_s: float, stage: str) -> dict:
+    """Print predicted vs. actual, learn the correction, and return it for the stage metrics."""
+    delta = (actual_s / plan.predicted_s - 1) * 100 if plan.predicted_s else 0.0
+    print(f"[{stage}] {plan.target} plan: predicted {plan.predicted_s:.1f}s, actual {actual_s:.1f}s ({delta:+.0f}%)")
+    calib.observe(stage, plan.predicted_s, actual_s)
+    calib.save()
+    return {"target": plan.target, "preset": plan.preset, "jobs": plan.jobs, "threads": plan.threads,
+            "predicted_s": plan.predicted_s, "actual_s": round(actual_s, 2)}
@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming readers for annotation-tool exports (CVAT, VIAME, DataGym) used by 31–33.
+
+- Readers yield (image, [tag, ...]) records while parsing; no reader holds a whole export.
+- JSON is decoded one array element at a time (`JsonStream`), zip members are opened one by
+  one, CVAT XML goes through `iterparse`, and CSV is read row by row.
+- CVAT zips (or bare files) may hold CVAT XML 1.1 (`<image>` shapes/tags and `<track>` shapes,
+  the latter named `frame_NNNNNN`), COCO (`categories`/`images`/`annotations`) or the legacy
+  captions.json list.
+- `group_tags` unions records of the same image in a bounded buffer that spills sorted runs
+  (exports that fit in one buffer keep first-seen image order).
+- `ingest_exports` parses several export files in a process pool, maps image names onto
+  extracted frames (frame_catalog), then groups and canonicalizes the records.
+"""
+
+from __future__ import annotations
+import csv
+import heapq
+import io
+import itertools
+import json
+import tempfile
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+import ujson
+
+Record = Tuple[str, List[str]]   # (image, [tag, ...])
+
+_WS = " \t\r\n"
+
+# ---------------------------------------------------------------------------
+# Incremental JSON
+# ---------------------------------------------------------------------------
+
+class JsonStream:
+    """Decode JSON values one at a time from a text stream, reading it in chunks."""
+
+    def __init__(self, fp: TextIO, chunk_chars: int = 1 << 20):
+        self.fp = fp
+        self.chunk = chunk_chars
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self._decode = json.JSONDecoder().raw_decode
+
+    def _more(self, n: int) -> bool:
+        if self.eof:
+            return False
+        data = self.fp.read(n)
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character ('' at end of input), not consumed."""
+        while True:
+            buf, pos = self.buf, self.pos
+            while pos < len(buf) and buf[pos] in _WS:
+                pos += 1
+            self.pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self._more(self.chunk):
+                return ""
+
+    def expect(self, ch: str) -> None:
+        got = self.peek()
+        if got != ch:
+            raise ValueError(f"expected {ch!r} in JSON export, got {got or 'end of input'!r}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """Decode the next complete value (reads more input until it is complete)."""
+        self.peek()
+        want = self.chunk
+        while True:
+            try:
+                obj, end = self._decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._more(want):
+                    raise
+            else:
+                # A value ending exactly at the buffer edge may be a truncated number.
+                if end < len(self.buf) or not self._more(want):
+                    self.pos = end
+                    return obj
+            want *= 2
+
+    def array(self) -> Iterator[Any]:
+        """Elements of the array starting at the current position."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            sep = self.peek()
+            self.pos += 1
+            if sep == "]":
+                return
+            if sep != ",":
+                raise ValueError(f"expected ',' or ']' in JSON array, got {sep or 'end of input'!r}")
+
+    def members(self, keys: Sequence[str]) -> Iterator[Tuple[str, Any]]:
+        """(key, element) for the arrays under `keys` of the object here; other members are skipped."""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            if self.peek() == "[":
+                wanted = key in keys
+                for item in self.array():
+                    if wanted:
+                        yield key, item
+            else:
+                self.value()
+            sep = self.peek()
+            self.pos += 1
+            if sep == "}":
+                return
+            if sep != ",":
+                raise ValueError(f"expected ',' or '}}' in JSON object, got {sep or 'end of input'!r}")
+
+def iter_json_array(fp: TextIO) -> Iterator[Any]:
+    """Elements of a top-level JSON array, decoded one by one."""
+    return JsonStream(fp).array()
+
+def iter_json_members(fp: TextIO, keys: Sequence[str]) -> Iterator[Tuple[str, Any]]:
+    """(key, element) for the arrays under `keys` of a top-level JSON object."""
+    return JsonStream(fp).members(keys)
+
+# ---------------------------------------------------------------------------
+# CVAT (zip with CVAT XML / COCO / captions.json, or one such file)
+# ---------------------------------------------------------------------------
+
+Opener = Callable[[], TextIO]
+
+def captions_records(fp: TextIO) -> Iterator[Record]:
+    """Legacy captions.json: [{"image": ..., "tags": [...]}, ...]."""
+    for rec in iter_json_array(fp):
+        yield rec["image"], [str(t) for t in rec.get("tags", [])]
+
+def coco_records(open_fp: Opener) -> Iterator[Record]:
+    """
+    COCO instances: one (file_name, [category]) per annotation. Two passes over the file,
+    so `categories`/`images` may appear before or after `annotations`; only the id -> name
+    maps are kept in memory.
+    """
+    cats: Dict[Any, str] = {}
+    images: Dict[Any, str] = {}
+    with open_fp() as fp:
+        for key, item in iter_json_members(fp, ("categories", "images")):
+            if key == "categories":
+                cats[item["id"]] = item["name"]
+            else:
+                images[item["id"]] = item["file_name"]
+    with open_fp() as fp:
+        for _, ann in iter_json_members(fp, ("annotations",)):
+            image = images.get(ann.get("image_id"))
+            cat = cats.get(ann.get("category_id"))
+            if image and cat:
+                yield image, [cat]
+
+def cvat_xml_records(fp) -> Iterator[Record]:
+    """CVAT XML 1.1: labels of each `<image>`'s shapes/tags, and of `<track>` shapes per frame."""
+    context = ET.iterparse(fp, events=("start", "end"))
+    _, root = next(context)
+    for event, el in context:
+        if event != "end":
+            continue
+        if el.tag == "image":
+            if el.get("name"):
+                yield el.get("name"), [c.get("label") for c in el if c.get("label")]
+            root.clear()
+        elif el.tag == "track":
+            label = el.get("label")
+            if label:
+                for shape in el:
+                    if shape.get("frame") is not None and shape.get("outside") != "1":
+                        yield f"frame_{int(shape.get('frame')):06d}", [label]
+            root.clear()
+
+def _json_records(open_fp: Opener, fmt: str) -> Iterator[Record]:
+    if fmt == "auto":
+        with open_fp() as fp:
+            fmt = "captions" if JsonStream(fp).peek() == "[" else "coco"
+    if fmt == "coco":
+        yield from coco_records(open_fp)
+    else:
+        with open_fp() as fp:
+            yield from captions_records(fp)
+
+def _member_format(name: str, fmt: str) -> Optional[str]:
+    """Which reader handles zip member `name` (None = not an annotation file)."""
+    lower = name.lower()
+    if lower.endswith(".xml") and fmt in ("auto", "xml"):
+        return "xml"
+    if lower.endswith(".json"):
+        if fmt == "auto":
+            return "captions" if lower.endswith("captions.json") else "auto"
+        if fmt in ("captions", "coco"):
+            return fmt
+    return None
+
+def cvat_records(path: Path, fmt: str = "auto") -> Iterator[Record]:
+    """
+    Records of a CVAT export. `fmt` is auto | captions | xml | coco; auto picks per zip member
+    (.xml -> CVAT XML, captions.json -> legacy list, other .json -> captions list or COCO).
+    """
+    path = Path(path)
+    fmt = "auto" if fmt == "cvat" else fmt
+    if not zipfile.is_zipfile(path):
+        if fmt == "xml" or (fmt == "auto" and path.suffix.lower() == ".xml"):
+            with open(path, "rb") as f:
+                yield from cvat_xml_records(f)
+        else:
+            yield from _json_records(lambda: open(path, "r", encoding="utf-8-sig"), fmt)
+        return
+    with zipfile.ZipFile(path, "r") as zf:
+        for name in zf.namelist():
+            kind = _member_format(name, fmt)
+            if kind == "xml":
+                with zf.open(name) as f:
+                    yield from cvat_xml_records(f)
+            elif kind:
+                yield from _json_records(
+                    lambda name=name: io.TextIOWrapper(zf.open(name), encoding="utf-8-sig"), kind)
+
+# ---------------------------------------------------------------------------
+# VIAME / DataGym
+# ---------------------------------------------------------------------------
+
+def viame_records(path: Path) -> Iterator[Record]:
+    """One record per CSV row with an image column; class and attributes split on , and ;."""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            image = row.get("image") or row.get("filename") or ""
+            if not image:
+                continue
+            tags = []
+            for s in (row.get("class"), row.get("attributes")):
+                if s:
+                    tags.extend(tok for tok in s.replace(";", ",").split(",") if tok.strip())
+            yield image, tags
+
+def datagym_records(path: Path) -> Iterator[Record]:
+    """One record per export item that names an image."""
+    with open(path, "r", encoding="utf-8-sig") as f:
+        for item in iter_json_array(f):
+            image = item.get("image") or item.get("filename")
+            if image:
+                yield image, [str(t) for t in item.get("labels", [])]
+
+# ---------------------------------------------------------------------------
+# Grouping + parallel driver
+# ---------------------------------------------------------------------------
+
+def _spill(buf: Dict[str, set], tmp_dir: Path) -> Path:
+    fd, name = tempfile.mkstemp(suffix=".jsonl", dir=tmp_dir)
+    with open(fd, "w", encoding="utf-8") as f:
+        for img in sorted(buf):
+            f.write(ujson.dumps([img, sorted(buf[img])]))
+            f.write("\n")
+    return Path(name)
+
+def _read_run(path: Path) -> Iterator[Record]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            img, tags = ujson.loads(line)
+            yield img, tags
+
+def group_tags(records: Iterable[Record], *, chunk_rows: int, tmp_dir: Path) -> Iterator[Record]:
+    """
+    One (image, sorted tags) per image. Up to `chunk_rows` images are buffered; beyond that
+    sorted runs are spilled to `tmp_dir` and merged, and the output is ordered by image.
+    """
+    buf: Dict[str, set] = {}
+    runs: List[Path] = []
+    for img, tags in records:
+        s = buf.get(img)
+        if s is None:
+            if len(buf) >= chunk_rows:
+                runs.append(_spill(buf, tmp_dir))
+                buf = {}
+            s = buf[img] = set()
+        s.update(tags)
+    if not runs:
+        for img, tags in buf.items():
+            yield img, sorted(tags)
+        return
+    if buf:
+        runs.append(_spill(buf, tmp_dir))
+    del buf
+    try:
+        merged = heapq.merge(*(_read_run(r) for r in runs), key=lambda r: r[0])
+        for img, group in itertools.groupby(merged, key=lambda r: r[0]):
+            tags = set()
+            for _img, t in group:
+                tags.update(t)
+            yield img, sorted(tags)
+    finally:
+        for r in runs:
+            r.unlink(missing_ok=True)
+
+def _parse_part(parse: Callable[[Path], Iterable[Record]], export: Path, part: Path, chunk_rows: int) -> Path:
+    with open(part, "w", encoding="utf-8") as f:
+        for row in group_tags(parse(export), chunk_rows=chunk_rows, tmp_dir=part.parent):
+            f.write(ujson.dumps(row))
+            f.write("\n")
+    return part
+
+def ingest_exports(
+    parse: Callable[[Path], Iterable[Record]],
+    exports: Sequence[Path],
+    canon: Callable[[str], str],
+    *, resolve: Optional[Callable[[str], str]] = None,
+    workers: int = 0,
+    chunk_rows: int = 200_000,
+    tmp_dir: Optional[Path] = None,
+) -> Iterator[Record]:
+    """
+    (image, canonical tags) for every image across `exports`, in first-seen order while the
+    images fit in one `chunk_rows` buffer. `resolve` maps export image names to canonical
+    frame images (FrameCatalog.canonical_image) before grouping. `parse` must be a
+    module-level function (or a functools.partial of one) so `workers > 1` can run one
+    export per process.
+    """
+    with tempfile.TemporaryDirectory(prefix="ingest_", dir=tmp_dir) as td:
+        if workers > 1 and len(exports) > 1:
+            parts = [Path(td) / f"part_{i:04d}.jsonl" for i in range(len(exports))]
+            with ProcessPoolExecutor(max_workers=min(workers, len(exports))) as pool:
+                list(pool.map(_parse_part, itertools.repeat(parse), exports, parts,
+                              itertools.repeat(chunk_rows)))
+            records = itertools.chain.from_iterable(_read_run(p) for p in parts)
+        else:
+            records = itertools.chain.from_iterable(parse(e) for e in exports)
+        if resolve is not None:
+            records = ((resolve(img), tags) for img, tags in records)
+        for img, tags in group_tags(records, chunk_rows=chunk_rows, tmp_dir=Path(td)):
+            yield img, sorted({c for c in map(canon, tags) if c})
@@ -4,18 +4,33 @@ Thin wrapper around ffmpeg to keep other scripts clean and readable.
 
 - We shell out to ffmpeg (more portable/reliable on Windows).
 - Normalization uses lanczos scaling and strips audio (video-only training).
+- `split_scale_args` decodes a source once and writes final scaled/padded segments
+  (optionally tee'ing JPEG frames), replacing the split + upscale double encode.
+- `run_jobs` runs many ffmpeg commands in a bounded worker pool with a per-job
+  `-threads` budget, so a many-core box is kept busy without oversubscription.
+- Jobs run with `-progress pipe:1`; the final fps/speed/frame counters are parsed into
+  `JobResult.progress` for the stage metrics.
+- `FrameReader` streams decoded frames (rgb24/gray, optionally resized in ffmpeg) from a
+  rawvideo pipe into one reused NumPy buffer, so dedup and tagging can read clips directly;
+  `select_frames_args` then writes JPEGs for the chosen frame indices only.
 """
 
 from __future__ import annotations
+import os
 import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Tuple
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 def run_ffmpeg(args: list[str]) -> None:
     """Run ffmpeg with provided arguments, surfacing errors if any."""
     subprocess.run(args, check=True)
 
-def norm_video(
+def norm_video_args(
     ffmpeg_bin: str,
     src: Path,
     dst: Path,
@@ -24,10 +39,10 @@ def norm_video(
     pix_fmt: str,
     crf: int,
     preset: str,
-) -> None:
-    """Normalize a single video into target size/fps/pix_fmt using H.264 visually-lossless settings."""
+) -> list[str]:
+    """Build the ffmpeg command used by `norm_video` (output path is the last argument)."""
     w, h = size
-    args = [
+    return [
         ffmpeg_bin, "-y",
         "-i", str(src),
         "-vf", f"scale={w}:{h}:flags=lanczos,fps={fps}",
@@ -38,22 +53,523 @@ def norm_video(
         "-an",
         str(dst)
     ]
-    run_ffmpeg(args)
+
+def norm_video(
+    ffmpeg_bin: str,
+    src: Path,
+    dst: Path,
+    *, size: Tuple[int, int],
+    fps: int,
+    pix_fmt: str,
+    crf: int,
+    preset: str,
+) -> None:
+    """Normalize a single video into target size/fps/pix_fmt using H.264 visually-lossless settings."""
+    run_ffmpeg(norm_video_args(
+        ffmpeg_bin, src, dst,
+        size=size, fps=fps, pix_fmt=pix_fmt, crf=crf, preset=preset,
+    ))
+
+def jpeg_qscale(jpeg_q: int) -> int:
+    """Map a 0-100 JPEG quality onto ffmpeg's 2-31 mjpeg qscale (lower = better)."""
+    return max(2, 31 - int(jpeg_q/3))
+
+def scale_pad_filter(size: int, fps: int) -> str:
+    """fps lock + aspect-preserving lanczos scale + black pad to a size x size square."""
+    return (
+        f"fps={fps},"
+        f"scale={size}:{size}:flags=lanczos:force_original_aspect_ratio=decrease,"
+        f"pad={size}:{size}:(ow-iw)/2:(oh-ih)/2:black"
+    )
+
+def split_scale_args(
+    ffmpeg_bin: str,
+    src: Path,
+    clips_dir: Path,
+    *, size: int,
+    fps: int,
+    clip_seconds: int,
+    pix_fmt: str,
+    crf: int,
+    preset: str,
+    frames_dir: Optional[Path] = None,
+    jpeg_q: int = 96,
+) -> list[str]:
+    """
+    Single decode -> scale/pad -> segment muxer, i.e. split + upscale in one encode.
+
+    Keyframes are forced on every segment boundary so each clip starts cleanly.
+    With `frames_dir`, the scaled stream is split and also written as JPEG frames.
+    The clip pattern stays the last argument so `with_threads` targets the encoder.
+    """
+    gop = max(1, fps * clip_seconds)
+    vf = scale_pad_filter(size, fps)
+    args = [ffmpeg_bin, "-y", "-hide_banner", "-loglevel", "error", "-i", str(src)]
+    if frames_dir is not None:
+        args += [
+            "-filter_complex", f"[0:v]{vf},split=2[clips][frames]",
+            "-map", "[frames]",
+            "-qscale:v", str(jpeg_qscale(jpeg_q)),
+            "-frame_pts", "1",
+            str(frames_dir / "frame_%06d.jpg"),
+            "-map", "[clips]",
+        ]
+    else:
+        args += ["-map", "0:v:0", "-vf", vf]
+    args += [
+        "-an",
+        "-r", str(fps),
+        "-c:v", "libx264", "-preset", preset, "-crf", str(crf),
+        "-pix_fmt", pix_fmt, "-profile:v", "high",
+        "-g", str(gop), "-keyint_min", str(gop), "-sc_threshold", "0",
+        "-force_key_frames", f"expr:gte(t,n_forced*{clip_seconds})",
+        "-f", "segment", "-segment_time", str(clip_seconds),
+        "-reset_timestamps", "1",
+        "-segment_format_options", "movflags=+faststart",
+        str(clips_dir / "clip_%04d.mp4"),
+    ]
+    return args
+
+SAMPLING_MODES = ("all", "nth", "keyframes", "scene")
+# frame_XXXXXX.jpg is the 0-based frame index (`-frame_pts`); the first releases numbered
+# frames 1, 2, 3, ... Part of the frames manifests, so frames named the old way are re-extracted.
+FRAME_NAMING = "frame_pts"
+
+def count_frames(ffmpeg_bin: str, src: Path) -> int:
+    """Count video packets (= frames) by remuxing to framecrc; nothing is decoded."""
+    proc = subprocess.run(
+        [ffmpeg_bin, "-nostdin", "-v", "error", "-i", str(src),
+         "-map", "0:v:0", "-c", "copy", "-f", "framecrc", "-"],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, check=True,
+    )
+    return sum(1 for line in proc.stdout.splitlines() if line and not line.startswith("#"))
+
+def extract_frames_args(
+    ffmpeg_bin: str,
+    src: Path,
+    dst_dir: Path,
+    *, fps: Optional[float] = None,
+    jpeg_q: int,
+    mode: str = "all",
+    every_nth: int = 1,
+    scene_threshold: float = 0.3,
+    max_frames: int = 0,
+) -> list[str]:
+    """
+    Build the ffmpeg command used by `extract_frames` (output pattern is the last argument).
+
+    Sampling modes:
+      - all:       every frame (after the optional `fps` resample).
+      - nth:       every `every_nth` frame via `select`, so skipped frames are never JPEG-encoded.
+      - keyframes: I-frames only; `-skip_frame nokey` means other frames are not even decoded.
+      - scene:     first frame + frames whose scene score exceeds `scene_threshold`.
+    Files are named by 0-based source frame index (`-frame_pts`), e.g. frame_000120.jpg,
+    so frames written by different passes never collide. `max_frames` > 0 caps the count.
+    """
+    if mode not in SAMPLING_MODES:
+        raise ValueError(f"unknown frame sampling mode {mode!r}; expected one of {SAMPLING_MODES}")
+    if mode == "nth" and every_nth <= 1:
+        mode = "all"
+    filters = [f"fps={fps}"] if fps else []
+    args = [ffmpeg_bin, "-y", "-hide_banner", "-loglevel", "error"]
+    if mode == "keyframes":
+        args += ["-skip_frame", "nokey"]
+    args += ["-i", str(src), "-an"]
+    if mode == "nth":
+        filters.append(f"select='not(mod(n\\,{int(every_nth)}))'")
+    elif mode == "scene":
+        filters.append(f"select='eq(n\\,0)+gt(scene\\,{float(scene_threshold)})'")
+    if filters:
+        args += ["-vf", ",".join(filters)]
+    args += ["-fps_mode", "vfr", "-frame_pts", "1"]
+    if max_frames > 0:
+        args += ["-frames:v", str(int(max_frames))]
+    args += ["-qscale:v", str(jpeg_qscale(jpeg_q)), str(dst_dir / "frame_%06d.jpg")]
+    return args
+
+def fill_frames_args(
+    ffmpeg_bin: str,
+    src: Path,
+    dst_dir: Path,
+    *, jpeg_q: int,
+    have: int,
+    min_frames: int,
+    max_frames: int = 0,
+) -> Optional[list[str]]:
+    """
+    Top-up pass for sparse scene/keyframe sampling: if fewer than `min_frames` were
+    written, sample `min_frames` frames uniformly across the clip (None if not needed).
+    With `max_frames` > 0 the pass writes at most `max_frames - have` frames, so the
+    folder never ends up over the cap.
+    """
+    want = min(min_frames, max_frames - have) if max_frames > 0 else min_frames
+    if have >= min_frames or want <= 0:
+        return None
+    total = count_frames(ffmpeg_bin, src)
+    if total <= 0:
+        return None
+    return extract_frames_args(
+        ffmpeg_bin, src, dst_dir, jpeg_q=jpeg_q,
+        mode="nth", every_nth=max(1, total // want), max_frames=want,
+    )
 
 def extract_frames(
     ffmpeg_bin: str,
     src: Path,
     dst_dir: Path,
-    *, fps: int,
-    jpeg_q: int
+    *, fps: Optional[float] = None,
+    jpeg_q: int,
+    mode: str = "all",
+    every_nth: int = 1,
+    scene_threshold: float = 0.3,
+    min_frames: int = 0,
+    max_frames: int = 0,
+    pack: bool = False,
 ) -> None:
-    """Extract frames as JPEGs (post-normalization)."""
+    """
+    Extract frames as JPEGs (post-normalization) using the given sampling mode; with `pack`
+    they end up in one dst_dir.tar (see framepack.py) instead of loose files.
+    """
     dst_dir.mkdir(parents=True, exist_ok=True)
-    # We already normalized FPS, so just dump frames.
-    args = [
-        ffmpeg_bin, "-y",
-        "-i", str(src),
-        "-qscale:v", str(max(2, 31 - int(jpeg_q/3))),
-        str(dst_dir / "frame_%06d.jpg")
+    run_ffmpeg(extract_frames_args(
+        ffmpeg_bin, src, dst_dir, fps=fps, jpeg_q=jpeg_q, mode=mode,
+        every_nth=every_nth, scene_threshold=scene_threshold, max_frames=max_frames,
+    ))
+    if mode in ("scene", "keyframes") and min_frames > 0:
+        fill = fill_frames_args(ffmpeg_bin, src, dst_dir, jpeg_q=jpeg_q,
+                                have=len(list(dst_dir.glob("*.jpg"))), min_frames=min_frames,
+                                max_frames=max_frames)
+        if fill:
+            run_ffmpeg(fill)
+    if pack:
+        from scripts.utils.framepack import pack_folder
+
+        pack_folder(dst_dir)
+
+# ---------------------------------------------------------------------------
+# Raw frame pipe
+# ---------------------------------------------------------------------------
+
+PIPE_MODES = ("all", "nth")               # sampling modes with a fixed frame index stride
+PIPE_PIX_FMTS = {"rgb24": 3, "bgr24": 3, "gray": 1}
+
+def streams_frames(fx: dict) -> bool:
+    """True when the `frame_extract:` block asks dedup/tagging to read clips directly."""
+    return bool(fx.get("from_video", False)) and fx.get("mode", "nth") in PIPE_MODES
+
+def sample_filters(*, fps: Optional[float] = None, mode: str = "all", every_nth: int = 1) -> List[str]:
+    """
+    `-vf` parts for the pipe-able sampling modes. Output frame k is source frame
+    k * `sample_step(mode, every_nth)`, the index `extract_frames_args` names it by.
+    """
+    if mode not in PIPE_MODES:
+        raise ValueError(f"frame sampling mode {mode!r} cannot be streamed; expected one of {PIPE_MODES}")
+    filters = [f"fps={fps}"] if fps else []
+    if mode == "nth" and every_nth > 1:
+        filters.append(f"select='not(mod(n\\,{int(every_nth)}))'")
+    return filters
+
+def sample_step(mode: str, every_nth: int) -> int:
+    return max(1, int(every_nth)) if mode == "nth" else 1
+
+def index_runs(indices: Iterable[int]) -> List[Tuple[int, int]]:
+    """Sorted, de-duplicated indices as inclusive (first, last) runs: 1,2,3,7 -> (1,3),(7,7)."""
+    runs: List[Tuple[int, int]] = []
+    for i in sorted({int(i) for i in indices}):
+        if runs and i == runs[-1][1] + 1:
+            runs[-1] = (runs[-1][0], i)
+        else:
+            runs.append((i, i))
+    return runs
+
+def select_filter(indices: Iterable[int]) -> str:
+    """
+    `select` keeping exactly the given frame indices (0-based, after any fps resample).
+    Consecutive indices collapse into one `between(n,a,b)` term, so the filter (and the
+    command line, capped at 32K characters on Windows) grows with the number of gaps only.
+    """
+    terms = "+".join(f"eq(n\\,{a})" if a == b else f"between(n\\,{a}\\,{b})" for a, b in index_runs(indices))
+    return f"select='{terms}'" if terms else "select=0"
+
+def pad_square_filter(size: int, *, color: str = "white", flags: str = "bicubic") -> str:
+    """Aspect-preserving scale into size x size, padded to the square with `color`."""
+    return (
+        f"scale={size}:{size}:flags={flags}:force_original_aspect_ratio=decrease,"
+        f"pad={size}:{size}:(ow-iw)/2:(oh-ih)/2:{color}"
+    )
+
+def raw_frames_args(
+    ffmpeg_bin: str,
+    src: Path,
+    *, vf: Optional[str] = None,
+    pix_fmt: str = "rgb24",
+    max_frames: int = 0,
+) -> list[str]:
+    """Decode `src` (first video stream) to raw `pix_fmt` frames on stdout (`pipe:1` is last)."""
+    args = [ffmpeg_bin, "-nostdin", "-hide_banner", "-loglevel", "error",
+            "-i", str(src), "-map", "0:v:0", "-an"]
+    if vf:
+        args += ["-vf", vf]
+    args += ["-fps_mode", "vfr"]
+    if max_frames > 0:
+        args += ["-frames:v", str(int(max_frames))]
+    return args + ["-f", "rawvideo", "-pix_fmt", pix_fmt, "pipe:1"]
+
+def select_frames_args(
+    ffmpeg_bin: str,
+    src: Path,
+    dst_dir: Path,
+    indices: Sequence[int],
+    *, fps: Optional[float] = None,
+    jpeg_q: int,
+) -> list[str]:
+    """JPEGs for the given frame indices only, named like `extract_frames_args` (e.g. the frames dedup kept)."""
+    vf = ",".join(sample_filters(fps=fps) + [select_filter(indices)])
+    return [
+        ffmpeg_bin, "-y", "-hide_banner", "-loglevel", "error",
+        "-i", str(src), "-an", "-vf", vf,
+        "-fps_mode", "vfr", "-frame_pts", "1",
+        "-qscale:v", str(jpeg_qscale(jpeg_q)), str(dst_dir / "frame_%06d.jpg"),
     ]
-    run_ffmpeg(args)
+
+class FrameReader:
+    """
+    Stream decoded frames of `src` from an ffmpeg rawvideo pipe.
+
+    Frames are read straight into one preallocated (batch, H, W, C) uint8 buffer, so no
+    per-frame arrays are allocated: every yielded frame or batch is a view that the next
+    read overwrites (copy what you keep). `size` is the (width, height) ffmpeg outputs,
+    i.e. after `vf`. Use as a context manager; an ffmpeg failure raises RuntimeError.
+    """
+
+    def __init__(
+        self,
+        ffmpeg_bin: str,
+        src: Path,
+        *, size: Tuple[int, int],
+        vf: Optional[str] = None,
+        pix_fmt: str = "rgb24",
+        batch: int = 1,
+        max_frames: int = 0,
+    ):
+        import numpy as np
+
+        if pix_fmt not in PIPE_PIX_FMTS:
+            raise ValueError(f"unsupported pipe pix_fmt {pix_fmt!r}; expected one of {tuple(PIPE_PIX_FMTS)}")
+        self.src = Path(src)
+        self.args = raw_frames_args(ffmpeg_bin, src, vf=vf, pix_fmt=pix_fmt, max_frames=max_frames)
+        w, h = int(size[0]), int(size[1])
+        self.buffer = np.empty((max(1, int(batch)), h, w, PIPE_PIX_FMTS[pix_fmt]), dtype=np.uint8)
+        self._views = [memoryview(frame).cast("B") for frame in self.buffer]
+        self.frames = 0
+        self._proc: Optional[subprocess.Popen] = None
+        self._stderr = None
+        self._eof = False
+
+    def __enter__(self) -> "FrameReader":
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close(check=exc_type is None)
+
+    def open(self) -> None:
+        if self._proc is not None:
+            return
+        self._stderr = tempfile.TemporaryFile()  # a pipe could fill up and stall ffmpeg
+        self._proc = subprocess.Popen(
+            self.args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=self._stderr, bufsize=0,
+        )
+
+    def _fill(self, view: memoryview) -> bool:
+        got, size = 0, len(view)
+        while got < size:
+            n = self._proc.stdout.readinto(view[got:])
+            if not n:
+                if got:
+                    raise RuntimeError(f"ffmpeg: truncated frame from {self.src} ({got}/{size} bytes)")
+                return False
+            got += n
+        return True
+
+    def batches(self) -> Iterator:
+        """Yield (n, H, W, C) views of the reused buffer; only the last batch may be short."""
+        self.open()
+        while not self._eof:
+            n = 0
+            while n < len(self._views) and self._fill(self._views[n]):
+                n += 1
+            self._eof = n < len(self._views)
+            self.frames += n
+            if n:
+                yield self.buffer[:n]
+
+    def __iter__(self) -> Iterator:
+        for batch in self.batches():
+            yield from batch
+
+    def close(self, check: bool = True) -> None:
+        """Stop ffmpeg (killed if frames are left unread); raise if it failed mid-stream."""
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        if not self._eof:
+            proc.kill()
+        proc.stdout.close()
+        rc = proc.wait()
+        self._stderr.seek(0)
+        err = self._stderr.read().decode("utf-8", "replace")
+        self._stderr.close()
+        if check and self._eof and rc != 0:
+            tail = "\n".join(err.strip().splitlines()[-5:])
+            raise RuntimeError(f"ffmpeg failed on {self.src} (rc={rc}): {tail}")
+
+# ---------------------------------------------------------------------------
+# Parallel job scheduler
+# ---------------------------------------------------------------------------
+
+@dataclass
+class FFmpegJob:
+    """One ffmpeg invocation. `args[-1]` must be the output path/pattern."""
+    name: str
+    args: List[str]
+    # Directories to create right before the job starts.
+    mkdirs: Tuple[Path, ...] = ()
+    # Called after a successful run; may return one more command to run in the same slot
+    # (e.g. a top-up pass that depends on what the first command produced).
+    followup: Optional[Callable[[], Optional[List[str]]]] = None
+    # Python step run in the same slot once every command succeeded (e.g. packing frames).
+    finalize: Optional[Callable[[], None]] = None
+
+@dataclass
+class JobResult:
+    name: str
+    ok: bool
+    returncode: int
+    seconds: float
+    error: str = ""
+    # Last `-progress` block of the main command: fps, speed, frames, out_time_s.
+    progress: Dict[str, float] = field(default_factory=dict)
+
+def cpu_count() -> int:
+    """Cores usable by this process (respects affinity masks where available)."""
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except (AttributeError, OSError):
+        return max(1, os.cpu_count() or 1)
+
+def default_jobs(cores: Optional[int] = None) -> int:
+    """Default worker count: libx264 scales well up to ~4 threads per encode."""
+    cores = cores or cpu_count()
+    return max(1, cores // 4)
+
+def threads_per_job(jobs: int, cores: Optional[int] = None) -> int:
+    """Split the core budget evenly so `jobs * threads` never exceeds the machine."""
+    cores = cores or cpu_count()
+    return max(1, cores // max(1, jobs))
+
+def with_threads(args: List[str], threads: int) -> List[str]:
+    """Insert an output-side `-threads N` right before the output path."""
+    return args[:-1] + ["-threads", str(threads), args[-1]]
+
+def with_progress(args: List[str]) -> List[str]:
+    """Ask ffmpeg for machine-readable `key=value` progress on stdout."""
+    return args[:1] + ["-progress", "pipe:1", "-nostats"] + args[1:]
+
+def parse_progress(text: str) -> Dict[str, float]:
+    """Final values from ffmpeg `-progress` output (fps, speed, frames, out_time_s)."""
+    last: Dict[str, str] = {}
+    for line in text.splitlines():
+        key, sep, value = line.partition("=")
+        if sep:
+            last[key.strip()] = value.strip()
+    out: Dict[str, float] = {}
+    for key, name in (("fps", "fps"), ("frame", "frames"), ("speed", "speed")):
+        try:
+            out[name] = float(last[key].rstrip("x"))
+        except (KeyError, ValueError):  # missing, or "N/A" for e.g. image outputs
+            pass
+    try:
+        out["out_time_s"] = int(last["out_time_us"]) / 1e6
+    except (KeyError, ValueError):
+        pass
+    return out
+
+def run_job(job: FFmpegJob, threads: int = 1) -> JobResult:
+    """Run one job (plus its followup) to completion and return its result; never raises."""
+    t0 = time.perf_counter()
+    cmd: Optional[List[str]] = job.args
+    followup = job.followup
+    progress: Dict[str, float] = {}
+    try:
+        for d in job.mkdirs:
+            d.mkdir(parents=True, exist_ok=True)
+        while cmd:
+            proc = subprocess.run(
+                with_progress(with_threads(cmd, threads)),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                errors="replace",
+            )
+            if proc.returncode != 0:
+                # Keep only the tail; ffmpeg stderr can be megabytes on a broken input.
+                err = "\n".join(proc.stderr.strip().splitlines()[-5:])
+                return JobResult(job.name, False, proc.returncode, time.perf_counter() - t0, err)
+            if not progress:
+                progress = parse_progress(proc.stdout)
+                if not progress.get("fps") and progress.get("frames"):
+                    # ffmpeg prints fps=0.00 for runs shorter than its ~1s sampling window.
+                    progress["fps"] = round(progress["frames"] / max(time.perf_counter() - t0, 1e-6), 2)
+            cmd, followup = (followup() if followup else None), None
+        if job.finalize:
+            job.finalize()
+    except (OSError, subprocess.CalledProcessError) as e:  # e.g. ffmpeg binary missing
+        return JobResult(job.name, False, -1, time.perf_counter() - t0, str(e))
+    except Exception as e:  # a failing followup/finalize step (e.g. tarfile error) fails this job only
+        return JobResult(job.name, False, -1, time.perf_counter() - t0, f"{type(e).__name__}: {e}")
+    return JobResult(job.name, True, 0, time.perf_counter() - t0, progress=progress)
+
+def run_jobs(
+    jobs: Iterable[FFmpegJob],
+    *, max_workers: int = 0,
+    threads: int = 0,
+    tag: str = "ffmpeg",
+) -> List[JobResult]:
+    """
+    Run ffmpeg jobs concurrently and return one result per job, in submission order.
+
+    - `max_workers=0` picks `default_jobs()`; `threads=0` splits the cores evenly.
+    - Progress lines are printed in submission order.
+    - A failing job is recorded and reported; it never cancels the rest of the batch.
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return []
+    workers = min(max_workers or default_jobs(), len(jobs))
+    threads = threads or threads_per_job(workers)
+    total = len(jobs)
+    results: List[JobResult] = []
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_job, j, threads) for j in jobs]
+        # Awaiting futures in submission order keeps the log ordered while
+        # later jobs keep running in the background.
+        for i, fut in enumerate(futures):
+            r = fut.result()
+            results.append(r)
+            status = "ok" if r.ok else f"FAILED (rc={r.returncode})"
+            print(f"[{tag}] ({i + 1}/{total}) {r.name} {status} {r.seconds:.1f}s")
+    return results
+
+def report_failures(results: List[JobResult], tag: str = "ffmpeg") -> int:
+    """Print a failure summary; return a process exit code (0 = all ok)."""
+    failed = [r for r in results if not r.ok]
+    if not failed:
+        return 0
+    print(f"[{tag}] {len(failed)}/{len(results)} job(s) failed:", file=sys.stderr)
+    for r in failed:
+        print(f"[{tag}]   {r.name} (rc={r.returncode})", file=sys.stderr)
+        for line in r.error.splitlines():
+            print(f"[{tag}]     {line}", file=sys.stderr)
+    return 1
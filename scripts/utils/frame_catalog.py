@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+Catalog of extracted frames, and resolution of external image names onto them.
+
+- One row per frames/<folder>/ in data/frames_catalog.jsonl: video id, clip, fps, clip
+  offset, directory mtime and the sorted frame indices (frame_XXXXXX.jpg). 20_frame_extract.py
+  and run_pipeline.py refresh it after extraction; `load_catalog` rescans only folders whose
+  mtime changed, so it never goes stale. Packed folders (frames/<folder>.tar, framepack.py)
+  are cataloged from their pack index under the same folder name.
+- A clip's offset is clip number x clip_max_seconds. With `video.split_fast_copy` clips end on
+  real keyframes and have uneven lengths, so offsets are the running total of the probed
+  durations of the video's earlier upscaled clips (media_info cache) instead.
+- A frame's canonical key is "<folder>/<file name>" (keeplist.frame_key); its canonical image
+  string is `frames_root / key`, exactly what 30_tag_wd14.py writes, so merges join on it.
+- `canonical_image(name)` resolves names from annotation tools with ordered rules:
+    exact     <folder>/<file> suffix of any root or separator style (case-insensitive folder)
+    frame     same folder, frame index parsed from the name (frame_12.png, 000012.jpg)
+    nearest   same folder, closest extracted frame within `catalog.snap_seconds`
+    timestamp folder is a video id: frame index read at the catalog fps, mapped to clip + frame
+    name      bare file name that exists in exactly one folder (e.g. CVAT track frames)
+  With `catalog.fold_dedup`, frames dropped by dedup then move to the kept frame they
+  duplicate, so their annotations reach a frame that is tagged and emitted.
+- Unresolved names are kept as-is and counted (`stats`, `summary`), never dropped silently.
+"""
+
+from __future__ import annotations
+import os
+import re
+from bisect import bisect_left
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import ujson
+
+from scripts.utils.keeplist import load_keep_rows
+from scripts.utils.framepack import folder_file, folder_frames, frame_folders
+from scripts.utils.media_info import media_cache
+from scripts.utils.paths import CLIP_SEP, split_frames_dirname
+
+_FRAME_FILE = re.compile(r"frame_(\d+)\.jpg")
+_LAST_DIGITS = re.compile(r"(\d+)(?!.*\d)")
+RULES = ("exact", "frame", "nearest", "timestamp", "name")
+
+class FrameInfo(NamedTuple):
+    key: str
+    video: str
+    clip: Optional[str]
+    index: int
+    timestamp: float   # seconds into the source video
+
+@dataclass
+class FrameFolder:
+    """One frames/<folder>/ directory."""
+    name: str
+    video: str
+    clip: Optional[str]
+    fps: float
+    offset_s: float
+    mtime_ns: int
+    frames: List[int] = field(default_factory=list)   # sorted frame indices
+    others: List[str] = field(default_factory=list)   # *.jpg not named frame_XXXXXX.jpg
+
+    def has(self, index: int) -> bool:
+        i = bisect_left(self.frames, index)
+        return i < len(self.frames) and self.frames[i] == index
+
+    def nearest(self, index: int, max_gap: int) -> Optional[int]:
+        """Closest extracted frame index within `max_gap` (earlier frame wins ties)."""
+        i = bisect_left(self.frames, index)
+        best = None
+        for j in (i - 1, i):
+            if 0 <= j < len(self.frames):
+                gap = abs(self.frames[j] - index)
+                if gap <= max_gap and (best is None or gap < abs(best - index)):
+                    best = self.frames[j]
+        return best
+
+    def names(self) -> Iterator[str]:
+        for i in self.frames:
+            yield f"frame_{i:06d}.jpg"
+        yield from self.others
+
+def scan_folder(path: Path, *, fps: float, clip_seconds: float) -> FrameFolder:
+    """Catalog row for one frames folder (loose or packed)."""
+    video, clip = split_frames_dirname(path.name)
+    m = _LAST_DIGITS.search(clip or "")
+    frames, others = [], []
+    for name in folder_frames(path):
+        fm = _FRAME_FILE.fullmatch(name)
+        if fm:
+            frames.append(int(fm.group(1)))
+        else:
+            others.append(name)
+    return FrameFolder(
+        path.name, video, clip, fps,
+        int(m.group(1)) * clip_seconds if m else 0.0,
+        folder_file(path).stat().st_mtime_ns, sorted(frames), sorted(others),
+    )
+
+class FrameCatalog:
+    """In-memory indexes over the catalog rows plus the dedup map."""
+
+    def __init__(
+        self,
+        folders: List[FrameFolder],
+        frames_root: Path,
+        *, keep_rows: Optional[Dict[str, dict]] = None,
+        snap_seconds: float = 0.5,
+        fold_dedup: bool = True,
+        clip_seconds: float = 5.0,
+    ):
+        self.frames_root = Path(frames_root)
+        self.folders = {f.name: f for f in folders}
+        self._by_folder = {f.name.casefold(): f for f in folders}
+        self._by_video: Dict[str, List[FrameFolder]] = {}
+        for f in sorted(folders, key=lambda f: (f.video, f.offset_s)):
+            self._by_video.setdefault(f.video.casefold(), []).append(f)
+        self._by_name: Optional[Dict[str, Optional[str]]] = None
+        self._folded = {v: row.get("map", {}) for v, row in (keep_rows or {}).items()} if fold_dedup else {}
+        self.snap_seconds = snap_seconds
+        self.clip_seconds = clip_seconds
+        self.stats: Counter = Counter()
+        self.unresolved: List[str] = []
+        self._resolve_cached = lru_cache(maxsize=1 << 18)(self._resolve)
+
+    def __len__(self) -> int:
+        return sum(len(f.frames) + len(f.others) for f in self.folders.values())
+
+    # -- lookups ----------------------------------------------------------------
+
+    def key(self, image: str) -> Optional[str]:
+        """Canonical key of an image string naming an extracted frame exactly, else None."""
+        parts = str(image).replace("\\", "/").rsplit("/", 2)
+        if len(parts) < 2:
+            return None
+        folder = self._by_folder.get(parts[-2].casefold())
+        if folder is None or not self._contains(folder, parts[-1]):
+            return None
+        return f"{folder.name}/{parts[-1]}"
+
+    def info(self, key: str) -> FrameInfo:
+        folder_name, name = key.split("/", 1)
+        f = self.folders[folder_name]
+        m = _FRAME_FILE.fullmatch(name)
+        index = int(m.group(1)) if m else -1
+        ts = f.offset_s + max(index, 0) / f.fps if f.fps else f.offset_s
+        return FrameInfo(key, f.video, f.clip, index, round(ts, 6))
+
+    def path(self, key: str) -> Path:
+        return self.frames_root / key
+
+    def fold(self, key: str) -> str:
+        """The kept frame a dedup-dropped frame was folded into (the key itself otherwise)."""
+        folder, name = key.split("/", 1)
+        kept = self._folded.get(folder, {}).get(name)
+        return f"{folder}/{kept}" if kept else key
+
+    def canonical_image(self, image: str) -> str:
+        """frames_root/<key> for a resolvable external name; the name unchanged otherwise."""
+        key = self._resolve_cached(image)
+        return str(self.frames_root / key) if key else image
+
+    def summary(self, tag: str) -> str:
+        parts = ", ".join(f"{k}={self.stats[k]}" for k in RULES + ("folded", "unresolved") if self.stats[k])
+        line = f"[{tag}] frame resolution: {parts or 'no images'}"
+        if self.stats["unresolved"]:
+            line += f"; unresolved e.g. {', '.join(self.unresolved)} (kept as-is, will not join WD14 tags)"
+        return line
+
+    # -- resolution -------------------------------------------------------------
+
+    @staticmethod
+    def _contains(folder: FrameFolder, name: str) -> bool:
+        m = _FRAME_FILE.fullmatch(name)
+        if m and name == f"frame_{int(m.group(1)):06d}.jpg":
+            return folder.has(int(m.group(1)))
+        return name in folder.others
+
+    def _snap(self, folder: FrameFolder, index: int) -> Tuple[Optional[int], str]:
+        if folder.has(index):
+            return index, "frame"
+        n = folder.nearest(index, int(round(self.snap_seconds * folder.fps)))
+        return n, "nearest"
+
+    def _bare_name(self, name: str) -> Optional[str]:
+        if self._by_name is None:
+            index: Dict[str, Optional[str]] = {}
+            for f in self.folders.values():
+                for n in f.names():
+                    k = n.casefold()
+                    index[k] = None if k in index else f"{f.name}/{n}"
+            self._by_name = index
+        return self._by_name.get(name.casefold())
+
+    def _locate(self, image: str) -> Tuple[Optional[str], str]:
+        parts = [x for x in str(image).replace("\\", "/").strip().split("/") if x]
+        if not parts:
+            return None, "unresolved"
+        name = parts[-1]
+        m = _LAST_DIGITS.search(name.rsplit(".", 1)[0])
+        index = int(m.group(1)) if m else None
+        if len(parts) > 1:
+            parent = parts[-2].casefold()
+            folder = self._by_folder.get(parent)
+            if folder is not None:
+                if self._contains(folder, name):
+                    return f"{folder.name}/{name}", "exact"
+                if index is not None:
+                    n, rule = self._snap(folder, index)
+                    if n is not None:
+                        return f"{folder.name}/frame_{n:06d}.jpg", rule
+            clips = self._by_video.get(parent)
+            if clips and index is not None and clips[0].fps:
+                ts = index / clips[0].fps
+                at = [f for f in clips if f.offset_s <= ts + 1e-9] or clips[:1]
+                f = at[-1]
+                n, _rule = self._snap(f, int(round((ts - f.offset_s) * f.fps)))
+                if n is not None:
+                    return f"{f.name}/frame_{n:06d}.jpg", "timestamp"
+        key = self._bare_name(name)
+        if key is not None:
+            return key, "name"
+        return None, "unresolved"
+
+    def _resolve(self, image: str) -> Optional[str]:
+        key, rule = self._locate(image)
+        self.stats[rule] += 1
+        if key is None:
+            if len(self.unresolved) < 3:
+                self.unresolved.append(image)
+            return None
+        folded = self.fold(key)
+        if folded != key:
+            self.stats["folded"] += 1
+        return folded
+
+# ---------------------------------------------------------------------------
+# Persistence
+# ---------------------------------------------------------------------------
+
+def clip_offsets(
+    p: dict,
+    folders: Iterable[FrameFolder],
+    duration: Callable[[Path], Optional[float]],
+) -> Dict[str, float]:
+    """
+    Start time in the source video of each clip folder: the summed `duration` of the clips
+    before it in upscaled/<video>/. Clips after one that cannot be measured are left out.
+    """
+    offsets: Dict[str, float] = {}
+    for video in sorted({f.video for f in folders if f.clip}):
+        t = 0.0
+        for clip in sorted((Path(p["upscaled"]) / video).glob("clip_*.mp4")):
+            offsets[f"{video}{CLIP_SEP}{clip.stem}"] = round(t, 6)
+            d = duration(clip)
+            if not d:
+                break
+            t += d
+    return offsets
+
+def _read_rows(path: Path) -> Dict[str, FrameFolder]:
+    rows: Dict[str, FrameFolder] = {}
+    if path.exists():
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                row = FrameFolder(**ujson.loads(line))
+                rows[row.name] = row
+    return rows
+
+def load_catalog(cfg: dict, p: dict) -> FrameCatalog:
+    """Catalog of frames_root, rescanning folders that changed since it was last written."""
+    ccfg = cfg.get("catalog", {})
+    vcfg = cfg.get("video", {})
+    fps = float(cfg.get("frame_extract", {}).get("fps") or vcfg.get("fps") or 0)
+    clip_seconds = float(vcfg.get("clip_max_seconds", 5))
+    out = p["frames_catalog"]
+    prev = _read_rows(out)
+    folders, changed = [], False
+    for d in frame_folders(p["frames_root"]):
+        row = prev.pop(d.name, None)
+        if row is None or row.mtime_ns != folder_file(d).stat().st_mtime_ns or row.fps != fps:
+            row = scan_folder(d, fps=fps, clip_seconds=clip_seconds)
+            changed = True
+        folders.append(row)
+    if vcfg.get("split_fast_copy"):
+        cache = media_cache(cfg, p["work_root"])
+        offsets = clip_offsets(p, folders, lambda clip: getattr(cache.probe(clip), "duration", None))
+        cache.save()
+        for row in folders:
+            offset = offsets.get(row.name, row.offset_s)
+            if offset != row.offset_s:
+                row.offset_s, changed = offset, True
+    if changed or prev or not out.exists():
+        tmp = out.with_suffix(".jsonl.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for row in folders:
+                ujson.dump(asdict(row), f)
+                f.write("\n")
+        os.replace(tmp, out)
+    return FrameCatalog(
+        folders, p["frames_root"],
+        keep_rows=load_keep_rows(p["frames_keep"]),
+        snap_seconds=float(ccfg.get("snap_seconds", 0.5)),
+        fold_dedup=bool(ccfg.get("fold_dedup", True)),
+        clip_seconds=clip_seconds,
+    )
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""
+Packed frame folders: one uncompressed tar per clip instead of one JPEG file per frame.
+
+- With `frame_extract.pack`, frames/<folder>/frame_XXXXXX.jpg become members of
+  frames/<folder>.tar (plain USTAR, so `tar tf` / WebDataset loaders read it too).
+- Frames keep their virtual path frames/<folder>/<name>: catalog keys, keep-lists and tag
+  rows are the same for loose and packed folders, and readers accept both.
+- `FramePack` indexes a pack from its tar headers once and memory-maps it while frames are
+  read; frames are slices of the map, so reading a frame costs no open/stat/read call.
+  Readers are shared per process (`open_pack`) in bounded LRUs: MAX_PACKS indexes, of which
+  at most MAX_MAPPED are mapped, so the number of open files stays fixed however many
+  packs are listed. Writers drop the cached reader when they replace a pack.
+- `frame_folders` / `folder_frames` / `list_frames` list loose and packed folders alike;
+  `frame_file` hands a frame to PIL (the path, or a BytesIO over the packed bytes).
+"""
+
+from __future__ import annotations
+import glob
+import io
+import mmap
+import os
+import shutil
+import tarfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+
+from scripts.utils.paths import CLIP_SEP, split_frames_dirname
+
+PACK_SUFFIX = ".tar"
+_BLOCK = 512
+
+def pack_path(folder: Path) -> Path:
+    """frames/<folder> -> frames/<folder>.tar"""
+    folder = Path(folder)
+    return folder.with_name(folder.name + PACK_SUFFIX)
+
+def _index(buf) -> Dict[str, Tuple[int, int]]:
+    """name -> (data offset, size) of the regular members of a tar image."""
+    index: Dict[str, Tuple[int, int]] = {}
+    pos, end = 0, len(buf)
+    while pos + _BLOCK <= end:
+        hdr = buf[pos:pos + _BLOCK]
+        if hdr[0] == 0:  # end-of-archive block
+            break
+        name = hdr[0:100].split(b"\0", 1)[0].decode("utf-8")
+        prefix = hdr[345:500].split(b"\0", 1)[0].decode("utf-8")
+        size = int(hdr[124:136].split(b"\0", 1)[0].strip() or b"0", 8)
+        if hdr[156:157] in (b"0", b"\0"):
+            index[f"{prefix}/{name}" if prefix else name] = (pos + _BLOCK, size)
+        pos += _BLOCK + -(-size // _BLOCK) * _BLOCK
+    return index
+
+class FramePack:
+    """
+    Random-access reader of one frames pack. The index is parsed once and kept; the file is
+    memory-mapped only while frames are being read (at most MAX_MAPPED packs per process,
+    least recently read first out), so listing thousands of packs holds no open files.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            st = os.fstat(f.fileno())
+            self.mtime_ns = st.st_mtime_ns
+            if st.st_size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                    self.index = _index(buf)
+            else:
+                self.index = {}
+        self.names = sorted(self.index)
+        self._map: Optional[mmap.mmap] = None
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.index
+
+    def read(self, name: str) -> memoryview:
+        """Bytes of member `name` as a view of the map (KeyError if absent)."""
+        off, size = self.index[name]
+        with _LOCK:
+            return memoryview(_mapped(self))[off:off + size]
+
+    def __iter__(self) -> Iterator[Tuple[str, memoryview]]:
+        for name in self.names:
+            yield name, self.read(name)
+
+    def extract(self, name: str, dst: Path) -> str:
+        """
+        Write member `name` to `dst` as a standalone file; returns "unpacked", "skip" when
+        `dst` is already a file at least as new as the pack, or "missing".
+        """
+        if name not in self.index:
+            return "missing"
+        data = self.read(name)
+        try:
+            st = os.lstat(dst)
+            if not os.path.islink(dst) and st.st_size == len(data) and st.st_mtime_ns >= self.mtime_ns:
+                return "skip"
+            os.unlink(dst)  # may be a link to a loose frame of an earlier run; never write through it
+        except FileNotFoundError:
+            pass
+        with open(dst, "wb") as f:
+            f.write(data)
+        return "unpacked"
+
+    def close(self) -> None:
+        """Unmap the pack (it is mapped again by the next `read`)."""
+        with _LOCK:
+            _unmap(self)
+
+    def __enter__(self) -> "FramePack":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+class PackWriter:
+    """Write members into a temp file next to `path` and move it over `path` on `close()`."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        # Unique per writer: nodes sharing data/ must not write into one another's temp file.
+        self.tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        self._tar = tarfile.open(self.tmp, "w", format=tarfile.USTAR_FORMAT)
+        self._mtime = int(time.time())
+        self.count = 0
+
+    def add(self, name: str, data) -> None:
+        info = tarfile.TarInfo(name)
+        info.size, info.mtime, info.mode = len(data), self._mtime, 0o644
+        self._tar.addfile(info, io.BytesIO(data))
+        self.count += 1
+
+    def close(self) -> None:
+        self._tar.close()
+        forget_pack(self.path.with_suffix(""))
+        os.replace(self.tmp, self.path)
+
+    def abort(self) -> None:
+        self._tar.close()
+        self.tmp.unlink(missing_ok=True)
+
+def pack_folder(folder: Path) -> int:
+    """Pack the JPEGs of a loose frames folder into <folder>.tar and remove the folder."""
+    folder = Path(folder)
+    writer = PackWriter(pack_path(folder))
+    try:
+        for name in _loose_names(folder):
+            with open(folder / name, "rb") as f:
+                writer.add(name, f.read())
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+    shutil.rmtree(folder, ignore_errors=True)
+    return writer.count
+
+def remove_frames(folder: Path) -> None:
+    """Delete a frames folder in either form (loose directory and/or pack)."""
+    folder = Path(folder)
+    forget_pack(folder)
+    shutil.rmtree(folder, ignore_errors=True)
+    pack_path(folder).unlink(missing_ok=True)
+
+# ---------------------------------------------------------------------------
+# Shared readers
+# ---------------------------------------------------------------------------
+
+MAX_PACKS = 4096   # parsed indexes kept per process (no open files)
+MAX_MAPPED = 64    # packs mapped at once (one file handle each)
+
+_PACKS: "OrderedDict[str, Optional[FramePack]]" = OrderedDict()
+_MAPPED: "OrderedDict[int, FramePack]" = OrderedDict()
+_LOCK = threading.Lock()
+
+def _mapped(pack: FramePack) -> mmap.mmap:
+    """The map of `pack`, mapping it (and unmapping the least recently read) if needed."""
+    if pack._map is None:
+        with open(pack.path, "rb") as f:
+            pack._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        while len(_MAPPED) >= MAX_MAPPED:
+            _unmap(next(iter(_MAPPED.values())))
+    _MAPPED[id(pack)] = pack
+    _MAPPED.move_to_end(id(pack))
+    return pack._map
+
+def _unmap(pack: FramePack) -> None:
+    _MAPPED.pop(id(pack), None)
+    m, pack._map = pack._map, None
+    if m is not None:
+        try:
+            m.close()
+        except BufferError:  # a caller still holds a frame view; the map goes with it
+            pass
+
+def open_pack(folder: Path) -> Optional[FramePack]:
+    """The process-wide reader of <folder>.tar, or None when the folder is not packed."""
+    key = str(folder)
+    with _LOCK:
+        if key in _PACKS:
+            _PACKS.move_to_end(key)
+            return _PACKS[key]
+    path = pack_path(folder)
+    pack = FramePack(path) if path.is_file() else None
+    with _LOCK:
+        pack = _PACKS.setdefault(key, pack)
+        while len(_PACKS) > MAX_PACKS:
+            old = _PACKS.popitem(last=False)[1]
+            if old is not None:
+                _unmap(old)
+    return pack
+
+def forget_pack(folder: Path) -> None:
+    """Unmap and drop the cached reader of `folder` (before its pack is replaced or removed)."""
+    with _LOCK:
+        pack = _PACKS.pop(str(folder), None)
+        if pack is not None:
+            _unmap(pack)
+
+def frame_entry(path: Path) -> Path:
+    """The on-disk entry behind a frame: its folder's pack if packed, else the file itself."""
+    pack = open_pack(Path(path).parent)
+    return pack.path if pack is not None else Path(path)
+
+def folder_file(folder: Path) -> Path:
+    """The on-disk entry behind a frames folder: its pack if packed, else the directory."""
+    return pack_path(folder) if open_pack(folder) is not None else Path(folder)
+
+def frame_folders(frames_root: Path, pattern: str = "*") -> List[Path]:
+    """Virtual frames/<folder> paths of loose and packed folders matching `pattern`, sorted."""
+    root = Path(frames_root)
+    names = {d.name for d in root.glob(pattern) if d.is_dir()}
+    names.update(f.name[:-len(PACK_SUFFIX)] for f in root.glob(pattern + PACK_SUFFIX) if f.is_file())
+    return [root / n for n in sorted(names)]
+
+def video_frame_folders(frames_root: Path, video: str) -> List[Path]:
+    """Per-clip folders (<video>__<clip>, loose or packed) of exactly `video`, sorted."""
+    folders = frame_folders(frames_root, f"{glob.escape(video)}{CLIP_SEP}*")
+    return [d for d in folders if split_frames_dirname(d.name)[0] == video]  # not <video>__<x>__<clip>
+
+def _loose_names(folder: Path) -> List[str]:
+    with os.scandir(folder) as it:
+        return sorted(e.name for e in it if e.name.endswith(".jpg") and e.is_file())
+
+def folder_frames(folder: Path) -> List[str]:
+    """Sorted JPEG names of a frames folder (from the pack index when packed)."""
+    pack = open_pack(folder)
+    if pack is not None:
+        return [n for n in pack.names if n.endswith(".jpg")]
+    return _loose_names(folder) if Path(folder).is_dir() else []
+
+def list_frames(frames_root: Path) -> List[Path]:
+    """Virtual paths of every frame under frames_root (replaces `glob("*/*.jpg")`)."""
+    return [folder / name for folder in frame_folders(frames_root) for name in folder_frames(folder)]
+
+def frame_file(path: Path) -> Union[Path, BinaryIO]:
+    """Something `PIL.Image.open` accepts for a frame: the file, or its packed bytes."""
+    path = Path(path)
+    pack = open_pack(path.parent)
+    if pack is None:
+        return path
+    return io.BytesIO(pack.read(path.name))
+
+def frame_exists(path: Path) -> bool:
+    path = Path(path)
+    pack = open_pack(path.parent)
+    return path.name in pack if pack is not None else path.exists()
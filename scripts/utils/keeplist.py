@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Readers of the dedup keep-list (data/frames_keep.jsonl).
+
+- Kept apart from scripts/utils/dedup.py so the tagger, the frame catalog and the emitter
+  can filter frames without importing NumPy.
+- A frame's key is "<video folder>/<file name>" (`frame_key`).
+"""
+
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Set
+
+def frame_key(path) -> str:
+    """'<video folder>/<file name>' — stable across absolute/relative path spellings."""
+    p = Path(str(path).replace("\\", "/"))
+    return f"{p.parent.name}/{p.name}"
+
+def load_keep_rows(path: Path) -> Dict[str, dict]:
+    import ujson
+
+    rows: Dict[str, dict] = {}
+    if Path(path).exists():
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                row = ujson.loads(line)
+                rows[row["video"]] = row
+    return rows
+
+def load_keep_set(path: Path) -> Optional[Set[str]]:
+    """Set of kept frame keys (see `frame_key`), or None when no keep-list exists."""
+    if not Path(path).exists():
+        return None
+    keep: Set[str] = set()
+    for video, row in load_keep_rows(path).items():
+        keep.update(f"{video}/{n}" for n in row["keep"])
+    return keep
+
+def filter_kept(paths: Iterable, keep: Optional[Set[str]]) -> list:
+    """Keep only frames listed in the keep-list; pass everything through if there is none."""
+    if keep is None:
+        return list(paths)
+    return [p for p in paths if frame_key(p) in keep]
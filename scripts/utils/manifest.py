@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Per-stage build manifest so re-runs only redo new or changed work.
+
+- Each stage keeps data/.manifests/<stage>.json mapping input path -> signature + outputs.
+- An input is fresh when its size+mtime (or, if that changed, its content hash)
+  and the stage's config section are unchanged and all recorded outputs still exist.
+  A directory input is signed by the size+mtime of every file in it.
+- Inputs that disappeared are pruned together with the outputs they produced.
+"""
+
+from __future__ import annotations
+import hashlib
+import json
+import os
+import shutil
+import stat
+from pathlib import Path
+from typing import Any, Dict, Iterable, List
+
+MANIFEST_DIR = ".manifests"
+
+def config_hash(section: Any) -> str:
+    """Stable hash of the config values a stage depends on."""
+    blob = json.dumps(section, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(blob).hexdigest()
+
+def stat_sig(p: Path) -> str:
+    st = p.stat()
+    if stat.S_ISDIR(st.st_mode):
+        return dir_sig(p)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+def dir_sig(p: Path) -> str:
+    """
+    Signature of a directory input (e.g. a frames folder): name, size and mtime of each
+    file, since rewriting a file in place leaves the directory's own mtime unchanged.
+    """
+    h = hashlib.sha1()
+    for e in sorted(os.scandir(p), key=lambda e: e.name):
+        if e.is_file():
+            st = e.stat()
+            h.update(f"{e.name}:{st.st_size}:{st.st_mtime_ns}\n".encode("utf-8"))
+    return f"dir:{h.hexdigest()}"
+
+def content_hash(p: Path, chunk: int = 1 << 20) -> str:
+    h = hashlib.sha1()
+    with p.open("rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def remove_output(p: Path) -> None:
+    """Delete a file or directory output; missing paths are ignored."""
+    if p.is_dir() and not p.is_symlink():
+        shutil.rmtree(p, ignore_errors=True)
+    else:
+        try:
+            p.unlink()
+        except FileNotFoundError:
+            pass
+
+class Manifest:
+    """Input -> outputs bookkeeping for one stage. Call `save()` when done."""
+
+    def __init__(self, path: Path, config: Any, *, hash_content: bool = False, force: bool = False):
+        self.path = path
+        self.cfg_hash = config_hash(config)
+        self.hash_content = hash_content
+        self.force = force
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if path.exists():
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+                self.entries = data.get("entries", {})
+            except (OSError, ValueError):
+                self.entries = {}  # corrupt manifest = rebuild everything
+
+    @classmethod
+    def for_stage(cls, work_root: Path, stage: str, config: Any, **kw) -> "Manifest":
+        return cls(work_root / MANIFEST_DIR / f"{stage}.json", config, **kw)
+
+    @staticmethod
+    def key(src: Path) -> str:
+        return str(Path(src).resolve())
+
+    def is_fresh(self, src: Path, outputs: Iterable[Path] = ()) -> bool:
+        """True when `src` was already processed with the current config and outputs exist."""
+        if self.force:
+            return False
+        e = self.entries.get(self.key(src))
+        if not e or e.get("cfg") != self.cfg_hash:
+            return False
+        if not all(Path(o).exists() for o in (list(outputs) or e.get("outputs", []))):
+            return False
+        try:
+            sig = stat_sig(src)
+        except OSError:
+            return False
+        if sig == e.get("sig"):
+            return True
+        if self.hash_content and e.get("sha1") and content_hash(src) == e["sha1"]:
+            e["sig"] = sig  # touched but identical; refresh the fast path
+            return True
+        return False
+
+    def record(self, src: Path, outputs: Iterable[Path] = ()) -> None:
+        """Mark `src` as processed into `outputs` under the current config."""
+        e = {
+            "sig": stat_sig(src),
+            "cfg": self.cfg_hash,
+            "outputs": [str(o) for o in outputs],
+        }
+        if self.hash_content:
+            e["sha1"] = content_hash(src)
+        self.entries[self.key(src)] = e
+
+    def outputs(self, src: Path) -> List[Path]:
+        """Outputs recorded for `src` (empty when it was never processed)."""
+        return [Path(o) for o in self.entries.get(self.key(src), {}).get("outputs", [])]
+
+    def forget(self, src: Path) -> None:
+        self.entries.pop(self.key(src), None)
+
+    def prune(self, live: Iterable[Path], *, delete_outputs: bool = True) -> List[Path]:
+        """Drop entries whose input is no longer in `live`; return (and delete) their outputs."""
+        keep = {self.key(s) for s in live}
+        removed: List[Path] = []
+        for k in [k for k in self.entries if k not in keep]:
+            for o in self.entries.pop(k).get("outputs", []):
+                removed.append(Path(o))
+                if delete_outputs:
+                    remove_output(Path(o))
+        return removed
+
+    def save(self) -> None:
+        """Atomically persist the manifest (temp file + rename)."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps({"cfg": self.cfg_hash, "entries": self.entries}), encoding="utf-8")
+        os.replace(tmp, self.path)
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+ffprobe-backed media info with a persistent cache.
+
+- `MediaCache.probe(path)` returns a `MediaInfo` (codec, size, pix_fmt, fps, duration, frame
+  count, keyframe timestamps, audio present) or None when the file cannot be read.
+- Results are kept in data/.cache/media_info.json keyed by absolute path and invalidated by
+  size + mtime, so each file is probed once across stages and runs. Safe to share between
+  threads; stages call `save()` when done.
+- Uses ffprobe (`paths.ffprobe_bin`, default: ffprobe next to `paths.ffmpeg_bin`). Without
+  one, a single `ffmpeg -c copy -f framecrc` pass is parsed instead (stream header from
+  stderr, packet timestamps/flags from stdout); nothing is decoded either way.
+- Stage helpers: `conforms` (already at the target codec/size/fps/pix_fmt), `keyframe_splits`
+  (split points on real keyframes, clips <= clip_seconds where possible), `aligned_splits`
+  (keyframes on every clip boundary -> split by stream copy) and `predict_clips`.
+"""
+
+from __future__ import annotations
+import json
+import math
+import os
+import re
+import shutil
+import subprocess
+import threading
+from bisect import bisect_right
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+CACHE_VERSION = 1
+
+@dataclass
+class MediaInfo:
+    codec: str
+    width: int
+    height: int
+    pix_fmt: str
+    fps: float
+    duration: float
+    frames: int
+    keyframes: List[float] = field(default_factory=list)   # seconds, ascending
+    audio: bool = False
+
+# ---------------------------------------------------------------------------
+# Probing
+# ---------------------------------------------------------------------------
+
+def _rate(s: Optional[str]) -> float:
+    num, _, den = (s or "0/1").partition("/")
+    try:
+        return float(num) / float(den or 1) if float(den or 1) else 0.0
+    except ValueError:
+        return 0.0
+
+def ffprobe_args(ffprobe_bin: str, path: Path) -> List[str]:
+    return [
+        ffprobe_bin, "-v", "error", "-of", "json",
+        "-show_entries",
+        "stream=index,codec_type,codec_name,width,height,pix_fmt,avg_frame_rate,r_frame_rate,duration"
+        ":format=duration:packet=stream_index,pts_time,flags",
+        str(path),
+    ]
+
+def parse_ffprobe(data: dict) -> Optional[MediaInfo]:
+    """MediaInfo from `ffprobe -of json` output of `ffprobe_args`."""
+    streams = data.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    if video is None:
+        return None
+    keyframes, frames = [], 0
+    for pkt in data.get("packets", []):
+        if pkt.get("stream_index") != video.get("index"):
+            continue
+        frames += 1
+        if "K" in pkt.get("flags", "") and pkt.get("pts_time") not in (None, "N/A"):
+            keyframes.append(round(float(pkt["pts_time"]), 6))
+    duration = data.get("format", {}).get("duration") or video.get("duration") or 0
+    return MediaInfo(
+        codec=video.get("codec_name", ""),
+        width=int(video.get("width", 0)),
+        height=int(video.get("height", 0)),
+        pix_fmt=video.get("pix_fmt", ""),
+        fps=round(_rate(video.get("avg_frame_rate")) or _rate(video.get("r_frame_rate")), 6),
+        duration=float(duration),
+        frames=frames,
+        keyframes=sorted(keyframes),
+        audio=any(s.get("codec_type") == "audio" for s in streams),
+    )
+
+_DURATION = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+_VIDEO = re.compile(r"Stream #\d+:\d+\S*: Video: (\w+)[^,]*, (\w+)")
+_SIZE = re.compile(r", (\d{2,5})x(\d{2,5})")
+_FPS = re.compile(r", ([\d.]+(?:k)?) fps")
+_AUDIO = re.compile(r"Stream #\d+:\d+\S*: Audio:")
+
+def ffmpeg_probe_args(ffmpeg_bin: str, path: Path) -> List[str]:
+    return [ffmpeg_bin, "-nostdin", "-hide_banner", "-i", str(path),
+            "-map", "0:v:0", "-c", "copy", "-f", "framecrc", "-"]
+
+def parse_ffmpeg_probe(stderr: str, stdout: str) -> Optional[MediaInfo]:
+    """MediaInfo from the input banner (stderr) and framecrc packets (stdout) of `ffmpeg_probe_args`."""
+    stream_line = next((l for l in stderr.splitlines() if _VIDEO.search(l)), None)
+    if stream_line is None:
+        return None
+    vm = _VIDEO.search(stream_line)
+    sm = _SIZE.search(stream_line)
+    fm = _FPS.search(stream_line)
+    dm = _DURATION.search(stderr)
+    tb = 0.0
+    keyframes, frames = [], 0
+    for line in stdout.splitlines():
+        if line.startswith("#tb 0:"):
+            tb = _rate(line.split(":", 1)[1].strip())
+        elif line and not line.startswith("#"):
+            cols = [c.strip() for c in line.split(",")]
+            frames += 1
+            flags = next((c[2:] for c in cols[6:] if c.startswith("F=")), None)
+            if flags is None or int(flags, 16) & 1:  # framecrc omits F= for plain keyframes
+                keyframes.append(round(int(cols[2]) * tb, 6))
+    fps = fm.group(1) if fm else "0"
+    return MediaInfo(
+        codec=vm.group(1),
+        width=int(sm.group(1)) if sm else 0,
+        height=int(sm.group(2)) if sm else 0,
+        pix_fmt=vm.group(2),
+        fps=float(fps[:-1]) * 1000 if fps.endswith("k") else float(fps),
+        duration=int(dm.group(1)) * 3600 + int(dm.group(2)) * 60 + float(dm.group(3)) if dm else 0.0,
+        frames=frames,
+        keyframes=sorted(keyframes),
+        audio=bool(_AUDIO.search(stderr)),
+    )
+
+def probe_file(path: Path, *, ffmpeg_bin: str = "ffmpeg", ffprobe_bin: Optional[str] = None) -> Optional[MediaInfo]:
+    """Probe one file (uncached); None if it has no readable video stream."""
+    if ffprobe_bin:
+        proc = subprocess.run(ffprobe_args(ffprobe_bin, path), capture_output=True, text=True)
+        if proc.returncode != 0:
+            return None
+        return parse_ffprobe(json.loads(proc.stdout or "{}"))
+    proc = subprocess.run(ffmpeg_probe_args(ffmpeg_bin, path), capture_output=True, text=True)
+    if proc.returncode != 0:
+        return None
+    return parse_ffmpeg_probe(proc.stderr, proc.stdout)
+
+def find_ffprobe(cfg: dict) -> Optional[str]:
+    """`paths.ffprobe_bin`, else an ffprobe beside ffmpeg_bin or on PATH (None if absent)."""
+    pcfg = cfg.get("paths", {})
+    if pcfg.get("ffprobe_bin"):
+        return pcfg["ffprobe_bin"]
+    ff = pcfg.get("ffmpeg_bin", "ffmpeg")
+    sibling = Path(ff).with_name(Path(ff).name.replace("ffmpeg", "ffprobe"))
+    return shutil.which(str(sibling)) if Path(ff).parent != Path(".") else shutil.which("ffprobe")
+
+# ---------------------------------------------------------------------------
+# Cache
+# ---------------------------------------------------------------------------
+
+class MediaCache:
+    """path -> MediaInfo, persisted as JSON and invalidated by size + mtime."""
+
+    def __init__(self, path: Path, *, ffmpeg_bin: str = "ffmpeg", ffprobe_bin: Optional[str] = None):
+        self.path = Path(path)
+        self.ffmpeg_bin = ffmpeg_bin
+        self.ffprobe_bin = ffprobe_bin
+        self.lock = threading.Lock()
+        self.entries: Dict[str, dict] = {}
+        self.dirty = False
+        if self.path.exists():
+            try:
+                data = json.loads(self.path.read_text(encoding="utf-8"))
+                if data.get("version") == CACHE_VERSION:
+                    self.entries = data.get("files", {})
+            except (OSError, ValueError):
+                pass
+
+    def probe(self, path: Path) -> Optional[MediaInfo]:
+        path = Path(path).resolve()
+        st = path.stat()
+        key = str(path)
+        with self.lock:
+            e = self.entries.get(key)
+        if e and e["size"] == st.st_size and e["mtime_ns"] == st.st_mtime_ns:
+            return MediaInfo(**e["info"]) if e["info"] else None
+        info = probe_file(path, ffmpeg_bin=self.ffmpeg_bin, ffprobe_bin=self.ffprobe_bin)
+        with self.lock:
+            self.entries[key] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                                 "info": asdict(info) if info else None}
+            self.dirty = True
+        return info
+
+    def save(self) -> None:
+        with self.lock:
+            if not self.dirty:
+                return
+            live = {k: v for k, v in self.entries.items() if os.path.exists(k)}
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Shards share this file: a per-process temp name keeps their writes apart; the last
+            # rename wins, and entries it drops are simply probed again.
+            tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            tmp.write_text(json.dumps({"version": CACHE_VERSION, "files": live}), encoding="utf-8")
+            os.replace(tmp, self.path)
+            self.entries, self.dirty = live, False
+
+_CACHES: Dict[str, MediaCache] = {}
+
+def media_cache(cfg: dict, work_root: Path) -> MediaCache:
+    """The process-wide cache for `work_root` (data/.cache/media_info.json)."""
+    path = Path(work_root) / ".cache" / "media_info.json"
+    key = str(path.resolve())
+    if key not in _CACHES:
+        _CACHES[key] = MediaCache(path, ffmpeg_bin=cfg.get("paths", {}).get("ffmpeg_bin", "ffmpeg"),
+                                  ffprobe_bin=find_ffprobe(cfg))
+    return _CACHES[key]
+
+# ---------------------------------------------------------------------------
+# Stage helpers
+# ---------------------------------------------------------------------------
+
+def conforms(
+    info: Optional[MediaInfo],
+    *, fps: float,
+    pix_fmt: str,
+    size: Optional[int] = None,
+    codec: str = "h264",
+) -> bool:
+    """True when `info` already has the target codec, fps, pix_fmt (and size x size, if given)."""
+    if info is None:
+        return False
+    if size is not None and (info.width, info.height) != (size, size):
+        return False
+    return info.codec == codec and info.pix_fmt == pix_fmt and abs(info.fps - fps) < 0.01
+
+def keyframe_splits(info: MediaInfo, clip_seconds: float) -> List[float]:
+    """
+    Split times on real keyframes: each clip ends on the last keyframe within `clip_seconds`
+    of its start, or on the next keyframe when there is none (copy splits cannot cut elsewhere).
+    """
+    eps = 0.5 / info.fps if info.fps else 1e-3
+    kfs = [k for k in info.keyframes if k > eps]
+    splits: List[float] = []
+    start = 0.0
+    while start + clip_seconds < info.duration - eps:
+        j = bisect_right(kfs, start + clip_seconds + eps) - 1
+        if j >= 0 and kfs[j] > start + eps:
+            cut = kfs[j]
+        else:
+            nxt = bisect_right(kfs, start + eps)
+            if nxt >= len(kfs):
+                break
+            cut = kfs[nxt]
+        splits.append(cut)
+        start = cut
+    return splits
+
+def aligned_splits(info: MediaInfo, clip_seconds: float) -> Optional[List[float]]:
+    """Keyframe times on every clip_seconds boundary (within half a frame), or None."""
+    eps = 0.5 / info.fps if info.fps else 1e-3
+    splits = []
+    n = math.ceil(info.duration / clip_seconds - 1e-6)
+    for k in range(1, n):
+        t = k * clip_seconds
+        j = bisect_right(info.keyframes, t + eps) - 1
+        if j < 0 or abs(info.keyframes[j] - t) > eps:
+            return None
+        splits.append(info.keyframes[j])
+    return splits
+
+def predict_clips(info: Optional[MediaInfo], clip_seconds: float, splits: Optional[List[float]] = None) -> int:
+    """Number of clips a split will produce (0 when the source could not be probed)."""
+    if info is None:
+        return 0
+    if splits is not None:
+        return len(splits) + 1
+    return max(1, math.ceil(info.duration / clip_seconds - 1e-6))
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+Stage instrumentation shared by the pipeline scripts.
+
+- `StageMetrics` (a context manager) records wall time, CPU time (own + child processes
+  such as ffmpeg), peak RSS, items processed, bytes read/written and throughput.
+- Per-item records (e.g. one per ffmpeg job, with encode fps/speed parsed from
+  `-progress`) and the stage summary are appended to data/reports/<run_id>.jsonl.
+- Scripts chained in one run share a report by exporting PIPELINE_RUN_ID.
+- Bytes are what the stage reports for its own inputs/outputs (a directory counts the files
+  below it). A stage that reports none, or a path that cannot be read, records None ("n/a")
+  rather than a 0 that looks like a measurement.
+- `python -m scripts.utils.metrics data/reports/<run_id>.jsonl [...]` prints a summary table.
+"""
+
+from __future__ import annotations
+import json
+import os
+import stat
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+RUN_ID_ENV = "PIPELINE_RUN_ID"
+
+def run_id() -> str:
+    """Current run id (shared via PIPELINE_RUN_ID, else timestamp + pid, set once per process)."""
+    rid = os.environ.get(RUN_ID_ENV)
+    if not rid:
+        rid = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"  # shards may start in the same second
+        os.environ[RUN_ID_ENV] = rid  # child processes join the same report
+    return rid
+
+def _vm_hwm() -> Optional[int]:
+    """Linux high-water RSS of this process image (ru_maxrss survives exec from a big parent)."""
+    try:
+        with open("/proc/self/status", "rb") as f:
+            for line in f:
+                if line.startswith(b"VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+def peak_rss() -> Dict[str, Optional[int]]:
+    """Peak resident set size in bytes for this process and its (waited-for) children."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        try:
+            import psutil
+            return {"self": psutil.Process().memory_info().peak_wset, "children": None}
+        except Exception:
+            return {"self": None, "children": None}
+    scale = 1 if sys.platform == "darwin" else 1024  # ru_maxrss: bytes on macOS, KiB elsewhere
+    return {
+        "self": _vm_hwm() or resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale,
+    }
+
+def _tree_bytes(d: str) -> Optional[int]:
+    total = 0
+    try:
+        with os.scandir(d) as it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False):
+                    n = _tree_bytes(e.path)
+                    if n is None:
+                        return None
+                    total += n
+                elif e.is_file():
+                    total += e.stat().st_size
+    except OSError:
+        return None
+    return total
+
+def path_bytes(p: Path) -> Optional[int]:
+    """Size of a file or of the files below a directory; 0 if missing, None if unreadable."""
+    try:
+        st = os.stat(p)
+    except FileNotFoundError:
+        return 0
+    except OSError:
+        return None
+    return _tree_bytes(os.fspath(p)) if stat.S_ISDIR(st.st_mode) else st.st_size
+
+def _fmt_bytes(n: Optional[float]) -> str:
+    if n is None:
+        return "n/a"
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+class StageMetrics:
+    """
+    Measure one stage. Use as `with StageMetrics("upscale", work_root) as m:` and call
+    `m.add_items`, `m.add_read`, `m.add_written`, `m.item`, `m.jobs` while working.
+    """
+
+    def __init__(self, stage: str, work_root: Path, *, quiet: bool = False):
+        self.stage = stage
+        self.report = Path(work_root) / "reports" / f"{run_id()}.jsonl"
+        self.quiet = quiet
+        self.items = 0
+        # None until the stage reports a path, and again once a path could not be measured.
+        self.bytes_read: Optional[int] = None
+        self.bytes_written: Optional[int] = None
+        self._unmeasured: set = set()
+        self.extra: Dict[str, Any] = {}
+        self._records: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    # -- counters ------------------------------------------------------------
+
+    def add_items(self, n: int = 1) -> None:
+        with self._lock:
+            self.items += n
+
+    def _add_bytes(self, counter: str, paths: Iterable[Path]) -> Optional[int]:
+        sizes = [path_bytes(p) for p in paths]
+        n = None if None in sizes else sum(sizes)
+        with self._lock:
+            if n is None:
+                self._unmeasured.add(counter)
+            total = None if counter in self._unmeasured else (getattr(self, counter) or 0) + n
+            setattr(self, counter, total)
+        return n
+
+    def add_read(self, *paths: Path) -> Optional[int]:
+        """Count `paths` as read; returns their size (None if one could not be measured)."""
+        return self._add_bytes("bytes_read", paths)
+
+    def add_written(self, *paths: Path) -> Optional[int]:
+        """Count `paths` as written; returns their size (None if one could not be measured)."""
+        return self._add_bytes("bytes_written", paths)
+
+    def item(self, name: str, seconds: float, **fields: Any) -> None:
+        """Record one processed item (file, clip, job...)."""
+        with self._lock:
+            self._records.append({"type": "item", "stage": self.stage, "name": str(name),
+                                  "seconds": round(seconds, 4), **fields})
+
+    def jobs(self, results: Iterable[Any]) -> None:
+        """Record ffmpeg `JobResult`s (incl. parsed -progress stats) as items."""
+        for r in results:
+            self.add_items()
+            self.item(r.name, r.seconds, ok=r.ok, **(r.progress or {}))
+
+    # -- lifecycle -----------------------------------------------------------
+
+    def __enter__(self) -> "StageMetrics":
+        self._t0 = time.perf_counter()
+        self._cpu0 = os.times()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        wall = time.perf_counter() - self._t0
+        cpu = os.times()
+        rss = peak_rss()
+        summary = {
+            "type": "stage",
+            "run_id": run_id(),
+            "stage": self.stage,
+            "ok": exc_type is None,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(time.time() - wall)),
+            "wall_s": round(wall, 4),
+            "cpu_s": round((cpu.user - self._cpu0.user) + (cpu.system - self._cpu0.system), 4),
+            "child_cpu_s": round((cpu.children_user - self._cpu0.children_user)
+                                 + (cpu.children_system - self._cpu0.children_system), 4),
+            "peak_rss": rss["self"],
+            "child_peak_rss": rss["children"],
+            "items": self.items,
+            "items_per_s": round(self.items / wall, 3) if wall > 0 else None,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "read_mb_per_s": round(self.bytes_read / 1e6 / wall, 3) if wall > 0 and self.bytes_read is not None else None,
+            **self.extra,
+        }
+        try:
+            self.report.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.report, "a", encoding="utf-8") as f:
+                for rec in self._records:
+                    f.write(json.dumps(rec) + "\n")
+                f.write(json.dumps(summary) + "\n")
+        except OSError as e:
+            print(f"[metrics] could not write {self.report}: {e}", file=sys.stderr)
+        if not self.quiet:
+            print(
+                f"[metrics] {self.stage}: {self.items} items in {wall:.1f}s"
+                f" ({summary['items_per_s'] or 0:.2f}/s), cpu {summary['cpu_s']:.1f}s"
+                f" + children {summary['child_cpu_s']:.1f}s, peak rss {_fmt_bytes(rss['self'])}"
+                f" (children {_fmt_bytes(rss['children'])}), read {_fmt_bytes(self.bytes_read)},"
+                f" wrote {_fmt_bytes(self.bytes_written)} -> {self.report}"
+            )
+
+# ---------------------------------------------------------------------------
+# Report reading
+# ---------------------------------------------------------------------------
+
+def load_stage_records(paths: Iterable[Path]) -> List[Dict[str, Any]]:
+    out = []
+    for p in paths:
+        with open(p, "r", encoding="utf-8") as f:
+            for line in f:
+                rec = json.loads(line)
+                if rec.get("type") == "stage":
+                    out.append(rec)
+    return out
+
+def summary_table(records: List[Dict[str, Any]]) -> str:
+    head = f"{'run':<22} {'stage':<10} {'wall s':>8} {'cpu s':>8} {'child s':>8} {'items':>8} {'items/s':>9} {'peak rss':>10} {'read':>10} {'wrote':>10}"
+    lines = [head, "-" * len(head)]
+    for r in records:
+        lines.append(
+            f"{r['run_id']:<22} {r['stage']:<10} {r['wall_s']:>8.1f} {r['cpu_s']:>8.1f} {r['child_cpu_s']:>8.1f}"
+            f" {r['items']:>8} {r['items_per_s'] or 0:>9.2f} {_fmt_bytes(r['peak_rss']):>10}"
+            f" {_fmt_bytes(r['bytes_read']):>10} {_fmt_bytes(r['bytes_written']):>10}"
+        )
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python -m scripts.utils.metrics <report.jsonl> [...]", file=sys.stderr)
+        raise SystemExit(2)
+    print(summary_table(load_stage_records(Path(a) for a in sys.argv[1:])))
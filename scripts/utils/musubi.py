@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Musubi-Tuner dataset emission helpers (image and video mode).
+
+- Emission is driven by captions: only frames that have a caption are placed.
+- Caption rows are matched to extracted frames through the frame catalog (O(1) key lookups);
+  rows naming no extracted frame are counted as "unresolved" instead of guessed at.
+- Frames are placed with copy/hardlink/reflink/symlink (see linking.py) in a thread pool;
+  frames of packed folders (framepack.py) are written out of the memory-mapped pack.
+- Files under images/ that no longer correspond to a caption are removed.
+- Video mode places the upscaled clips themselves under videos/ with one <clip>.txt caption
+  each (from captions_clips.jsonl) and writes dataset.toml. Clips are checked against the
+  target fps/size/frame count from cached probe data (media_info.py); nothing is decoded.
+"""
+
+from __future__ import annotations
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from scripts.utils.framepack import open_pack
+from scripts.utils.linking import place_file
+from scripts.utils.media_info import MediaInfo
+
+PACK_MODES = ("image", "video")
+
+def caption_map(
+    rows: Iterable[Tuple[str, str]], catalog, keep: Optional[Set[str]],
+) -> Tuple[Dict[str, str], int]:
+    """
+    captions.txt rel path -> caption for (image, caption) rows naming kept extracted frames,
+    plus the number of rows whose image is not an extracted frame.
+    """
+    out: Dict[str, str] = {}
+    unresolved = 0
+    for image, cap in rows:
+        key = catalog.key(image)
+        if key is None:
+            unresolved += 1
+        elif keep is None or key in keep:
+            out[f"images/{key}"] = cap
+    return out, unresolved
+
+def frame_source(frames_root: Path, rel: str) -> Path:
+    """Canonical extracted-frame path behind a dataset rel path."""
+    _images, video, name = rel.split("/", 2)
+    return frames_root / video / name
+
+def write_captions(out_root: Path, captions: Dict[str, str]) -> Path:
+    """Write captions.txt as sorted "<relpath>\\t<caption>" lines."""
+    out = out_root / "captions.txt"
+    with open(out, "w", encoding="utf-8") as f:
+        for rel, cap in sorted(captions.items()):
+            f.write(f"{rel}\t{cap}\n")
+    return out
+
+def prune_images(img_root: Path, expected: Iterable[str], out_root: Path) -> int:
+    """Delete dataset files (and emptied folders) not in `expected` rel paths."""
+    want = set(expected)
+    removed = 0
+    if not img_root.exists():
+        return 0
+    for dirpath, dirnames, filenames in os.walk(img_root, topdown=False):
+        for fn in filenames:
+            full = Path(dirpath) / fn
+            if full.relative_to(out_root).as_posix() not in want:
+                full.unlink()
+                removed += 1
+        if dirpath != str(img_root) and not os.listdir(dirpath):
+            os.rmdir(dirpath)
+    return removed
+
+def emit_images(
+    out_root: Path,
+    frames_root: Path,
+    captions: Dict[str, str],
+    *, mode: str = "hardlink",
+    workers: int = 8,
+) -> Tuple[Dict[str, str], Counter]:
+    """
+    Place every captioned frame under out_root/images/ and prune stale files.
+
+    Returns (captions whose frame exists, Counter of placement methods incl. "missing").
+    """
+    img_root = out_root / "images"
+    jobs = []
+    for rel in captions:
+        src = frame_source(frames_root, rel)
+        jobs.append((rel, src, out_root / rel))
+    for d in {dst.parent for _rel, _src, dst in jobs}:
+        d.mkdir(parents=True, exist_ok=True)
+
+    def place(job) -> str:
+        _rel, src, dst = job
+        pack = open_pack(src.parent)
+        if pack is not None:
+            return pack.extract(src.name, dst)
+        if not src.exists():
+            return "missing"
+        return place_file(src, dst, mode)
+
+    stats: Counter = Counter()
+    kept: Dict[str, str] = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for (rel, _src, _dst), how in zip(jobs, pool.map(place, jobs, chunksize=256)):
+            stats[how] += 1
+            if how != "missing":
+                kept[rel] = captions[rel]
+    stats["removed"] = prune_images(img_root, kept.keys(), out_root)
+    return kept, stats
+
+# ---------------------------------------------------------------------------
+# Video mode
+# ---------------------------------------------------------------------------
+
+def check_clip(info: Optional[MediaInfo], *, fps: float, size: int, min_frames: int) -> Optional[str]:
+    """Why a probed clip cannot be used as-is (None = fine)."""
+    if info is None:
+        return "unreadable"
+    if (info.width, info.height) != (size, size):
+        return f"size {info.width}x{info.height} != {size}x{size}"
+    if abs(info.fps - fps) >= 0.01:
+        return f"fps {info.fps:g} != {fps:g}"
+    if info.frames < min_frames:
+        return f"{info.frames} frames < {min_frames}"
+    return None
+
+def emit_videos(
+    out_root: Path,
+    clips: Dict[str, Tuple[Path, str]],
+    probe: Callable[[Path], Optional[MediaInfo]],
+    *, fps: float,
+    size: int,
+    min_frames: int,
+    mode: str = "hardlink",
+    workers: int = 8,
+) -> Tuple[Dict[str, str], Counter, List[Tuple[str, str]]]:
+    """
+    Place every valid clip (name -> (source video, caption)) as out_root/videos/<name>.mp4
+    next to <name>.txt and prune stale files.
+
+    Returns (name -> caption of placed clips, Counter of placement methods incl. "missing"
+    and "rejected", [(name, reason)] of rejected clips).
+    """
+    vid_root = out_root / "videos"
+    vid_root.mkdir(parents=True, exist_ok=True)
+
+    def place(item) -> Tuple[str, Optional[str]]:
+        name, (src, _cap) = item
+        if not src.exists():
+            return "missing", None
+        reason = check_clip(probe(src), fps=fps, size=size, min_frames=min_frames)
+        if reason:
+            return "rejected", reason
+        return place_file(src, vid_root / f"{name}.mp4", mode), None
+
+    stats: Counter = Counter()
+    kept: Dict[str, str] = {}
+    rejected: List[Tuple[str, str]] = []
+    items = sorted(clips.items())
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for (name, (_src, cap)), (how, reason) in zip(items, pool.map(place, items)):
+            stats[how] += 1
+            if reason:
+                rejected.append((name, reason))
+            elif how != "missing":
+                kept[name] = cap
+    for name, cap in kept.items():
+        txt = vid_root / f"{name}.txt"
+        if not txt.exists() or txt.read_text(encoding="utf-8") != cap:
+            txt.write_text(cap, encoding="utf-8")
+    expected = [f"videos/{name}{ext}" for name in kept for ext in (".mp4", ".txt")]
+    stats["removed"] = prune_images(vid_root, expected, out_root)
+    return kept, stats, rejected
+
+def _toml(v) -> str:
+    if isinstance(v, bool):
+        return "true" if v else "false"
+    if isinstance(v, (list, tuple)):
+        return "[" + ", ".join(_toml(x) for x in v) + "]"
+    if isinstance(v, (Path, str)):
+        return '"' + str(v).replace("\\", "/").replace('"', '\\"') + '"'
+    return repr(v) if isinstance(v, float) else str(v)
+
+def write_dataset_toml(
+    out_root: Path,
+    *, size: int,
+    fps: float,
+    target_frames: Sequence[int],
+    frame_extraction: str = "head",
+    batch_size: int = 1,
+    num_repeats: int = 1,
+) -> Path:
+    """Musubi-Tuner dataset config for the videos/ directory (<name>.txt captions)."""
+    general = {"resolution": [size, size], "caption_extension": ".txt",
+               "batch_size": batch_size, "enable_bucket": False}
+    dataset = {"video_directory": (out_root / "videos").resolve(),
+               "cache_directory": (out_root / "cache").resolve(),
+               "target_frames": list(target_frames), "frame_extraction": frame_extraction,
+               "source_fps": float(fps), "num_repeats": num_repeats}
+    lines = ["[general]"] + [f"{k} = {_toml(v)}" for k, v in general.items()]
+    lines += ["", "[[datasets]]"] + [f"{k} = {_toml(v)}" for k, v in dataset.items()]
+    out = out_root / "dataset.toml"
+    out.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return out
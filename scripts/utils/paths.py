@@ -3,37 +3,186 @@
 Utility helpers for resolving paths used across the pipeline.
 
 - Centralizes path handling and config loading.
-- Creates working directories on demand, so downstream scripts can assume they exist.
+- `load_config` parses config.yaml once per process (again only when the file changes), so
+  stages chained in one interpreter (`python -m scripts 20 25 30`) share one parse.
+- `paths(cfg)` is a cached, read-only mapping whose entries are resolved on first use;
+  working directories are created when a stage first asks for them, not up front.
+- `video_settings(cfg)` is the typed `video:` block shared by the split/upscale stages.
 """
 
 from __future__ import annotations
+import os
+from dataclasses import dataclass
+from functools import cached_property
 from pathlib import Path
-from typing import Dict, Any
-import yaml
+from typing import Any, Dict, Iterator, Mapping, Tuple
+
+_CONFIGS: Dict[Path, Tuple[Tuple[int, int], Dict[str, Any]]] = {}
 
 def load_config(cfg_path: Path = Path("config.yaml")) -> Dict[str, Any]:
-    """Load YAML config once; downstream scripts import this to keep behavior consistent."""
-    with cfg_path.open("r", encoding="utf-8") as f:
-        return yaml.safe_load(f)
+    """
+    Load the YAML config; downstream scripts import this to keep behavior consistent.
+    The parsed dict is shared by every caller in the process: treat it as read-only.
+    """
+    key = Path(cfg_path).resolve()
+    st = os.stat(key)
+    sig = (st.st_mtime_ns, st.st_size)
+    cached = _CONFIGS.get(key)
+    if cached is None or cached[0] != sig:
+        import yaml
+
+        with key.open("r", encoding="utf-8") as f:
+            cached = _CONFIGS[key] = (sig, yaml.safe_load(f))
+    return cached[1]
 
 def ensure_dir(p: Path) -> Path:
     """Create directory if missing and return it for chaining."""
     p.mkdir(parents=True, exist_ok=True)
     return p
 
-def paths(cfg: Dict[str, Any]) -> Dict[str, Path]:
-    """Compute canonical working paths used across the pipeline."""
-    work_root = Path(cfg["paths"]["work_root"]).resolve()
-    p = {
-        "input_videos": Path(cfg["paths"]["input_videos"]).resolve(),
-        "work_root": work_root,
-        "normalized_videos": ensure_dir(work_root / "normalized_videos"),
-        "frames_root": ensure_dir(work_root / "frames"),
-        "tags_raw": ensure_dir(work_root / "tags_raw"),
-        "tags_merged_dir": ensure_dir(work_root / "tags_merged"),
-        "tags_merged": ensure_dir(work_root / "tags_merged") / "merged.jsonl",
-        "captions_clean": work_root / "captions_clean.jsonl",
-
-        "musubi_root": ensure_dir(Path(cfg["musubi"]["dataset_root"]).resolve()),
-    }
-    return p
+class PipelinePaths(Mapping[str, Path]):
+    """
+    Canonical working paths, as attributes or `p["frames_root"]`. Each entry is resolved on
+    first access; directory entries are created then, file entries get their parent folder.
+    """
+
+    def __init__(self, cfg: Dict[str, Any]):
+        self._cfg = cfg["paths"]
+        self._dataset_root = cfg["musubi"]["dataset_root"]
+
+    def _path(self, key: str, default: Any) -> Path:
+        return Path(self._cfg.get(key) or default).resolve()
+
+    @cached_property
+    def work_root(self) -> Path:
+        return ensure_dir(self._path("work_root", "data"))
+
+    @cached_property
+    def input_videos(self) -> Path:
+        # paths.input_videos (the review folder); paths.input_videos_dir is the older key 08 read.
+        return self._path("input_videos_dir", self._cfg.get("input_videos") or "data/input_videos")
+
+    @cached_property
+    def normalized_videos(self) -> Path:
+        return ensure_dir(self.work_root / "normalized_videos")
+
+    @cached_property
+    def split_clips(self) -> Path:
+        return self._path("split_clips_dir", self.work_root / "clips_5s")
+
+    @cached_property
+    def upscaled(self) -> Path:
+        return self._path("upscaled_256_dir", self.work_root / "upscaled_256")
+
+    @cached_property
+    def frames_root(self) -> Path:
+        return ensure_dir(self.work_root / "frames")
+
+    @cached_property
+    def frames_keep(self) -> Path:
+        return self.work_root / "frames_keep.jsonl"
+
+    @cached_property
+    def frames_catalog(self) -> Path:
+        return self.work_root / "frames_catalog.jsonl"
+
+    @cached_property
+    def tags_raw(self) -> Path:
+        return ensure_dir(self.work_root / "tags_raw")
+
+    @cached_property
+    def tags_merged_dir(self) -> Path:
+        return ensure_dir(self.work_root / "tags_merged")
+
+    @cached_property
+    def tags_merged(self) -> Path:
+        return self.tags_merged_dir / "merged.jsonl"
+
+    @cached_property
+    def tags_smoothed(self) -> Path:
+        return self.tags_merged_dir / "smoothed.jsonl"
+
+    @cached_property
+    def captions_clean(self) -> Path:
+        return self.work_root / "captions_clean.jsonl"
+
+    @cached_property
+    def captions_clips(self) -> Path:
+        return self.work_root / "captions_clips.jsonl"
+
+    @cached_property
+    def musubi_root(self) -> Path:
+        return ensure_dir(Path(self._dataset_root).resolve())
+
+    def __getitem__(self, key: str) -> Path:
+        if key not in PATH_KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(PATH_KEYS)
+
+    def __len__(self) -> int:
+        return len(PATH_KEYS)
+
+PATH_KEYS = tuple(k for k, v in vars(PipelinePaths).items() if isinstance(v, cached_property))
+
+_PATHS: Dict[int, Tuple[Dict[str, Any], PipelinePaths]] = {}
+
+def paths(cfg: Dict[str, Any]) -> PipelinePaths:
+    """Compute canonical working paths used across the pipeline (one instance per config)."""
+    cached = _PATHS.get(id(cfg))
+    if cached is None or cached[0] is not cfg:
+        cached = _PATHS[id(cfg)] = (cfg, PipelinePaths(cfg))
+    return cached[1]
+
+@dataclass(frozen=True)
+class VideoSettings:
+    """The `video:` block with its defaults, plus the ffmpeg binary."""
+    ffmpeg_bin: str = "ffmpeg"
+    fps: int = 60
+    upscale_size: int = 256
+    clip_max_seconds: int = 5
+    split_fast_copy: bool = False
+    copy_conforming: bool = True
+    single_pass: bool = False
+    single_pass_frames: bool = False
+    pix_fmt: str = "yuv420p"
+    crf: int = 18
+    preset: str = "veryfast"
+
+def video_settings(cfg: Dict[str, Any]) -> VideoSettings:
+    """Typed view of `cfg["video"]` (missing keys take the defaults above)."""
+    v = cfg.get("video") or {}
+    d = VideoSettings()
+    return VideoSettings(
+        ffmpeg_bin=cfg["paths"].get("ffmpeg_bin") or d.ffmpeg_bin,
+        fps=int(v.get("fps", d.fps)),
+        upscale_size=int(v.get("upscale_size", d.upscale_size)),
+        clip_max_seconds=int(v.get("clip_max_seconds", d.clip_max_seconds)),
+        split_fast_copy=bool(v.get("split_fast_copy", d.split_fast_copy)),
+        copy_conforming=bool(v.get("copy_conforming", d.copy_conforming)),
+        single_pass=bool(v.get("single_pass", d.single_pass)),
+        single_pass_frames=bool(v.get("single_pass_frames", d.single_pass_frames)),
+        pix_fmt=v.get("pix_fmt", d.pix_fmt),
+        crf=int(v.get("crf", d.crf)),
+        preset=v.get("preset", d.preset),
+    )
+
+CLIP_SEP = "__"
+
+def clip_frames_dir(frames_root: Path, video: str, clip: str) -> Path:
+    """frames/<video>__<clip>/ — one flat folder per upscaled clip."""
+    return frames_root / f"{video}{CLIP_SEP}{clip}"
+
+def split_frames_dirname(name: str):
+    """Inverse of `clip_frames_dir`: folder name -> (video, clip or None)."""
+    video, sep, clip = name.rpartition(CLIP_SEP)
+    return (video, clip) if sep else (name, None)
+
+def frames_source(p: Mapping[str, Path], name: str) -> Path:
+    """Video a frames folder is extracted from: upscaled/<video>/<clip>.mp4 or normalized_videos/<name>.mp4."""
+    video, clip = split_frames_dirname(name)
+    if clip:
+        return p["upscaled"] / video / f"{clip}.mp4"
+    return p["normalized_videos"] / f"{name}.mp4"
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Deterministic partitioning of the pipeline across machines (--shard i/N).
+
+- A video belongs to shard blake2b(stem) % N, so N nodes on shared storage agree on a
+  disjoint split without talking to each other. Clips, upscaled clips and frames folders
+  follow the video they came from.
+- Sharded stages keep their own manifest (`<stage>.<i>of<N>.json`), so nodes never prune or
+  overwrite each other's entries; 30_tag_wd14.py writes tags_raw/wd14.<i>of<N>.jsonl.
+- `live_sources` keeps only the newest sharding of each tags_raw source (unsharded or one
+  N), so outputs of an earlier run with a different N are not merged twice.
+- scripts/run_shards.py runs N shard processes locally to simulate N nodes.
+"""
+
+from __future__ import annotations
+import argparse
+import hashlib
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+
+from scripts.utils.paths import split_frames_dirname
+
+T = TypeVar("T")
+
+_SHARD_NAME = re.compile(r"^(?P<base>.+)\.(?P<index>\d+)of(?P<count>\d+)$")
+
+@dataclass(frozen=True)
+class Shard:
+    index: int
+    count: int
+
+    @property
+    def tag(self) -> str:
+        return f"{self.index}of{self.count}"
+
+    def owns(self, video: str) -> bool:
+        return shard_of(video, self.count) == self.index
+
+    def select(self, items: Iterable[T], video: Callable[[T], str]) -> List[T]:
+        """The items whose video (`video(item)`) belongs to this shard."""
+        return [it for it in items if self.owns(video(it))]
+
+def shard_of(video: str, count: int) -> int:
+    """Shard index of `video` (a file stem) among `count`; stable across machines and runs."""
+    digest = hashlib.blake2b(video.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % count
+
+def parse_shard(text: str) -> Optional[Shard]:
+    """argparse type for "i/N" (0 <= i < N); "0/1" means unsharded (None)."""
+    index, sep, count = text.partition("/")
+    try:
+        i, n = int(index), int(count)
+    except ValueError:
+        i, n = -1, 0
+    if not sep or n < 1 or not 0 <= i < n:
+        raise argparse.ArgumentTypeError(f"expected i/N with 0 <= i < N, got {text!r}")
+    return Shard(i, n) if n > 1 else None
+
+def add_shard_arg(ap: argparse.ArgumentParser) -> None:
+    ap.add_argument("--shard", type=parse_shard, default=None, metavar="i/N",
+                    help="Only process videos of shard i of N (hash of the video name)")
+
+def frames_video(folder: Path) -> str:
+    """Video stem of a frames folder (<video>__<clip> or <video>)."""
+    return split_frames_dirname(Path(folder).name)[0]
+
+def stage_name(stage: str, shard: Optional[Shard]) -> str:
+    """Manifest name of `stage` for `shard` (the plain stage name when unsharded)."""
+    return stage if shard is None else f"{stage}.{shard.tag}"
+
+def shard_output(path: Path, shard: Optional[Shard]) -> Path:
+    """tags_raw/wd14.jsonl -> tags_raw/wd14.<i>of<N>.jsonl for a shard."""
+    path = Path(path)
+    return path if shard is None else path.with_name(f"{path.stem}.{shard.tag}{path.suffix}")
+
+def live_sources(sources: Iterable[Path]) -> List[Path]:
+    """
+    Drop tags_raw sources superseded by a newer sharding of the same base name: per base,
+    the group (unsharded, or all shards of one N) with the newest file wins.
+    """
+    groups: Dict[str, Dict[int, List[Path]]] = {}
+    for src in map(Path, sources):
+        m = _SHARD_NAME.match(src.stem)
+        base, count = (m.group("base"), int(m.group("count"))) if m else (src.stem, 0)
+        groups.setdefault(base, {}).setdefault(count, []).append(src)
+    live: List[Path] = []
+    for by_count in groups.values():
+        newest: Tuple[float, int] = max((max(p.stat().st_mtime for p in ps), n) for n, ps in by_count.items())
+        live.extend(by_count[newest[1]])
+    return sorted(live)
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Stage lookup and in-process stage runs, shared by `python -m scripts` and run_shards.py.
+
+- A stage is named by its number ("30" -> scripts/30_tag_wd14.py) or by its module name
+  ("run_pipeline").
+- `run_stage` imports the stage module and calls its `main()` with the given arguments in
+  the current interpreter, so chained stages share imports, the parsed config.yaml and the
+  per-process caches (probe cache, open frame packs) instead of each paying a new process.
+"""
+
+from __future__ import annotations
+import importlib
+import shlex
+import sys
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+SCRIPTS = Path(__file__).resolve().parents[1]
+
+def list_stages() -> List[str]:
+    """Numbers of the numbered stage scripts, in pipeline order."""
+    return sorted(p.stem.split("_", 1)[0] for p in SCRIPTS.glob("[0-9][0-9]_*.py"))
+
+def stage_module(name: str) -> str:
+    """"30" -> "scripts.30_tag_wd14"; "run_pipeline" -> "scripts.run_pipeline"."""
+    found = sorted(SCRIPTS.glob(f"{name}_*.py")) if name.isdigit() else [SCRIPTS / f"{name}.py"]
+    if len(found) != 1 or not found[0].is_file():
+        raise SystemExit(f"[stages] unknown stage {name!r} (stages: {', '.join(list_stages())})")
+    return f"scripts.{found[0].stem}"
+
+def parse_stage_args(specs: List[str]) -> Dict[str, List[str]]:
+    """["30=--stub", "20=--force"] -> {"30": ["--stub"], "20": ["--force"]}."""
+    out: Dict[str, List[str]] = {}
+    for spec in specs:
+        stage, sep, rest = spec.partition("=")
+        if not sep:
+            raise SystemExit(f"[stages] expected STAGE=ARGS, got {spec!r}")
+        out.setdefault(stage.strip(), []).extend(shlex.split(rest))
+    return out
+
+def run_stage(name: str, argv: Sequence[str] = ()) -> int:
+    """Run one stage's `main()` with `argv` in this process; returns its exit code."""
+    module = importlib.import_module(stage_module(name))
+    saved = sys.argv
+    sys.argv = [module.__file__, *argv]
+    try:
+        rc = module.main()
+    except SystemExit as e:  # argparse errors, `raise SystemExit(...)` inside a stage
+        rc = e.code
+    finally:
+        sys.argv = saved
+    if rc is None:
+        return 0
+    if isinstance(rc, int):
+        return rc
+    print(rc, file=sys.stderr)
+    return 1
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Tag synonym/alias canonicalization shared by the ingest scripts and the merger.
+
+- Canonical tags come from the WD14 vocabulary (<wd14.model_dir>/selected_tags.csv) plus the
+  canonical names of the user alias file (`merge.aliases_file`, YAML `canonical: [alias, ...]`).
+- With `merge.prefer_wd14_synonyms` the index also folds simple variants onto canonical tags:
+  plurals ("trees" -> "tree"), a dropped or added `_(qualifier)` ("tree (plant)" -> "tree"
+  when only "tree" exists, "hat" -> "hat_(object)" when that is the only "hat"), and
+  repeated underscores. User aliases always win over derived ones.
+- The alias -> canonical table is precomputed once and cached in data/.cache/synonyms.<sig>.json
+  (sig = vocabulary + alias file + options); each process loads it once, and strings not in
+  the table are resolved through an LRU cache.
+- Unknown tags fall back to `norm_tag`, so without a vocabulary or aliases nothing changes.
+"""
+
+from __future__ import annotations
+import csv
+import hashlib
+import json
+import os
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+from scripts.utils.tagging_common import norm_tag
+
+INDEX_VERSION = 2  # bump when the derivation rules change (invalidates cached tables)
+_QUALIFIER = re.compile(r"^(.+?)_\([^()]*\)$")
+_UNDERSCORES = re.compile(r"_+")
+
+def alias_key(tag: str) -> str:
+    """norm_tag plus collapsed underscores: "Tree  (plant)" -> "tree_(plant)"."""
+    return _UNDERSCORES.sub("_", norm_tag(tag)).strip("_")
+
+_SIBILANTS = ("s", "x", "z", "ch", "sh")  # stems that take "-es" ("boxes"); others take "-s" ("capes")
+
+def _plurals(tag: str) -> List[str]:
+    out = [tag + "es" if tag.endswith(_SIBILANTS) else tag + "s"]
+    if tag.endswith("y") and len(tag) > 1:
+        out.append(tag[:-1] + "ies")
+    return out
+
+def _singulars(tag: str) -> List[str]:
+    out = []
+    if tag.endswith("ies") and len(tag) > 3:
+        out.append(tag[:-3] + "y")
+    if tag.endswith("es") and tag[:-2].endswith(_SIBILANTS):
+        out.append(tag[:-2])
+    if tag.endswith("s") and len(tag) > 1:
+        out.append(tag[:-1])
+    return out
+
+def load_vocab_csv(path: Path) -> List[str]:
+    """Tag names from a WD14 selected_tags.csv (empty if the file is missing)."""
+    if not path.exists():
+        return []
+    with path.open("r", encoding="utf-8", newline="") as f:
+        return [row["name"] for row in csv.DictReader(f) if row.get("name")]
+
+def load_aliases(path: Optional[Path]) -> Dict[str, List[str]]:
+    """canonical -> [alias, ...] from the user alias YAML (empty if not configured/missing)."""
+    if not path or not path.exists():
+        return {}
+    import yaml
+
+    data = yaml.safe_load(path.read_text(encoding="utf-8")) or {}
+    return {str(k): [str(a) for a in (v or [])] for k, v in data.items()}
+
+def build_table(vocab: Iterable[str], aliases: Dict[str, List[str]], *, derive: bool) -> Dict[str, str]:
+    """Precompute alias key -> canonical tag."""
+    canon: Set[str] = {alias_key(t) for t in vocab} | {alias_key(c) for c in aliases}
+    canon.discard("")
+    table: Dict[str, str] = {t: t for t in canon}
+    if derive:
+        bare_to_qualified: Dict[str, List[str]] = {}
+        for t in canon:
+            m = _QUALIFIER.match(t)
+            if m:
+                bare_to_qualified.setdefault(m.group(1), []).append(t)
+        for bare, qualified in bare_to_qualified.items():
+            if bare not in canon and len(qualified) == 1:
+                table[bare] = qualified[0]
+        for t in sorted(canon):
+            for form in _plurals(t):
+                if form not in canon:
+                    table.setdefault(form, t)
+    for c, names in aliases.items():
+        target = alias_key(c)
+        for a in names:
+            table[alias_key(a)] = target
+    return table
+
+class SynonymIndex:
+    """Callable tag -> canonical tag, backed by a precomputed table and an LRU."""
+
+    def __init__(self, table: Dict[str, str], *, derive: bool, signature: str = "", lru_size: int = 1 << 16):
+        self.table = table
+        self.derive = derive
+        self.signature = signature
+        self.canonical = lru_cache(maxsize=lru_size)(self._resolve)
+
+    def __call__(self, tag: str) -> str:
+        return self.canonical(tag)
+
+    def _resolve(self, tag: str) -> str:
+        key = norm_tag(tag)
+        hit = self.table.get(key)
+        if hit is not None:
+            return hit
+        k = alias_key(key)
+        hit = self.table.get(k)
+        if hit is not None:
+            return hit
+        if self.derive:
+            m = _QUALIFIER.match(k)
+            candidates = [m.group(1)] if m else []
+            candidates += _singulars(k) + (_singulars(m.group(1)) if m else [])
+            for c in candidates:
+                hit = self.table.get(c)
+                if hit is not None:
+                    return hit
+        return key
+
+_LOADED: Dict[str, SynonymIndex] = {}
+
+def _file_sig(path: Optional[Path]) -> str:
+    if not path or not path.exists():
+        return "-"
+    return hashlib.sha1(path.read_bytes()).hexdigest()
+
+def load_index(cfg: dict, work_root: Optional[Path] = None) -> SynonymIndex:
+    """The process-wide index for this config (built, or read from the on-disk cache, once)."""
+    mcfg = cfg.get("merge", {})
+    wcfg = cfg.get("wd14", {})
+    derive = bool(mcfg.get("prefer_wd14_synonyms", False))
+    vocab_path = Path(wcfg.get("model_dir", "")) / wcfg.get("tags_file", "selected_tags.csv") if derive else None
+    alias_file = mcfg.get("aliases_file")
+    alias_path = Path(alias_file) if alias_file else None
+    sig = hashlib.sha1(json.dumps(
+        [INDEX_VERSION, derive, _file_sig(vocab_path), _file_sig(alias_path)]).encode()).hexdigest()[:16]
+    if sig in _LOADED:
+        return _LOADED[sig]
+
+    cache = Path(work_root or cfg["paths"]["work_root"]) / ".cache" / f"synonyms.{sig}.json"
+    table = None
+    if cache.exists():
+        try:
+            table = json.loads(cache.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            table = None
+    if table is None:
+        vocab = load_vocab_csv(vocab_path) if vocab_path else []
+        table = build_table(vocab, load_aliases(alias_path), derive=derive)
+        cache.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache.with_suffix(".tmp")
+        tmp.write_text(json.dumps(table, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, cache)
+    index = _LOADED[sig] = SynonymIndex(table, derive=derive, signature=sig)
+    return index
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Tag-merge engines shared by 40_merge_tags.py (and anything that chains merging).
+
+- For each image: keep the highest confidence per tag.
+- Tie-break with source frequency (tags seen from multiple tools rank higher), then tag name.
+- `merge_in_memory` holds every image at once (fast for small libraries).
+- `merge_streaming` externally sorts each source by image key (spilling sorted runs to
+  temp files) and k-way heap-merges them, so peak memory depends on `chunk_rows`,
+  not on dataset size. Output is ordered by image key.
+- Sources may be JSONL or columnar stores; tagstore.merge_sources is the vectorized engine.
+- `norm` canonicalizes tag strings (norm_tag, or a synonyms.SynonymIndex to fold aliases).
+"""
+
+from __future__ import annotations
+import heapq
+import itertools
+import tempfile
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import ujson
+
+from scripts.utils.tagging_common import norm_tag
+from scripts.utils.tagstore import read_tags
+
+Row = Tuple[str, list]           # (image, [[tag, score], ...])
+Merged = Tuple[str, List[Tuple[str, float]]]
+
+def iter_rows(path: Path) -> Iterator[Row]:
+    """Stream (image, tags) rows from a tags JSONL file or columnar `.tags` store."""
+    return read_tags(path)
+
+def rank(best: Dict[str, float], counts: Counter) -> List[Tuple[str, float]]:
+    """Order tags by (-confidence, -source frequency, tag)."""
+    return sorted(best.items(), key=lambda x: (-x[1], -counts[x[0]], x[0]))
+
+def _accumulate(
+    best: Dict[str, float], counts: Counter, tags: list, min_conf: float,
+    norm: Callable[[str], str] = norm_tag,
+) -> None:
+    for tag, score in tags:
+        if score < min_conf:
+            continue
+        t = norm(tag)
+        if score > best.get(t, 0.0):
+            best[t] = score
+        counts[t] += 1
+
+def merge_in_memory(
+    sources: Sequence[Path], min_conf: float, *, norm: Callable[[str], str] = norm_tag,
+) -> Iterator[Merged]:
+    """Original merge: one dict per image for the whole library, first-seen order."""
+    merged = defaultdict(lambda: {"tags": {}, "counts": Counter()})
+    for src in sources:
+        for img, tags in iter_rows(src):
+            d = merged[img]
+            _accumulate(d["tags"], d["counts"], tags, min_conf, norm)
+    for img, d in merged.items():
+        yield img, rank(d["tags"], d["counts"])
+
+def _spill(rows: List[Row], tmp_dir: Path) -> Path:
+    rows.sort(key=lambda r: r[0])
+    fd, name = tempfile.mkstemp(suffix=".jsonl", dir=tmp_dir)
+    with open(fd, "w", encoding="utf-8") as f:
+        for r in rows:
+            f.write(ujson.dumps(r))
+            f.write("\n")
+    return Path(name)
+
+def _read_run(path: Path) -> Iterator[Row]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            img, tags = ujson.loads(line)
+            yield img, tags
+
+def sorted_rows(src: Path, *, chunk_rows: int, tmp_dir: Path) -> Iterator[Row]:
+    """External sort of one source by image key; in-memory when it fits in one chunk."""
+    runs: List[Path] = []
+    buf: List[Row] = []
+    for row in iter_rows(src):
+        buf.append(row)
+        if len(buf) >= chunk_rows:
+            runs.append(_spill(buf, tmp_dir))
+            buf = []
+    if not runs:
+        buf.sort(key=lambda r: r[0])
+        yield from buf
+        return
+    if buf:
+        runs.append(_spill(buf, tmp_dir))
+    del buf
+    try:
+        yield from heapq.merge(*(_read_run(r) for r in runs), key=lambda r: r[0])
+    finally:
+        for r in runs:
+            r.unlink(missing_ok=True)
+
+def merge_streaming(
+    sources: Sequence[Path],
+    min_conf: float,
+    *, chunk_rows: int = 200_000,
+    tmp_dir: Optional[Path] = None,
+    norm: Callable[[str], str] = norm_tag,
+) -> Iterator[Merged]:
+    """Bounded-memory merge: k-way heap merge over per-source sorted streams."""
+    with tempfile.TemporaryDirectory(prefix="merge_", dir=tmp_dir) as td:
+        streams = [sorted_rows(s, chunk_rows=chunk_rows, tmp_dir=Path(td)) for s in sources]
+        for img, group in itertools.groupby(heapq.merge(*streams, key=lambda r: r[0]), key=lambda r: r[0]):
+            best: Dict[str, float] = {}
+            counts: Counter = Counter()
+            for _img, tags in group:
+                _accumulate(best, counts, tags, min_conf, norm)
+            yield img, rank(best, counts)
+
+def write_merged(path: Path, rows: Iterable[Merged]) -> int:
+    """Write merged rows as JSONL; return the number of images written."""
+    n = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for img, tags in rows:
+            ujson.dump({"image": img, "tags": tags}, f)
+            f.write("\n")
+            n += 1
+    return n
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar tag store: a compact, memory-mappable alternative to the tags JSONL files.
+
+- A store is a directory `<name>.tags/` holding
+    images.txt  one image path per line (row i = line i)
+    vocab.txt   one tag string per line (tag id = line number)
+    offsets.npy int64 [n_images + 1]; row i owns entries offsets[i]:offsets[i+1]
+    tag_ids.npy int32 [n_entries]
+    scores.npy  float32 [n_entries]
+- Arrays are opened with mmap, so reading a store costs no parsing and no per-row objects.
+- Scores are float32; they are exported rounded to 6 decimals, which round-trips every
+  score the pipeline produces (WD14 keeps 4, the ingest scripts 2).
+- `merge_tables` is the vectorized counterpart of tag_merge.merge_in_memory: identical
+  rows and ordering, computed with numpy sorts/reductions instead of per-tag dict updates.
+- `read_tags` / `write_tags` / `tag_sources` accept both formats, so stages can mix them.
+- `python -m scripts.utils.tagstore export <store.tags> <out.jsonl>` converts back to JSONL.
+"""
+
+from __future__ import annotations
+import os
+import shutil
+import sys
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+import numpy as np
+import ujson
+
+from scripts.utils.shard import live_sources
+from scripts.utils.tagging_common import norm_tag
+
+STORE_SUFFIX = ".tags"
+SCORE_DECIMALS = 6
+
+Row = Tuple[str, list]
+
+def use_store(cfg: dict) -> bool:
+    """True when `tag_store.enabled` asks stages to write columnar stores."""
+    return bool(cfg.get("tag_store", {}).get("enabled", False))
+
+@dataclass
+class TagTable:
+    """Tag rows in CSR layout (in memory or memory-mapped from a store)."""
+    images: List[str]
+    vocab: List[str]
+    offsets: np.ndarray
+    tag_ids: np.ndarray
+    scores: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.images)
+
+    def row(self, i: int) -> List[Tuple[str, float]]:
+        s, e = int(self.offsets[i]), int(self.offsets[i + 1])
+        vocab = self.vocab
+        scores = np.round(self.scores[s:e].astype(np.float64), SCORE_DECIMALS).tolist()
+        return [(vocab[t], sc) for t, sc in zip(self.tag_ids[s:e].tolist(), scores)]
+
+    def rows(self) -> Iterator[Tuple[str, List[Tuple[str, float]]]]:
+        """(image, [(tag, score), ...]) per image, in row order."""
+        vocab = self.vocab
+        offsets = self.offsets.tolist()
+        tag_ids = self.tag_ids
+        scores = self.scores
+        for i, img in enumerate(self.images):
+            s, e = offsets[i], offsets[i + 1]
+            sc = np.round(scores[s:e].astype(np.float64), SCORE_DECIMALS).tolist()
+            yield img, [(vocab[t], v) for t, v in zip(tag_ids[s:e].tolist(), sc)]
+
+class TableBuilder:
+    """Append rows one by one and intern images/tags; `table()` or `save()` at the end."""
+
+    def __init__(self):
+        self.images: List[str] = []
+        self.vocab: List[str] = []
+        self._tag_index: Dict[str, int] = {}
+        self._offsets = array("q", [0])
+        self._tag_ids = array("i")
+        self._scores = array("f")
+
+    def add(self, image: str, tags: Iterable[Sequence]) -> None:
+        index = self._tag_index
+        for tag, score in tags:
+            tid = index.get(tag)
+            if tid is None:
+                tid = index[tag] = len(self.vocab)
+                self.vocab.append(tag)
+            self._tag_ids.append(tid)
+            self._scores.append(score)
+        self.images.append(image)
+        self._offsets.append(len(self._tag_ids))
+
+    def table(self) -> TagTable:
+        return TagTable(
+            self.images, self.vocab,
+            np.frombuffer(self._offsets, dtype=np.int64),
+            np.frombuffer(self._tag_ids, dtype=np.int32),
+            np.frombuffer(self._scores, dtype=np.float32),
+        )
+
+    def save(self, path: Path) -> int:
+        save_table(self.table(), path)
+        return len(self.images)
+
+# ---------------------------------------------------------------------------
+# On-disk store
+# ---------------------------------------------------------------------------
+
+def _write_lines(path: Path, items: List[str]) -> None:
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        for item in items:
+            f.write(item)
+            f.write("\n")
+
+def _read_lines(path: Path) -> List[str]:
+    return path.read_text(encoding="utf-8").split("\n")[:-1]
+
+def save_table(table: TagTable, path: Path) -> None:
+    """Write `table` as a store directory, replacing any previous store atomically-ish."""
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    _write_lines(tmp / "images.txt", table.images)
+    _write_lines(tmp / "vocab.txt", table.vocab)
+    np.save(tmp / "offsets.npy", np.asarray(table.offsets, dtype=np.int64))
+    np.save(tmp / "tag_ids.npy", np.asarray(table.tag_ids, dtype=np.int32))
+    np.save(tmp / "scores.npy", np.asarray(table.scores, dtype=np.float32))
+    if path.exists():
+        shutil.rmtree(path)
+    os.replace(tmp, path)
+
+def load_table(path: Path, *, mmap: bool = True) -> TagTable:
+    """Open a store directory (arrays memory-mapped unless `mmap=False`)."""
+    path = Path(path)
+    mode = "r" if mmap else None
+    return TagTable(
+        _read_lines(path / "images.txt"),
+        _read_lines(path / "vocab.txt"),
+        np.load(path / "offsets.npy", mmap_mode=mode),
+        np.load(path / "tag_ids.npy", mmap_mode=mode),
+        np.load(path / "scores.npy", mmap_mode=mode),
+    )
+
+def is_store(path: Path) -> bool:
+    return Path(path).suffix == STORE_SUFFIX and Path(path).is_dir()
+
+# ---------------------------------------------------------------------------
+# Format-agnostic helpers used by the stages
+# ---------------------------------------------------------------------------
+
+def iter_jsonl(path: Path) -> Iterator[Row]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            row = ujson.loads(line)
+            yield row["image"], row["tags"]
+
+def read_tags(path: Path) -> Iterator[Row]:
+    """(image, tags) rows from a tags JSONL file or a columnar store."""
+    if is_store(path):
+        yield from load_table(path).rows()
+    else:
+        yield from iter_jsonl(path)
+
+def read_table(path: Path) -> TagTable:
+    """A `TagTable` for either format (JSONL is parsed once into memory)."""
+    if is_store(path):
+        return load_table(path)
+    b = TableBuilder()
+    for img, tags in iter_jsonl(path):
+        b.add(img, tags)
+    return b.table()
+
+def tag_sources(tags_dir: Path) -> List[Path]:
+    """
+    Every tags_raw source: *.jsonl files and *.tags stores, sorted by name. Per-shard outputs
+    (wd14.<i>of<N>.jsonl) of an older sharding than the newest one are left out.
+    """
+    d = Path(tags_dir)
+    return live_sources(list(d.glob("*.jsonl")) + [s for s in d.glob(f"*{STORE_SUFFIX}") if s.is_dir()])
+
+def export_jsonl(rows: Iterable[Row], path: Path) -> int:
+    """Write rows in the JSONL layout every stage understands; return the row count."""
+    n = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for img, tags in rows:
+            ujson.dump({"image": img, "tags": tags}, f)
+            f.write("\n")
+            n += 1
+    return n
+
+def write_tags(base: Path, rows: Iterable[Row], *, columnar: bool) -> int:
+    """
+    Write rows to `base` (.jsonl) or its `.tags` store sibling (see `tags_output`) and remove
+    the other format, so a source is never merged twice. Returns the row count.
+    """
+    base = Path(base).with_suffix(".jsonl")
+    store = base.with_suffix(STORE_SUFFIX)
+    if columnar:
+        b = TableBuilder()
+        for img, tags in rows:
+            b.add(img, tags)
+        n = b.save(store)
+        base.unlink(missing_ok=True)
+        return n
+    tmp = base.with_suffix(".jsonl.tmp")
+    n = export_jsonl(rows, tmp)
+    os.replace(tmp, base)
+    if store.exists():
+        shutil.rmtree(store)
+    return n
+
+def tags_output(base: Path, columnar: bool) -> Path:
+    """The path `write_tags(base, ..., columnar=columnar)` will produce."""
+    base = Path(base).with_suffix(".jsonl")
+    return base.with_suffix(STORE_SUFFIX) if columnar else base
+
+# ---------------------------------------------------------------------------
+# Vectorized merge
+# ---------------------------------------------------------------------------
+
+def merge_tables(
+    tables: Sequence[TagTable], min_conf: float, *, norm: Callable[[str], str] = norm_tag,
+) -> TagTable:
+    """
+    Merge per-source tables like tag_merge.merge_in_memory: per image keep the best score of
+    each normalized tag, rank by (-score, -source count, tag); images in first-seen order.
+    """
+    tag_index: Dict[str, int] = {}
+    img_index: Dict[str, int] = {}
+    thr = np.float32(min_conf)
+    parts_img, parts_tag, parts_score = [], [], []
+    for t in tables:
+        # Normalize each distinct tag string once instead of once per occurrence.
+        tmap = np.fromiter((tag_index.setdefault(norm(v), len(tag_index)) for v in t.vocab),
+                           dtype=np.int32, count=len(t.vocab))
+        imap = np.fromiter((img_index.setdefault(im, len(img_index)) for im in t.images),
+                           dtype=np.int32, count=len(t.images))
+        offsets = np.asarray(t.offsets)
+        row_of = np.repeat(np.arange(len(t), dtype=np.int32), np.diff(offsets))
+        scores = np.asarray(t.scores)
+        keep = scores >= thr
+        parts_img.append(imap[row_of[keep]])
+        parts_tag.append(tmap[np.asarray(t.tag_ids)[keep]])
+        parts_score.append(scores[keep])
+
+    images = list(img_index)
+    vocab = list(tag_index)
+    img = np.concatenate(parts_img) if parts_img else np.empty(0, np.int32)
+    tag = np.concatenate(parts_tag) if parts_tag else np.empty(0, np.int32)
+    score = np.concatenate(parts_score) if parts_score else np.empty(0, np.float32)
+
+    # Group identical (image, tag) pairs: best score and number of occurrences.
+    order = np.lexsort((tag, img))
+    img, tag, score = img[order], tag[order], score[order]
+    if len(img):
+        first = np.flatnonzero(np.r_[True, (img[1:] != img[:-1]) | (tag[1:] != tag[:-1])])
+        best = np.maximum.reduceat(score, first)
+        count = np.diff(np.r_[first, len(img)])
+        img, tag = img[first], tag[first]
+        pos = best > 0  # merge_in_memory never stores a best score of 0
+        img, tag, best, count = img[pos], tag[pos], best[pos], count[pos]
+    else:
+        best, count = score, np.empty(0, np.int64)
+
+    # Rank inside each image: -score, -count, then tag name (string order).
+    name_rank = np.empty(len(vocab), dtype=np.int64)
+    name_rank[np.argsort(np.array(vocab, dtype=object), kind="stable")] = np.arange(len(vocab))
+    order = np.lexsort((name_rank[tag], -count, -best, img))
+    offsets = np.zeros(len(images) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(img, minlength=len(images)), out=offsets[1:])
+    return TagTable(images, vocab, offsets, tag[order].astype(np.int32), best[order].astype(np.float32))
+
+def merge_sources(
+    sources: Sequence[Path], min_conf: float, *, norm: Callable[[str], str] = norm_tag,
+) -> TagTable:
+    """Vectorized merge of tags_raw sources in either format."""
+    return merge_tables([read_table(s) for s in sources], min_conf, norm=norm)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "export":
+        print("usage: python -m scripts.utils.tagstore export <store.tags> <out.jsonl>", file=sys.stderr)
+        raise SystemExit(2)
+    n = export_jsonl(load_table(Path(sys.argv[2])).rows(), Path(sys.argv[3]))
+    print(f"[tagstore] exported {n} rows -> {sys.argv[3]}")
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+Batched WD14 (ONNX) tagger.
+
+- Loads the ONNX model and selected_tags.csv once per process.
+- JPEG decode/resize runs in a thread pool that feeds a bounded queue of ready batches,
+  so decoding overlaps inference and memory stays capped.
+- `tag_frames` tags uint8 RGB batches from an ffmpeg `FrameReader` whose `video_filter`
+  does the same pad/resize in ffmpeg, so clips are tagged without JPEG round-trips.
+- Inference runs on true `batch_size` NumPy batches; thresholds and top-k are applied
+  vectorized over the (batch x tags) probability matrix.
+- `write_synthetic_model` emits a tiny model + tag CSV for CPU-only tests (needs `onnx`).
+"""
+
+from __future__ import annotations
+import csv
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Category ids used by the SmilingWolf WD14 selected_tags.csv.
+CAT_GENERAL = 0
+CAT_CHARACTER = 4
+CAT_RATING = 9
+
+Tags = List[Tuple[str, float]]
+
+def load_tags_csv(path: Path) -> Tuple[List[str], np.ndarray]:
+    """Return (tag names, category array) in model output order."""
+    names: List[str] = []
+    cats: List[int] = []
+    with Path(path).open("r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            names.append(row["name"])
+            cats.append(int(row.get("category") or CAT_GENERAL))
+    return names, np.asarray(cats, dtype=np.int32)
+
+def available_providers(preferred: Sequence[str]) -> List[str]:
+    """Keep the preferred onnxruntime providers that this install actually has."""
+    import onnxruntime as ort
+    have = set(ort.get_available_providers())
+    picked = [p for p in preferred if p in have]
+    return picked or ["CPUExecutionProvider"]
+
+class WD14Tagger:
+    """One onnxruntime session + tag table; call `tag_paths` to stream results."""
+
+    def __init__(
+        self,
+        model_path: Path,
+        tags_csv: Path,
+        *, threshold_general: float = 0.35,
+        threshold_character: float = 0.6,
+        topk: int = 64,
+        providers: Sequence[str] = ("CUDAExecutionProvider", "CPUExecutionProvider"),
+        intra_op_threads: int = 0,
+    ):
+        import onnxruntime as ort
+
+        so = ort.SessionOptions()
+        if intra_op_threads:
+            so.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(
+            str(model_path), sess_options=so, providers=available_providers(providers)
+        )
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        self.output_name = self.session.get_outputs()[0].name
+        # WD14 models are NHWC; dynamic dims come back as strings.
+        self.size = int(inp.shape[1]) if isinstance(inp.shape[1], int) else 448
+        self.dtype = np.float16 if "float16" in inp.type else np.float32
+
+        names, cats = load_tags_csv(tags_csv)
+        self.names = np.asarray(names, dtype=object)
+        thr = np.full(len(names), float(threshold_general), dtype=np.float32)
+        thr[cats == CAT_CHARACTER] = float(threshold_character)
+        thr[cats == CAT_RATING] = np.inf  # ratings (general/sensitive/...) are never caption tags
+        self.thresholds = thr
+        self.topk = int(topk)
+        self.images = 0
+        self.seconds = 0.0
+
+    # -- preprocessing -----------------------------------------------------
+
+    def load_image(self, path: Path) -> np.ndarray:
+        """Decode (loose or packed frame) -> white-pad to square -> bicubic resize -> BGR float array (H, W, 3)."""
+        from PIL import Image
+        from scripts.utils.framepack import frame_file
+
+        with Image.open(frame_file(path)) as im:
+            im = im.convert("RGBA")
+            canvas = Image.new("RGBA", im.size, (255, 255, 255, 255))
+            canvas.alpha_composite(im)
+            im = canvas.convert("RGB")
+        side = max(im.size)
+        if im.size != (side, side):
+            sq = Image.new("RGB", (side, side), (255, 255, 255))
+            sq.paste(im, ((side - im.size[0]) // 2, (side - im.size[1]) // 2))
+            im = sq
+        if side != self.size:
+            im = im.resize((self.size, self.size), Image.BICUBIC)
+        return np.asarray(im, dtype=np.float32)[:, :, ::-1]
+
+    def video_filter(self) -> str:
+        """ffmpeg `-vf` equivalent of `load_image`'s white pad + bicubic resize (for `FrameReader`)."""
+        from scripts.utils.ffmpeg import pad_square_filter
+        return pad_square_filter(self.size, color="white", flags="bicubic")
+
+    # -- inference ---------------------------------------------------------
+
+    def infer(self, batch: np.ndarray) -> np.ndarray:
+        """Run the model on an (N, H, W, 3) batch and return (N, n_tags) probabilities."""
+        out = self.session.run([self.output_name], {self.input_name: batch.astype(self.dtype, copy=False)})[0]
+        return np.asarray(out, dtype=np.float32)
+
+    def select(self, probs: np.ndarray) -> List[Tags]:
+        """Apply per-category thresholds and top-k to a probability matrix, row-wise."""
+        n, t = probs.shape
+        masked = np.where(probs >= self.thresholds[None, :], probs, -1.0)
+        k = min(self.topk, t) if self.topk > 0 else t
+        if k < t:
+            idx = np.argpartition(-masked, k - 1, axis=1)[:, :k]
+        else:
+            idx = np.broadcast_to(np.arange(t), (n, t))
+        top = np.take_along_axis(masked, idx, axis=1)
+        order = np.argsort(-top, axis=1, kind="stable")
+        idx = np.take_along_axis(idx, order, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+
+        rows: List[Tags] = []
+        for r in range(n):
+            keep = top[r] >= 0
+            tags = list(zip(self.names[idx[r][keep]].tolist(), top[r][keep].astype(np.float64).round(4).tolist()))
+            rows.append(tags)
+        return rows
+
+    def tag_paths(
+        self,
+        paths: Iterable[Path],
+        *, batch_size: int = 8,
+        decode_workers: int = 4,
+        prefetch: int = 4,
+    ) -> Iterator[Tuple[Path, Tags]]:
+        """
+        Yield (path, tags) in input order.
+
+        A producer thread decodes images with `decode_workers` threads into batches and
+        puts at most `prefetch` ready batches on a queue; inference consumes them.
+        Unreadable images yield an empty tag list instead of stopping the run.
+        """
+        q: "queue.Queue" = queue.Queue(maxsize=max(1, prefetch))
+        done = object()
+        stop = threading.Event()
+
+        def safe_load(p: Path) -> Optional[np.ndarray]:
+            try:
+                return self.load_image(p)
+            except Exception as e:  # corrupt/truncated JPEG
+                print(f"[wd14] cannot decode {p}: {e}")
+                return None
+
+        def producer() -> None:
+            try:
+                with ThreadPoolExecutor(max_workers=max(1, decode_workers)) as pool:
+                    chunk: List[Path] = []
+                    for p in paths:
+                        chunk.append(p)
+                        if len(chunk) == batch_size:
+                            q.put((chunk, list(pool.map(safe_load, chunk))))
+                            chunk = []
+                            if stop.is_set():
+                                return
+                    if chunk:
+                        q.put((chunk, list(pool.map(safe_load, chunk))))
+            except BaseException as e:
+                q.put(e)
+            finally:
+                q.put(done)
+
+        th = threading.Thread(target=producer, name="wd14-decode", daemon=True)
+        th.start()
+        batch = np.empty((batch_size, self.size, self.size, 3), dtype=np.float32)
+        try:
+            while True:
+                item = q.get()
+                if item is done:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                chunk, arrays = item
+                ok = [i for i, a in enumerate(arrays) if a is not None]
+                t0 = time.perf_counter()
+                results: List[Tags] = [[] for _ in chunk]
+                if ok:
+                    for j, i in enumerate(ok):
+                        batch[j] = arrays[i]
+                    for i, tags in zip(ok, self.select(self.infer(batch[: len(ok)]))):
+                        results[i] = tags
+                self.seconds += time.perf_counter() - t0
+                self.images += len(chunk)
+                yield from zip(chunk, results)
+        finally:
+            stop.set()
+            # Drain so a blocked producer can finish and exit.
+            while th.is_alive():
+                try:
+                    q.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+    def tag_frames(self, batches: Iterable[Tuple[list, np.ndarray]]) -> Iterator[Tuple[object, Tags]]:
+        """
+        Yield (key, tags) for (keys, (N, size, size, 3) uint8 RGB) batches, e.g. views of a
+        `FrameReader` buffer; frames are converted into one reused BGR float batch.
+        """
+        batch = np.empty((0, self.size, self.size, 3), dtype=np.float32)
+        for keys, frames in batches:
+            n = len(frames)
+            if n > len(batch):
+                batch = np.empty((n, self.size, self.size, 3), dtype=np.float32)
+            np.copyto(batch[:n], frames[..., ::-1], casting="unsafe")
+            t0 = time.perf_counter()
+            results = self.select(self.infer(batch[:n]))
+            self.seconds += time.perf_counter() - t0
+            self.images += n
+            yield from zip(keys, results)
+
+    @property
+    def images_per_sec(self) -> float:
+        """Inference throughput (excludes time spent waiting on decode)."""
+        return self.images / self.seconds if self.seconds else 0.0
+
+def write_synthetic_model(out_dir: Path, *, n_tags: int = 16, size: int = 32, seed: int = 0) -> Tuple[Path, Path]:
+    """
+    Write a tiny WD14-shaped ONNX model (NHWC float input -> sigmoid over n_tags)
+    plus a matching selected_tags.csv. Needs the `onnx` package; runs on CPU.
+    """
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    w = rng.normal(0.0, 0.02, size=(3, n_tags)).astype(np.float32)
+    b = rng.normal(0.0, 1.0, size=(n_tags,)).astype(np.float32)
+    graph = helper.make_graph(
+        [
+            helper.make_node("ReduceMean", ["input_1"], ["pooled"], axes=[1, 2], keepdims=0),
+            helper.make_node("MatMul", ["pooled", "w"], ["logits0"]),
+            helper.make_node("Add", ["logits0", "b"], ["logits"]),
+            helper.make_node("Sigmoid", ["logits"], ["predictions_sigmoid"]),
+        ],
+        "wd14_synthetic",
+        [helper.make_tensor_value_info("input_1", TensorProto.FLOAT, ["batch", size, size, 3])],
+        [helper.make_tensor_value_info("predictions_sigmoid", TensorProto.FLOAT, ["batch", n_tags])],
+        initializer=[numpy_helper.from_array(w, "w"), numpy_helper.from_array(b, "b")],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    model_path = out_dir / "model.onnx"
+    onnx.save(model, str(model_path))
+
+    tags_path = out_dir / "selected_tags.csv"
+    with tags_path.open("w", encoding="utf-8", newline="") as f:
+        wr = csv.writer(f)
+        wr.writerow(["tag_id", "name", "category", "count"])
+        ratings = ["general", "sensitive", "questionable", "explicit"]
+        for i in range(n_tags):
+            if i < len(ratings):
+                wr.writerow([i, ratings[i], CAT_RATING, 0])
+            elif i % 5 == 0:
+                wr.writerow([i, f"character_{i}", CAT_CHARACTER, 0])
+            else:
+                wr.writerow([i, f"tag_{i}", CAT_GENERAL, 0])
+    return model_path, tags_path
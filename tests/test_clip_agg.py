@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""Windowed tag smoothing and clip aggregation."""
+
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from scripts.utils.clip_agg import aggregate_table, smooth_matrix, window_sums
+from scripts.utils.tagstore import TableBuilder
+
+def test_window_sums_match_brute_force():
+    rng = np.random.default_rng(0)
+    t = np.sort(rng.uniform(0, 5, 40))  # dedup leaves irregular spacing
+    m = rng.random((40, 3)).astype(np.float32)
+    total, n = window_sums(m, t, 0.25)
+    for i in range(len(t)):
+        inside = np.abs(t - t[i]) <= 0.25
+        assert n[i] == inside.sum()
+        np.testing.assert_allclose(total[i], m[inside].sum(axis=0), rtol=1e-5)
+
+def test_window_edges_are_inclusive():
+    t = np.arange(5) / 10  # 0.0, 0.1, ... 0.4
+    _, n = window_sums(np.ones((5, 1), dtype=np.float32), t, 0.1)
+    assert n.tolist() == [2, 3, 3, 3, 2]
+
+def test_mean_fills_gaps_and_drops_flickers():
+    t = np.arange(7) / 10
+    tree = [0.9, 0.9, 0.9, 0.0, 0.9, 0.9, 0.9]  # one missed frame
+    bird = [0.0, 0.0, 0.0, 0.9, 0.0, 0.0, 0.0]  # one-frame flicker
+    s = smooth_matrix(np.array([tree, bird], dtype=np.float32).T, t,
+                      method="mean", window_seconds=0.2, min_score=0.5)
+    assert (s[:, 0] > 0).all()
+    assert s[3, 0] == pytest.approx(0.6)
+    assert (s[:, 1] == 0).all()
+
+def test_vote_scores_by_mean_where_present():
+    t = np.arange(4) / 10
+    m = np.array([[0.8], [0.0], [0.6], [0.7]], dtype=np.float32)
+    s = smooth_matrix(m, t, method="vote", window_seconds=0.2, vote_fraction=0.5)
+    assert s[:, 0].tolist() == pytest.approx([0.8, 0.7, 0.65, 0.65])
+    with pytest.raises(ValueError):
+        smooth_matrix(m, t, method="median")
+
+def test_aggregate_table_groups_clips_and_keeps_other_rows():
+    b = TableBuilder()
+    b.add("frames/v__clip_0001/frame_000002.jpg", [("tree", 0.9)])
+    b.add("elsewhere/img.jpg", [("cat", 0.7), ("tree", 0.2)])
+    b.add("frames/v__clip_0001/frame_000000.jpg", [("tree", 0.9), ("bird", 0.9)])
+    b.add("frames/v__clip_0001/frame_000001.jpg", [("tree", 0.9)])
+    keys = [("v__clip_0001", 2 / 60), None, ("v__clip_0001", 0.0), ("v__clip_0001", 1 / 60)]
+    smoothed, clips = aggregate_table(b.table(), keys, window_seconds=0.0, min_score=0.5,
+                                      clip_min_fraction=0.5)
+
+    rows = dict(smoothed.rows())
+    assert list(rows) == b.table().images  # input order
+    assert rows["elsewhere/img.jpg"] == [("cat", 0.7), ("tree", 0.2)]
+    assert rows["frames/v__clip_0001/frame_000000.jpg"] == [("bird", 0.9), ("tree", 0.9)]  # score, then name
+    [clip] = clips
+    assert (clip.folder, clip.frames, clip.start_s) == ("v__clip_0001", 3, 0.0)
+    assert clip.end_s == pytest.approx(2 / 60, abs=1e-6)
+    assert clip.tags == [("tree", 0.9)]  # bird is in 1/3 < clip_min_fraction of the frames
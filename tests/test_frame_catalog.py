@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""Clip offsets in the frame catalog follow the real clip lengths of keyframe splits."""
+
+from __future__ import annotations
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from scripts.utils.frame_catalog import FrameFolder, clip_offsets, load_catalog
+
+def make_frames(frames_root: Path, name: str, count: int) -> None:
+    d = frames_root / name
+    d.mkdir(parents=True)
+    for i in range(count):
+        (d / f"frame_{i:06d}.jpg").write_bytes(b"jpeg")
+
+def test_offsets_are_running_durations(tmp_path):
+    durations = {"clip_0000": 2.5, "clip_0001": 4.0, "clip_0002": 1.0}
+    (tmp_path / "v").mkdir()
+    for clip in durations:
+        (tmp_path / "v" / f"{clip}.mp4").write_bytes(b"")
+    folders = [FrameFolder("v__clip_0001", "v", "clip_0001", 10.0, 5.0, 0)]
+    offsets = clip_offsets({"upscaled": tmp_path}, folders, lambda clip: durations[clip.stem])
+    assert offsets == {"v__clip_0000": 0.0, "v__clip_0001": 2.5, "v__clip_0002": 6.5}
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+def test_uneven_keyframe_clips(tmp_path):
+    p = {k: tmp_path / k for k in ("upscaled", "frames_root", "work_root")}
+    p.update(frames_catalog=tmp_path / "frames_catalog.jsonl", frames_keep=tmp_path / "frames_keep.jsonl")
+    (p["upscaled"] / "v").mkdir(parents=True)
+    for clip, seconds in (("clip_0000", 2.5), ("clip_0001", 4.0), ("clip_0002", 1.0)):
+        subprocess.run(["ffmpeg", "-loglevel", "error", "-y", "-f", "lavfi", "-i", "testsrc=size=64x48:rate=10",
+                        "-t", str(seconds), "-pix_fmt", "yuv420p", str(p["upscaled"] / "v" / f"{clip}.mp4")],
+                       check=True)
+        make_frames(p["frames_root"], f"v__{clip}", int(seconds * 10))
+    cfg = {"paths": {"ffmpeg_bin": "ffmpeg"}, "frame_extract": {},
+           "video": {"fps": 10, "clip_max_seconds": 5, "split_fast_copy": True}}
+
+    catalog = load_catalog(cfg, p)
+    assert catalog.folders["v__clip_0001"].offset_s == pytest.approx(2.5, abs=0.05)
+    assert catalog.folders["v__clip_0002"].offset_s == pytest.approx(6.5, abs=0.05)
+    assert catalog.info("v__clip_0001/frame_000005.jpg").timestamp == pytest.approx(3.0, abs=0.05)
+    # Video-level frame 70 (7.0 s) is frame 5 of the third clip, not of the second.
+    assert catalog.canonical_image("v/frame_000070.jpg") == str(p["frames_root"] / "v__clip_0002/frame_000005.jpg")
+
+    # Uniform splits keep clip number x clip_max_seconds.
+    cfg["video"]["split_fast_copy"] = False
+    p["frames_catalog"].unlink()
+    assert load_catalog(cfg, p).folders["v__clip_0001"].offset_s == 5.0
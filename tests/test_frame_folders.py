@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""Frames folders of one video must never pick up another video's folders."""
+
+from __future__ import annotations
+from pathlib import Path
+
+from scripts.utils.framepack import pack_folder, video_frame_folders
+
+def make_folder(root: Path, name: str) -> Path:
+    d = root / name
+    d.mkdir(parents=True)
+    (d / "frame_000000.jpg").write_bytes(b"jpeg")
+    return d
+
+def test_prefix_video_is_not_matched(tmp_path):
+    make_folder(tmp_path, "a__clip_0000")
+    make_folder(tmp_path, "a__clip_0001")
+    make_folder(tmp_path, "a__b__clip_0000")  # clip of video "a__b"
+    make_folder(tmp_path, "ab__clip_0000")
+    assert [d.name for d in video_frame_folders(tmp_path, "a")] == ["a__clip_0000", "a__clip_0001"]
+    assert [d.name for d in video_frame_folders(tmp_path, "a__b")] == ["a__b__clip_0000"]
+
+def test_glob_characters_in_stem(tmp_path):
+    make_folder(tmp_path, "take[1]__clip_0000")
+    make_folder(tmp_path, "take1__clip_0000")
+    assert [d.name for d in video_frame_folders(tmp_path, "take[1]")] == ["take[1]__clip_0000"]
+
+def test_packed_folders_are_listed(tmp_path):
+    pack_folder(make_folder(tmp_path, "a__clip_0000"))
+    make_folder(tmp_path, "a__b__clip_0000")
+    assert [d.name for d in video_frame_folders(tmp_path, "a")] == ["a__clip_0000"]
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""Frame packs: lossless round-trip, bounded open files, failing pack steps."""
+
+from __future__ import annotations
+import os
+import shutil
+import tarfile
+from pathlib import Path
+
+import pytest
+
+from scripts.utils import framepack
+from scripts.utils.ffmpeg import FFmpegJob, run_job
+from scripts.utils.framepack import (
+    FramePack, folder_frames, frame_file, list_frames, open_pack, pack_folder, pack_path,
+)
+
+def make_folder(root: Path, name: str, frames: int = 3) -> dict:
+    d = root / name
+    d.mkdir(parents=True)
+    data = {f"frame_{i:06d}.jpg": os.urandom(100 + 700 * i) for i in range(frames)}
+    for n, b in data.items():
+        (d / n).write_bytes(b)
+    return data
+
+def open_files() -> int:
+    return len(os.listdir("/proc/self/fd"))
+
+def test_round_trip(tmp_path):
+    data = make_folder(tmp_path, "v__clip_0000")
+    assert pack_folder(tmp_path / "v__clip_0000") == len(data)
+    assert not (tmp_path / "v__clip_0000").exists()
+    with tarfile.open(pack_path(tmp_path / "v__clip_0000")) as tar:  # plain tar for other tools
+        assert sorted(tar.getnames()) == sorted(data)
+    with FramePack(pack_path(tmp_path / "v__clip_0000")) as pack:
+        assert {n: bytes(b) for n, b in pack} == data
+    folder = tmp_path / "v__clip_0000"
+    assert folder_frames(folder) == sorted(data)
+    for name, blob in data.items():
+        assert frame_file(folder / name).read() == blob
+        assert open_pack(folder).extract(name, tmp_path / name) == "unpacked"
+        assert (tmp_path / name).read_bytes() == blob
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="needs /proc")
+def test_open_files_stay_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(framepack, "MAX_MAPPED", 8)
+    monkeypatch.setattr(framepack, "MAX_PACKS", 50)
+    for i in range(300):
+        make_folder(tmp_path, f"v__clip_{i:04d}", frames=1)
+        pack_folder(tmp_path / f"v__clip_{i:04d}")
+    before = open_files()
+    frames = list_frames(tmp_path)
+    assert len(frames) == 300
+    for f in frames:
+        assert len(frame_file(f).read()) == 100
+    assert open_files() - before <= 8
+    assert len(framepack._PACKS) <= 50
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+def test_failing_finalize_fails_only_its_job():
+    def finalize():
+        raise tarfile.TarError("disk full")
+    job = FFmpegJob("pack", ["ffmpeg", "-v", "error", "-f", "lavfi", "-i", "nullsrc=s=16x16",
+                             "-frames:v", "1", "-f", "null", "-"], finalize=finalize)
+    result = run_job(job)
+    assert not result.ok
+    assert "disk full" in result.error
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""Stage byte counters: folders are sized from their files, unmeasured totals stay None."""
+
+from __future__ import annotations
+import json
+
+from scripts.utils import metrics
+from scripts.utils.metrics import StageMetrics, path_bytes
+
+def test_path_bytes_sizes_folders(tmp_path):
+    (tmp_path / "clip" / "sub").mkdir(parents=True)
+    (tmp_path / "clip" / "a.jpg").write_bytes(b"x" * 100)
+    (tmp_path / "clip" / "sub" / "b.jpg").write_bytes(b"x" * 20)
+    assert path_bytes(tmp_path / "clip") == 120
+    assert path_bytes(tmp_path / "clip" / "a.jpg") == 100
+    assert path_bytes(tmp_path / "missing") == 0
+
+def test_unmeasured_bytes_are_none(tmp_path, monkeypatch):
+    (tmp_path / "out.jsonl").write_bytes(b"x" * 10)
+    with StageMetrics("t", tmp_path, quiet=True) as m:
+        assert m.add_written(tmp_path / "out.jsonl") == 10
+        monkeypatch.setattr(metrics, "path_bytes", lambda p: None)
+        assert m.add_written(tmp_path / "out.jsonl") is None
+        monkeypatch.undo()
+        m.add_written(tmp_path / "out.jsonl")  # a later measurement does not revive the total
+    (summary,) = [json.loads(line) for line in m.report.read_text().splitlines()]
+    assert summary["bytes_read"] is None  # nothing reported, not "0 B"
+    assert summary["bytes_written"] is None
+    assert summary["read_mb_per_s"] is None
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""Derived plural folding of the synonym index."""
+
+from __future__ import annotations
+
+from scripts.utils.synonyms import SynonymIndex, build_table
+
+def index(vocab) -> SynonymIndex:
+    return SynonymIndex(build_table(vocab, {}, derive=True), derive=True)
+
+def test_s_plurals_fold_onto_their_own_singular():
+    canonical = index(["cap", "cape"])
+    assert canonical("capes") == "cape"
+    assert canonical("caps") == "cap"
+
+def test_es_only_after_sibilants():
+    canonical = index(["cap", "box", "glass", "bench", "berry"])
+    assert canonical("boxes") == "box"
+    assert canonical("glasses") == "glass"
+    assert canonical("benches") == "bench"
+    assert canonical("berries") == "berry"
+    assert canonical("capes") == "capes"  # not a plural of "cap"; unknown tags stay as they are
+
+def test_plural_of_a_qualified_tag():
+    assert index(["hat_(object)"])("hats") == "hat_(object)"
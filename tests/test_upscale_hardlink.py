@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""Re-encoding onto a hardlinked upscaled clip must not overwrite the source clip."""
+
+from __future__ import annotations
+import importlib
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from scripts.utils.ffmpeg import run_jobs
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+
+upscale = importlib.import_module("scripts.10_upscale_normalize")
+
+def test_reencode_does_not_write_through_hardlink(tmp_path):
+    src = tmp_path / "clips_5s" / "v" / "clip_0000.mp4"
+    src.parent.mkdir(parents=True)
+    subprocess.run(["ffmpeg", "-loglevel", "error", "-y", "-f", "lavfi", "-i", "testsrc=size=64x48:rate=24",
+                    "-t", "1", "-pix_fmt", "yuv420p", str(src)], check=True)
+    before = src.read_bytes()
+    dst = tmp_path / "upscaled" / "v" / "clip_0000.mp4"
+    dst.parent.mkdir(parents=True)
+    os.link(src, dst)  # what a conforming clip got from an earlier run
+
+    job = upscale.upscale_job(src, dst, media=None)  # no probe info -> transcode
+    assert job is not None
+    assert all(r.ok for r in run_jobs([job], max_workers=1, threads=1, tag="test"))
+    assert src.read_bytes() == before
+    assert not os.path.samefile(src, dst)
+    assert dst.stat().st_size > 0
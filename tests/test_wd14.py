@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""WD14 tagger on a tiny synthetic ONNX model: thresholds, top-k, ratings, batched decode order."""
+
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+from PIL import Image
+
+from scripts.utils.wd14 import CAT_RATING, WD14Tagger, load_tags_csv, write_synthetic_model
+
+@pytest.fixture(scope="module")
+def model(tmp_path_factory):
+    return write_synthetic_model(tmp_path_factory.mktemp("wd14"))
+
+def make_tagger(model, **kw) -> WD14Tagger:
+    return WD14Tagger(*model, providers=("CPUExecutionProvider",), **kw)
+
+def test_select_thresholds_per_category(model):
+    tagger = make_tagger(model, threshold_general=0.35, threshold_character=0.6)
+    names, cats = load_tags_csv(model[1])
+    probs = np.zeros((2, len(names)), dtype=np.float32)
+    probs[0, cats == CAT_RATING] = 0.99
+    for name, p in {"character_5": 0.5, "character_10": 0.7, "tag_6": 0.36, "tag_7": 0.34, "tag_8": 0.9}.items():
+        probs[0, names.index(name)] = p
+
+    rows = tagger.select(probs)
+    assert rows[0] == [("tag_8", 0.9), ("character_10", 0.7), ("tag_6", 0.36)]
+    assert rows[1] == []
+
+def test_select_topk_keeps_highest_in_order(model):
+    tagger = make_tagger(model, threshold_general=0.1, topk=3)
+    names, cats = load_tags_csv(model[1])
+    probs = np.linspace(0.2, 0.95, len(names), dtype=np.float32)[None, :]
+    probs[0, cats == CAT_RATING] = 1.0  # ratings never take a top-k slot
+
+    (row,) = tagger.select(probs)
+    expected = [names[i] for i in np.argsort(-probs[0]) if cats[i] != CAT_RATING][:3]
+    assert [t for t, _ in row] == expected
+    assert [s for _, s in row] == sorted((s for _, s in row), reverse=True)
+
+def test_tag_paths_keeps_input_order_with_partial_batch(model, tmp_path):
+    tagger = make_tagger(model, threshold_general=0.2)
+    frames = []
+    for i in range(7):
+        p = tmp_path / f"frame_{i:06d}.jpg"
+        if i == 4:
+            p.write_bytes(b"not a jpeg")
+        else:
+            Image.new("RGB", (40, 24), (36 * i, 255 - 30 * i, 80)).save(p)
+        frames.append(p)
+
+    out = list(tagger.tag_paths(frames, batch_size=3, decode_workers=2, prefetch=1))
+    assert [p for p, _ in out] == frames
+    assert tagger.images == len(frames)
+    for p, tags in out:
+        if p == frames[4]:
+            assert tags == []
+            continue
+        (single,) = tagger.select(tagger.infer(tagger.load_image(p)[None]))
+        assert tags == single
+        assert tags and not any(t in ("general", "sensitive", "questionable", "explicit") for t, _ in tags)